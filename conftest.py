@@ -0,0 +1,2 @@
+# Плагин проекта: бюджеты запросов и кэши в памяти, как в тестовом раннере.
+pytest_plugins = ['core.testing']
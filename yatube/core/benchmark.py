@@ -0,0 +1,243 @@
+"""Замеры представлений тестовым клиентом Django.
+
+Для каждого сценария снимаются задержка (p50/p95/p99), число и время
+SQL-запросов, время рендеринга шаблонов и пиковая память. Отчет - JSON:
+два прогона сравнивает manage.py compare_benchmarks.
+
+Здесь же замеры бэкендов кэша (manage.py benchmark_cache).
+"""
+import contextlib
+import math
+import multiprocessing
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from django.db import connection
+from django.template.base import Template
+
+# Чем больше значение метрики, тем хуже; сравниваются все.
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries', 'sql_ms',
+           'template_ms', 'peak_kb')
+
+
+@dataclass
+class Scenario:
+    """Запрос к представлению: prepare() возвращает (url, data) на прогон.
+
+    Для записи prepare вызывается перед каждым запросом: так можно
+    подготовить новый объект, чтобы запросы не мешали друг другу.
+    """
+    name: str
+    prepare: Callable[[], tuple]
+    method: str = 'get'
+    client: Optional[object] = None
+    expected_status: tuple = (200, 302)
+
+
+@dataclass
+class Sample:
+    latency: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+    sql: list = field(default_factory=list)
+    template: list = field(default_factory=list)
+    peak: int = 0
+
+
+class TemplateTimer:
+    """Время рендеринга шаблонов верхнего уровня.
+
+    Вложенные render() ({% include %}, фрагменты ленты) уже входят во
+    время внешнего шаблона и не складываются повторно.
+    """
+
+    def __init__(self):
+        self.total = 0.0
+        self.depth = 0
+
+    @contextlib.contextmanager
+    def installed(self):
+        original = Template.render
+        timer = self
+
+        def render(template, context):
+            timer.depth += 1
+            started = time.perf_counter()
+            try:
+                return original(template, context)
+            finally:
+                timer.depth -= 1
+                if not timer.depth:
+                    timer.total += time.perf_counter() - started
+
+        Template.render = render
+        try:
+            yield self
+        finally:
+            Template.render = original
+
+
+class QueryTimer:
+    """Число и суммарное время SQL-запросов (через execute_wrapper).
+
+    Время в connection.queries округлено до миллисекунд и для быстрых
+    запросов превращается в ноль, поэтому оно меряется здесь.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.total += time.perf_counter() - started
+            self.count += 1
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _request(scenario, client):
+    url, data = scenario.prepare()
+    response = getattr(client, scenario.method)(url, data or {})
+    if response.status_code not in scenario.expected_status:
+        raise AssertionError(
+            f'{scenario.name}: {url} вернул {response.status_code}')
+    return response
+
+
+def measure(scenario, client=None, repeat=50, warmup=3):
+    """Прогоняет сценарий repeat раз; возвращает сводку метрик."""
+    client = scenario.client or client
+    for _ in range(warmup):
+        _request(scenario, client)
+    sample = Sample()
+    timer = TemplateTimer()
+    with timer.installed():
+        for _ in range(repeat):
+            timer.total = 0.0
+            queries = QueryTimer()
+            with connection.execute_wrapper(queries):
+                started = time.perf_counter()
+                _request(scenario, client)
+                sample.latency.append(time.perf_counter() - started)
+            sample.queries.append(queries.count)
+            sample.sql.append(queries.total)
+            sample.template.append(timer.total)
+    # tracemalloc замедляет все вызовы, поэтому память снимается
+    # отдельным запросом, не влияя на задержку.
+    tracemalloc.start()
+    try:
+        _request(scenario, client)
+        sample.peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return summarize(sample)
+
+
+def summarize(sample):
+    def ms(seconds):
+        return round(seconds * 1000, 3)
+
+    count = len(sample.latency) or 1
+    return {
+        'requests': len(sample.latency),
+        'p50_ms': ms(percentile(sample.latency, 50)),
+        'p95_ms': ms(percentile(sample.latency, 95)),
+        'p99_ms': ms(percentile(sample.latency, 99)),
+        'mean_ms': ms(sum(sample.latency) / count),
+        'queries': max(sample.queries, default=0),
+        'sql_ms': ms(sum(sample.sql) / count),
+        'template_ms': ms(sum(sample.template) / count),
+        'peak_kb': round(sample.peak / 1024, 1),
+    }
+
+
+def compare(base, current, threshold=0.2, min_delta_ms=1.0):
+    """Регрессии current относительно base: список словарей.
+
+    Метрика регрессировала, если выросла больше чем на threshold (доля)
+    и, для времени, больше чем на min_delta_ms - иначе шум на быстрых
+    представлениях дает ложные срабатывания. Число запросов
+    сравнивается точно: любой лишний запрос - регрессия.
+    """
+    regressions = []
+    for scale, views in current.get('results', {}).items():
+        for view, metrics in views.items():
+            before = base.get('results', {}).get(scale, {}).get(view)
+            if before is None:
+                continue
+            for metric in METRICS:
+                old, new = before.get(metric), metrics.get(metric)
+                if old is None or new is None or new <= old:
+                    continue
+                if metric == 'queries':
+                    regressed = True
+                else:
+                    regressed = (new > old * (1 + threshold) and not (
+                        metric.endswith('_ms')
+                        and new - old < min_delta_ms))
+                if regressed:
+                    regressions.append({
+                        'scale': scale, 'view': view, 'metric': metric,
+                        'base': old, 'current': new,
+                        'change': (new - old) / old if old else math.inf,
+                    })
+    return regressions
+
+
+def measure_cache(cache, keys=1000, value_size=1024, batch=20):
+    """Микросекунды на операцию кэша: запись, чтение, пакеты.
+
+    Ключи разные, чтобы замерить сами бэкенды, а не одно горячее
+    значение; MAX_ENTRIES бэкенда должно вмещать их все.
+    """
+    names = [f'bench:{number}' for number in range(keys)]
+    value = 'x' * value_size
+    batches = [names[start:start + batch]
+               for start in range(0, keys, batch)]
+    cache.clear()
+
+    def timed(operation, calls):
+        started = time.perf_counter()
+        operation()
+        return round((time.perf_counter() - started) / calls * 1e6, 2)
+
+    return {
+        'set_us': timed(lambda: [cache.set(name, value)
+                                 for name in names], keys),
+        'get_us': timed(lambda: [cache.get(name) for name in names], keys),
+        'miss_us': timed(lambda: [cache.get(f'{name}:missing')
+                                  for name in names], keys),
+        'set_many_us': timed(lambda: [
+            cache.set_many(dict.fromkeys(names, value))
+            for names in batches], len(batches)),
+        'get_many_us': timed(lambda: [cache.get_many(names)
+                                      for names in batches], len(batches)),
+    }
+
+
+def _fill(cache, names):
+    for name in names:
+        cache.set(name, name)
+
+
+def shared_hit_rate(cache, keys=100):
+    """Доля ключей, записанных другим процессом, которые видны этому."""
+    names = [f'shared:{number}' for number in range(keys)]
+    cache.clear()
+    process = multiprocessing.get_context('fork').Process(
+        target=_fill, args=(cache, names))
+    process.start()
+    process.join()
+    return len(cache.get_many(names)) / keys
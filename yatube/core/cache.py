@@ -0,0 +1,647 @@
+"""Общий кэш процессов одного хоста в файле, отображенном в память.
+
+Кэш в LocMemCache у каждого процесса свой: фрагменты считаются заново
+в каждом процессе, а сброс поколения в одном не виден остальным.
+SharedMemoryCache хранит записи в одном файле (лучше - на tmpfs,
+например /dev/shm), который все процессы отображают через mmap.
+
+Устройство файла: заголовок, индекс и кольцевой журнал значений.
+
+* Журнал размером MAX_BYTES пишется по кругу; позиции в нем логические
+  (растут без переполнения), поэтому запись жива, пока голова журнала
+  ушла от нее не дальше чем на размер журнала. Новые записи вытесняют
+  самые старые - это и есть ограничение по байтам.
+* Индекс - корзины по WAYS ячеек (хеш ключа, позиция, длина, срок).
+  Число корзин - MAX_ENTRIES / WAYS; в полной корзине место уступает
+  самая старая запись.
+
+Значение сначала пишется в журнал и лишь затем публикуется в ячейке
+индекса, а все операции идут под блокировкой flock: запись -
+под исключительной, чтение - под разделяемой, поэтому читатели разных
+процессов не ждут друг друга и не видят недописанных значений, а
+set_many, incr и add атомарны для всех процессов, так что новые
+поколения областей (posts.cache) появляются разом. Блокировка -
+отдельный файл LOCATION.lock: сам файл кэша при смене размеров
+заменяется новым. Под блокировкой процесс сверяет inode файла со своим
+отображением и, если файл заменили или удалили, переходит на новый
+того же устройства; процессы с другими размерами дорабатывают со своей
+копией, не падая с SIGBUS. Оба файла доступны только владельцу (0600).
+
+TwoTierCache - обертка с LRU процесса (L1) перед любым кэшем (L2).
+"""
+import contextlib
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+MAGIC = b'yatube1\0'
+WAYS = 8
+# magic, голова журнала, размер журнала, число корзин, ячеек в корзине.
+HEADER = struct.Struct('<8sQQII')
+HEAD = struct.Struct('<Q')
+# Хеш ключа (0 - пустая ячейка), позиция, длина, срок (0 - бессрочно).
+SLOT = struct.Struct('<QQId')
+KEY_LENGTH = struct.Struct('<H')
+EMPTY_SLOT = SLOT.pack(0, 0, 0, 0.0)
+
+
+def key_hash(key):
+    digest = hashlib.blake2b(key, digest_size=8).digest()
+    return int.from_bytes(digest, 'little') | 1
+
+
+class SharedMemoryCache(BaseCache):
+    """Кэш в файле LOCATION, общий для всех процессов хоста.
+
+    OPTIONS: MAX_BYTES - размер журнала значений (64 МБ), MAX_ENTRIES -
+    емкость индекса. Вытеснение по времени записи (FIFO), а не по
+    последнему чтению: чтение ничего не пишет в общий файл.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', params.get('options', {}))
+        self._path = location
+        self._capacity = int(options.get('MAX_BYTES', 64 * 2 ** 20))
+        self._buckets = max(1, -(-self._max_entries // WAYS))
+        self._arena = HEADER.size + self._buckets * WAYS * SLOT.size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._map = None
+        self._inode = None
+        self._lock_fd = None
+
+    # Файл и блокировка
+
+    def _layout(self):
+        return HEADER.pack(MAGIC, 0, self._capacity, self._buckets, WAYS)
+
+    def _open(self):
+        # После fork унаследованный дескриптор делит flock с родителем,
+        # поэтому у каждого процесса свои дескрипторы и отображение.
+        if self._map is not None:
+            self._map.close()
+            os.close(self._lock_fd)
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock_fd = os.open(f'{self._path}.lock',
+                                os.O_RDWR | os.O_CREAT, 0o600)
+        size = self._arena + self._capacity
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            if not self._compatible(size):
+                self._create(size)
+            self._map_file(size)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        self._pid = os.getpid()
+
+    def _create(self, size):
+        temporary = f'{self._path}.{os.getpid()}.tmp'
+        fd = os.open(temporary, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, 'wb') as new:
+            new.truncate(size)
+            new.write(self._layout())
+        os.replace(temporary, self._path)
+
+    def _map_file(self, size):
+        fd = os.open(self._path, os.O_RDWR)
+        try:
+            self._inode = os.fstat(fd).st_ino
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def _compatible(self, size):
+        try:
+            with open(self._path, 'rb') as current:
+                header = current.read(HEADER.size)
+                current.seek(0, os.SEEK_END)
+                actual = current.tell()
+        except FileNotFoundError:
+            return False
+        expected = self._layout()
+        return (actual == size and header[:8] == expected[:8]
+                and header[16:] == expected[16:])
+
+    def _follow(self, shared):
+        """Переходит на новый файл кэша, если текущий заменили или удалили.
+
+        Вызывается под блокировкой. Файл с другим устройством (его завел
+        процесс с другими OPTIONS) не трогается: процесс дорабатывает со
+        своей копией.
+        """
+        try:
+            inode = os.stat(self._path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if inode == self._inode:
+            return
+        size = self._arena + self._capacity
+        if shared:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            if not self._compatible(size):
+                try:
+                    self._inode = os.stat(self._path).st_ino
+                    return
+                except FileNotFoundError:
+                    self._create(size)
+            self._map.close()
+            self._map_file(size)
+        finally:
+            if shared:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_SH)
+
+    @contextlib.contextmanager
+    def _locked(self, shared=False):
+        # Потоки процесса делят дескриптор, и flock их не разделяет:
+        # между ними - self._lock.
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            fcntl.flock(self._lock_fd,
+                        fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                self._follow(shared)
+                yield self._map
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    # Записи (вызываются под блокировкой)
+
+    def _slots(self, hashed):
+        first = HEADER.size + hashed % self._buckets * WAYS * SLOT.size
+        return range(first, first + WAYS * SLOT.size, SLOT.size)
+
+    def _head(self, memory):
+        return HEAD.unpack_from(memory, 8)[0]
+
+    def _find(self, memory, key, hashed, now):
+        """Смещение ячейки и ее поля для живой записи key или None."""
+        head = self._head(memory)
+        for offset in self._slots(hashed):
+            slot_hash, position, length, expires = SLOT.unpack_from(
+                memory, offset)
+            if slot_hash != hashed or position + self._capacity < head:
+                continue
+            start = self._arena + position % self._capacity
+            size = KEY_LENGTH.unpack_from(memory, start)[0]
+            if memory[start + 2:start + 2 + size] != key:
+                continue
+            if expires and expires <= now:
+                return None
+            return offset, start + 2 + size, start + length, expires
+        return None
+
+    def _read(self, memory, key, now):
+        found = self._find(memory, key, key_hash(key), now)
+        if found is None:
+            return None
+        _offset, start, stop, _expires = found
+        return memory[start:stop]
+
+    def _write(self, memory, key, data, expires):
+        """Дописывает запись в журнал и публикует ее в индексе."""
+        hashed = key_hash(key)
+        size = KEY_LENGTH.size + len(key) + len(data)
+        if size > self._capacity or len(key) > 0xFFFF:
+            self._remove(memory, key, hashed)
+            return False
+        position = self._head(memory)
+        start = position % self._capacity
+        if start + size > self._capacity:
+            # Запись не переходит через конец журнала.
+            position += self._capacity - start
+            start = 0
+        start += self._arena
+        memory[start:start + size] = KEY_LENGTH.pack(len(key)) + key + data
+        head = position + size
+        HEAD.pack_into(memory, 8, head)
+        now = time.time()
+        chosen, oldest = None, None
+        for offset in self._slots(hashed):
+            slot_hash, slot_position, _length, slot_expires = (
+                SLOT.unpack_from(memory, offset))
+            if slot_hash == hashed:
+                chosen = offset
+                break
+            free = (not slot_hash
+                    or slot_position + self._capacity < head
+                    or 0 < slot_expires <= now)
+            if free and chosen is None:
+                chosen = offset
+            if oldest is None or slot_position < oldest[1]:
+                oldest = offset, slot_position
+        if chosen is None:
+            chosen = oldest[0]
+        SLOT.pack_into(memory, chosen, hashed, position, size,
+                       expires or 0.0)
+        return True
+
+    def _remove(self, memory, key, hashed):
+        found = self._find(memory, key, hashed, 0)
+        if found is not None:
+            memory[found[0]:found[0] + SLOT.size] = EMPTY_SLOT
+        return found is not None
+
+    # API кэша Django
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key.encode()
+
+    def _dump(self, value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _expires(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        with self._locked(shared=True) as memory:
+            data = self._read(memory, key, time.time())
+        return default if data is None else pickle.loads(data)
+
+    def get_many(self, keys, version=None):
+        names = {self._key(key, version): key for key in keys}
+        found = {}
+        with self._locked(shared=True) as memory:
+            now = time.time()
+            for name, key in names.items():
+                data = self._read(memory, name, now)
+                if data is not None:
+                    found[key] = data
+        return {key: pickle.loads(data) for key, data in found.items()}
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        with self._locked(shared=True) as memory:
+            return self._find(memory, key, key_hash(key),
+                              time.time()) is not None
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        data, expires = self._dump(value), self._expires(timeout)
+        with self._locked() as memory:
+            self._write(memory, key, data, expires)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self._expires(timeout)
+        items = [(key, self._key(key, version), self._dump(value))
+                 for key, value in data.items()]
+        failed = []
+        with self._locked() as memory:
+            for key, name, value in items:
+                if not self._write(memory, name, value, expires):
+                    failed.append(key)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        data, expires = self._dump(value), self._expires(timeout)
+        with self._locked() as memory:
+            if self._find(memory, key, key_hash(key),
+                          time.time()) is not None:
+                return False
+            return self._write(memory, key, data, expires)
+
+    def incr(self, key, delta=1, version=None):
+        name = self._key(key, version)
+        with self._locked() as memory:
+            found = self._find(memory, name, key_hash(name), time.time())
+            if found is None:
+                raise ValueError(f"Key '{key}' not found")
+            _offset, start, stop, expires = found
+            value = pickle.loads(memory[start:stop]) + delta
+            self._write(memory, name, self._dump(value), expires)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        hashed = key_hash(key)
+        with self._locked() as memory:
+            found = self._find(memory, key, hashed, time.time())
+            if found is None:
+                return False
+            offset = found[0]
+            _hash, position, length, _expires = SLOT.unpack_from(
+                memory, offset)
+            SLOT.pack_into(memory, offset, hashed, position, length,
+                           self._expires(timeout) or 0.0)
+            return True
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        with self._locked() as memory:
+            return self._remove(memory, key, key_hash(key))
+
+    def delete_many(self, keys, version=None):
+        names = [self._key(key, version) for key in keys]
+        with self._locked() as memory:
+            for name in names:
+                self._remove(memory, name, key_hash(name))
+
+    def clear(self):
+        with self._locked() as memory:
+            memory[HEADER.size:self._arena] = bytes(
+                self._arena - HEADER.size)
+
+
+GENERATION_KEY = 'l1:generation'
+STATS_KEY = 'l1:stats:{}'
+STATS = ('l1_hit', 'l1_miss', 'l2_hit', 'l2_miss')
+# Как часто процесс сбрасывает свои счетчики попаданий в L2, секунды.
+STATS_INTERVAL = 1.0
+MISSING = object()
+
+
+class LocalTier:
+    """LRU процесса со сроком жизни записей; общий для всех потоков.
+
+    Значения хранятся сериализованными, как в LocMemCache: объект из
+    кэша можно менять, не портя закэшированную копию.
+    """
+
+    def __init__(self, size, max_bytes):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = None
+        self.synced = 0.0
+        self.flushed = time.monotonic()
+        self.counts = Counter()
+
+    def get(self, name, now):
+        with self.lock:
+            item = self.data.get(name)
+            if item is None:
+                return None
+            expires, data, _volatile = item
+            if expires <= now:
+                self._pop(name)
+                return None
+            self.data.move_to_end(name)
+            return data
+
+    def put(self, name, data, expires, volatile):
+        if len(data) > self.max_bytes:
+            self.discard(name)
+            return
+        with self.lock:
+            self._pop(name)
+            self.data[name] = expires, data, volatile
+            self.bytes += len(data)
+            while len(self.data) > self.size or self.bytes > self.max_bytes:
+                self._pop(next(iter(self.data)))
+
+    def _pop(self, name):
+        item = self.data.pop(name, None)
+        if item is not None:
+            self.bytes -= len(item[1])
+
+    def discard(self, *names):
+        with self.lock:
+            for name in names:
+                self._pop(name)
+
+    def drop_volatile(self):
+        with self.lock:
+            for name in [name for name, (_expires, _data, volatile)
+                         in self.data.items() if volatile]:
+                self._pop(name)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.bytes = 0
+
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class TwoTierCache(BaseCache):
+    """LRU процесса (L1) перед кэшем с псевдонимом LOCATION (L2).
+
+    Горячие ключи читаются из L1 без обращения к L2. Запись идет в оба
+    уровня; чужие записи этот процесс увидит не позже чем через
+    L1_TIMEOUT секунд. Для ключей с префиксами VOLATILE_PREFIXES
+    (поколения областей, posts.cache) этого мало: их запись
+    увеличивает счетчик поколений в L2, и каждый процесс, заметив это
+    (не реже раза в SYNC_INTERVAL), выбрасывает такие ключи из L1.
+
+    OPTIONS: MAX_ENTRIES и L1_MAX_BYTES - размер L1 в записях и байтах,
+    L1_TIMEOUT, SYNC_INTERVAL, VOLATILE_PREFIXES. Попадания по уровням
+    всех процессов - tier_stats().
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', params.get('options', {}))
+        self._l2_alias = location
+        self._l1_timeout = float(options.get('L1_TIMEOUT', 1.0))
+        self._sync_interval = float(options.get('SYNC_INTERVAL', 0.1))
+        self._volatile = tuple(options.get('VOLATILE_PREFIXES', ()))
+        with _tiers_lock:
+            self._tier = _tiers.setdefault(location, LocalTier(
+                self._max_entries,
+                int(options.get('L1_MAX_BYTES', 8 * 2 ** 20))))
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    # Согласование с другими процессами
+
+    def _sync(self, now):
+        tier = self._tier
+        if now - tier.synced < self._sync_interval:
+            return
+        tier.synced = now
+        generation = self.l2.get(GENERATION_KEY)
+        if generation != tier.generation:
+            tier.drop_volatile()
+            tier.generation = generation
+        if now - tier.flushed >= STATS_INTERVAL:
+            self._flush_stats(now)
+
+    def _flush_stats(self, now):
+        tier = self._tier
+        with tier.lock:
+            counts, tier.counts = tier.counts, Counter()
+            tier.flushed = now
+        for name, count in counts.items():
+            key = STATS_KEY.format(name)
+            self.l2.add(key, 0, None)
+            try:
+                self.l2.incr(key, count)
+            except ValueError:
+                pass
+
+    def _bump_generation(self):
+        self.l2.add(GENERATION_KEY, 0, None)
+        try:
+            generation = self.l2.incr(GENERATION_KEY)
+        except ValueError:
+            return
+        tier = self._tier
+        # Если между синхронизациями поколение сменил только этот
+        # процесс, его L1 уже актуален.
+        if (tier.generation is not None
+                and generation == tier.generation + 1):
+            tier.generation = generation
+
+    def _count(self, name, count=1):
+        if count:
+            self._tier.counts[name] += count
+
+    def tier_stats(self):
+        """Попадания и промахи L1 и L2 всех процессов и доли попаданий."""
+        self._flush_stats(time.monotonic())
+        values = self.l2.get_many([STATS_KEY.format(name) for name in STATS])
+        stats = {name: values.get(STATS_KEY.format(name), 0)
+                 for name in STATS}
+        for tier in ('l1', 'l2'):
+            total = stats[f'{tier}_hit'] + stats[f'{tier}_miss']
+            stats[f'{tier}_hit_rate'] = (
+                stats[f'{tier}_hit'] / total if total else 0.0)
+        return stats
+
+    # Запись в L1
+
+    def _name(self, key, version):
+        name = self.make_key(key, version=version)
+        self.validate_key(name)
+        return name
+
+    def _is_volatile(self, key):
+        return key.startswith(self._volatile) if self._volatile else False
+
+    def _remember(self, key, name, value, timeout=DEFAULT_TIMEOUT):
+        now = time.monotonic()
+        expires = now + self._l1_timeout
+        backend = self.l2.get_backend_timeout(timeout)
+        if backend is not None:
+            expires = min(expires, now + backend - time.time())
+        if expires <= now:
+            self._tier.discard(name)
+            return
+        self._tier.put(name, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                       expires, self._is_volatile(key))
+
+    def _written(self, keys):
+        if any(self._is_volatile(key) for key in keys):
+            self._bump_generation()
+
+    # API кэша Django
+
+    def get(self, key, default=None, version=None):
+        now = time.monotonic()
+        self._sync(now)
+        name = self._name(key, version)
+        data = self._tier.get(name, now)
+        if data is not None:
+            self._count('l1_hit')
+            return pickle.loads(data)
+        self._count('l1_miss')
+        value = self.l2.get(key, MISSING, version=version)
+        if value is MISSING:
+            self._count('l2_miss')
+            return default
+        self._count('l2_hit')
+        self._remember(key, name, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        now = time.monotonic()
+        self._sync(now)
+        found, missing = {}, {}
+        for key in keys:
+            name = self._name(key, version)
+            data = self._tier.get(name, now)
+            if data is None:
+                missing[key] = name
+            else:
+                found[key] = pickle.loads(data)
+        self._count('l1_hit', len(found))
+        self._count('l1_miss', len(missing))
+        if missing:
+            values = self.l2.get_many(list(missing), version=version)
+            self._count('l2_hit', len(values))
+            self._count('l2_miss', len(missing) - len(values))
+            for key, value in values.items():
+                self._remember(key, missing[key], value)
+            found.update(values)
+        return found
+
+    def has_key(self, key, version=None):
+        if self._tier.get(self._name(key, version),
+                          time.monotonic()) is not None:
+            return True
+        return self.l2.has_key(key, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version=version)
+        self._remember(key, self._name(key, version), value, timeout)
+        self._written([key])
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version=version) or []
+        for key, value in data.items():
+            name = self._name(key, version)
+            if key in failed:
+                self._tier.discard(name)
+            else:
+                self._remember(key, name, value, timeout)
+        self._written(data)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        name = self._name(key, version)
+        if not self.l2.add(key, value, timeout, version=version):
+            # Значение уже есть, но какое - знает только L2.
+            self._tier.discard(name)
+            return False
+        self._remember(key, name, value, timeout)
+        self._written([key])
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        self._tier.discard(self._name(key, version))
+        value = self.l2.incr(key, delta, version=version)
+        self._written([key])
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._tier.discard(self._name(key, version))
+        return self.l2.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._tier.discard(self._name(key, version))
+        result = self.l2.delete(key, version=version)
+        self._written([key])
+        return result
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self._tier.discard(*(self._name(key, version) for key in keys))
+        self.l2.delete_many(keys, version=version)
+        self._written(keys)
+
+    def clear(self):
+        self._tier.clear()
+        self.l2.clear()
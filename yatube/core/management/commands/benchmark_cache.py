@@ -0,0 +1,38 @@
+import tempfile
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.benchmark import measure_cache, shared_hit_rate
+from core.cache import SharedMemoryCache
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает SharedMemoryCache с LocMemCache и файловым кэшем: '
+            'время операций и видимость записей между процессами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', type=int, default=2000)
+        parser.add_argument('--value-size', type=int, default=1024,
+                            help='Размер значения, байт.')
+
+    def handle(self, *args, **options):
+        keys = options['keys']
+        params = {'OPTIONS': {'MAX_ENTRIES': keys * 4}}
+        with tempfile.TemporaryDirectory() as directory:
+            backends = {
+                'locmem': LocMemCache('benchmark', params),
+                'file': FileBasedCache(f'{directory}/file', params),
+                'shared': SharedMemoryCache(f'{directory}/shared', params),
+            }
+            columns = None
+            for name, cache in backends.items():
+                row = measure_cache(cache, keys, options['value_size'])
+                row['shared_hits'] = f'{shared_hit_rate(cache):.0%}'
+                if columns is None:
+                    columns = list(row)
+                    self.stdout.write(' '.join(
+                        f'{column:>12}' for column in ['backend'] + columns))
+                self.stdout.write(' '.join(
+                    f'{value:>12}' for value in [name] + list(row.values())))
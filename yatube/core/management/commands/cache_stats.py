@@ -0,0 +1,17 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ('Показывает попадания в L1 процессов и в общий L2 '
+            '(core.cache.TwoTierCache).')
+
+    def handle(self, *args, **options):
+        if not hasattr(cache, 'tier_stats'):
+            raise CommandError('Кэш по умолчанию - не TwoTierCache.')
+        stats = cache.tier_stats()
+        for tier in ('l1', 'l2'):
+            self.stdout.write(
+                f'{tier.upper()}: попаданий {stats[f"{tier}_hit"]}, '
+                f'промахов {stats[f"{tier}_miss"]}, '
+                f'доля попаданий {stats[f"{tier}_hit_rate"]:.0%}')
@@ -0,0 +1,28 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.profiling import merge, SUFFIX, write_collapsed
+
+
+class Command(BaseCommand):
+    help = ('Объединяет стеки профилировщика всех процессов: по файлу '
+            'collapsed stacks на представление (для flamegraph.pl).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Каталог для файлов.')
+        parser.add_argument(
+            '--source', default=settings.PROFILE_DIR,
+            help='Каталог со стеками процессов (PROFILE_DIR).')
+
+    def handle(self, *args, **options):
+        views = merge(options['source'])
+        os.makedirs(options['output'], exist_ok=True)
+        for view, stacks in sorted(views.items()):
+            path = os.path.join(options['output'], f'{view}{SUFFIX}')
+            with open(path, 'w') as output:
+                write_collapsed(output, stacks)
+            self.stdout.write(f'{path}: {sum(stacks.values())} снимков')
+        if not views:
+            self.stdout.write('Стеков нет.')
@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import compare
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает два отчета benchmark_views и завершается с '
+            'ошибкой, если метрики ухудшились больше порога.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('base', help='Отчет до изменения.')
+        parser.add_argument('current', help='Отчет после изменения.')
+        parser.add_argument(
+            '--threshold', type=float, default=20,
+            help='Допустимый рост метрики, в процентах.')
+        parser.add_argument(
+            '--min-delta-ms', type=float, default=1.0,
+            help='Меньший рост времени считается шумом.')
+
+    def handle(self, *args, **options):
+        reports = []
+        for path in (options['base'], options['current']):
+            try:
+                with open(path) as report:
+                    reports.append(json.load(report))
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'{path}: {exc}')
+        regressions = compare(*reports, threshold=options['threshold'] / 100,
+                              min_delta_ms=options['min_delta_ms'])
+        for row in regressions:
+            self.stdout.write(
+                f'{row["scale"]:>8} {row["view"]:<18} {row["metric"]:<12} '
+                f'{row["base"]} -> {row["current"]} '
+                f'(+{row["change"]:.0%})')
+        if regressions:
+            raise CommandError(f'Регрессий: {len(regressions)}.')
+        self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
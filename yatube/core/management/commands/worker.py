@@ -0,0 +1,63 @@
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.tasks import claim, execute, finish, release_stale
+
+
+class Command(BaseCommand):
+    help = ('Выполняет задачи из очереди core.Task в пуле процессов: '
+            'с повторами, приоритетами и дедупликацией.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=settings.TASK_WORKERS,
+            help='Число процессов пула.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и завершиться.')
+
+    def handle(self, *args, **options):
+        worker_id = uuid.uuid4().hex
+        processes = options['processes']
+        pool = None
+        try:
+            while True:
+                release_stale()
+                tasks = claim(processes * 2, worker_id)
+                if not tasks:
+                    if options['once']:
+                        return
+                    time.sleep(settings.TASK_POLL_INTERVAL)
+                    continue
+                # Пул создается форком: открытое соединение с БД
+                # наследовать нельзя.
+                connections.close_all()
+                if pool is None:
+                    pool = ProcessPoolExecutor(
+                        processes, multiprocessing.get_context('fork'))
+                futures = {pool.submit(execute, task.name, task.payload): task
+                           for task in tasks}
+                wait(futures)
+                for future, task in futures.items():
+                    try:
+                        error = future.result()
+                    except BrokenProcessPool as exc:
+                        error = f'worker process died: {exc}'
+                        # Сломанный пул не принимает задачи: следующая
+                        # пачка создаст новый.
+                        if pool is not None:
+                            pool.shutdown(wait=False)
+                            pool = None
+                    finish(task, error)
+                    self.stdout.write(
+                        f'{task.name}: {"ошибка" if error else "готово"}')
+        finally:
+            if pool is not None:
+                pool.shutdown()
@@ -0,0 +1,133 @@
+import json
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from . import profiling, timing
+
+logger = logging.getLogger(__name__)
+timing_logger = logging.getLogger('core.timing')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Представление выполнило больше запросов, чем ему разрешено."""
+
+
+class QueryRecorder:
+    """execute_wrapper, который запоминает SQL запросов запроса."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMiddleware:
+    """Проверяет число SQL-запросов представления по QUERY_BUDGETS.
+
+    QUERY_BUDGETS - словарь {'имя:url': наибольшее число запросов};
+    считаются все запросы обработки, включая сессию и пользователя.
+    Превышение пишется в лог с самыми частыми запросами (так видно
+    N+1), а при QUERY_BUDGET_RAISE - еще и роняет запрос. Подключается
+    только при DEBUG, а в тестах - раннером и плагином pytest из
+    core.testing, которые включают и QUERY_BUDGET_RAISE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return response
+        budget = settings.QUERY_BUDGETS.get(match.view_name)
+        if budget is None or len(recorder.statements) <= budget:
+            return response
+        message = over_budget_message(
+            match.view_name, request.get_full_path(), budget,
+            recorder.statements)
+        logger.error(message)
+        if settings.QUERY_BUDGET_RAISE:
+            raise QueryBudgetExceeded(message)
+        return response
+
+
+def over_budget_message(view_name, path, budget, statements):
+    repeated = Counter(statements).most_common(3)
+    lines = [f'{view_name} ({path}): {len(statements)} SQL-запросов '
+             f'при бюджете {budget}. Чаще всего:']
+    lines += [f'  {count} × {sql[:300]}' for sql, count in repeated]
+    return '\n'.join(lines)
+
+
+class ServerTimingMiddleware:
+    """Время SQL, шаблонов, кэша и миниатюр в заголовке Server-Timing.
+
+    Те же метрики пишутся одной JSON-строкой в логгер core.timing
+    (уровень INFO). Стоит в начале MIDDLEWARE, чтобы total включал
+    остальные middleware; выключается настройкой SERVER_TIMING.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        current, token = timing.start()
+        try:
+            with connection.execute_wrapper(current):
+                response = self.get_response(request)
+        finally:
+            timing.stop(token)
+        response['Server-Timing'] = current.header()
+        if timing_logger.isEnabledFor(logging.INFO):
+            match = getattr(request, 'resolver_match', None)
+            record = {
+                'view': match.view_name if match else None,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                **current.summary(),
+            }
+            timing_logger.info(json.dumps(record, ensure_ascii=False))
+        return response
+
+
+class SamplingProfilerMiddleware:
+    """Снимает стеки части запросов сэмплирующим профилировщиком.
+
+    Профилируется доля PROFILE_SAMPLE_RATE запросов и, при
+    PROFILE_STAFF, все запросы персонала; стоит после
+    AuthenticationMiddleware. Если оба выключены, middleware не
+    подключается. Стеки доступны только персоналу (core:profiles).
+    """
+
+    def __init__(self, get_response):
+        if not (settings.PROFILE_SAMPLE_RATE or settings.PROFILE_STAFF):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling.wanted(request):
+            return self.get_response(request)
+        sampler = profiling.sampler()
+        ident = threading.get_ident()
+        stacks = sampler.start_sampling(ident)
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop_sampling(ident)
+        match = getattr(request, 'resolver_match', None)
+        profiling.store.add(match.view_name if match else None, stacks)
+        profiling.store.maybe_flush()
+        return response
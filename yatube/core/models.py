@@ -0,0 +1,88 @@
+from django.db import models
+from django.db.models import Q
+
+
+class Task(models.Model):
+    """Отложенная работа в очереди на БД (см. core.tasks)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(
+        verbose_name='Задача',
+        max_length=200
+    )
+    # Аргументы в JSON: в Django 2.2 нет JSONField для SQLite.
+    payload = models.TextField(
+        verbose_name='Аргументы',
+        default='{}'
+    )
+    state = models.CharField(
+        verbose_name='Состояние',
+        max_length=10,
+        choices=STATES,
+        default=QUEUED
+    )
+    priority = models.SmallIntegerField(
+        verbose_name='Приоритет',
+        default=0
+    )
+    dedup_key = models.CharField(
+        verbose_name='Ключ дедупликации',
+        max_length=200,
+        blank=True,
+        null=True
+    )
+    run_at = models.DateTimeField(
+        verbose_name='Выполнить после'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name='Попыток',
+        default=0
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        verbose_name='Предел попыток',
+        default=1
+    )
+    locked_by = models.CharField(
+        verbose_name='Обработчик',
+        max_length=64,
+        blank=True
+    )
+    locked_at = models.DateTimeField(
+        verbose_name='Взята в работу',
+        blank=True,
+        null=True
+    )
+    last_error = models.TextField(
+        verbose_name='Последняя ошибка',
+        blank=True
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата постановки',
+        auto_now_add=True
+    )
+
+    class Meta:
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        # Индекс повторяет выборку обработчика: очередь по приоритету.
+        indexes = [
+            models.Index(fields=['state', '-priority', 'run_at'],
+                         name='task_queue_idx'),
+        ]
+        # В очереди не бывает двух задач с одним ключом.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedup_key'],
+                condition=Q(state='queued'),
+                name='unique_queued_task'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.name} ({self.state})'
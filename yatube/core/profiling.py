@@ -0,0 +1,170 @@
+"""Сэмплирующий профилировщик запросов для боевых процессов.
+
+Фоновый поток раз в PROFILE_INTERVAL снимает стеки потоков, чьи
+запросы профилируются (sys._current_frames), и считает одинаковые
+стеки. Пока таких запросов нет, поток спит на событии и не тратит
+процессор. Стеки копятся по именам представлений и сбрасываются на диск
+в формате collapsed stacks ("a;b;c 12"), который читают flamegraph.pl
+и speedscope: по файлу на представление и процесс. Файлы процессов
+объединяет manage.py collapse_profiles.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, OrderedDict
+
+from django.conf import settings
+
+SUFFIX = '.folded'
+
+
+def collapse(frame):
+    """Стек от корня к frame: 'модуль:функция;...'."""
+    names = []
+    while frame is not None:
+        names.append(
+            f'{frame.f_globals.get("__name__", "?")}:{frame.f_code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler(threading.Thread):
+    """Поток, снимающий стеки зарегистрированных потоков."""
+
+    def __init__(self, interval):
+        super().__init__(name='sampling-profiler', daemon=True)
+        self.interval = interval
+        self.targets = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+
+    def start_sampling(self, ident):
+        """Начинает снимать стеки потока ident; возвращает их счетчик."""
+        stacks = Counter()
+        with self.lock:
+            self.targets[ident] = stacks
+        self.wake.set()
+        return stacks
+
+    def stop_sampling(self, ident):
+        with self.lock:
+            self.targets.pop(ident, None)
+            if not self.targets:
+                self.wake.clear()
+
+    def run(self):
+        while True:
+            self.wake.wait()
+            time.sleep(self.interval)
+            with self.lock:
+                targets = list(self.targets.items())
+            frames = sys._current_frames()
+            samples = []
+            for ident, stacks in targets:
+                frame = frames.get(ident)
+                if frame is not None:
+                    samples.append((ident, stacks, collapse(frame)))
+            del frames
+            # Счет - под блокировкой и только у еще профилируемых потоков:
+            # после stop_sampling счетчик запроса больше не меняется.
+            with self.lock:
+                for ident, stacks, stack in samples:
+                    if self.targets.get(ident) is stacks:
+                        stacks[stack] += 1
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def sampler():
+    """Поток-сэмплер процесса; после fork создается заново."""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None or not _sampler.is_alive():
+            _sampler = Sampler(settings.PROFILE_INTERVAL)
+            _sampler.start()
+        return _sampler
+
+
+def wanted(request):
+    """Профилировать ли запрос: доля PROFILE_SAMPLE_RATE и персонал."""
+    if settings.PROFILE_STAFF and request.user.is_staff:
+        return True
+    return random.random() < settings.PROFILE_SAMPLE_RATE
+
+
+def file_name(view_name, pid):
+    view = (view_name or 'unresolved').replace(':', '.')
+    return f'{view}.{pid}{SUFFIX}'
+
+
+class ProfileStore:
+    """Стеки и число запросов по представлениям в памяти процесса.
+
+    Файл процесса перезаписывается целиком накопленными стеками, но не
+    чаще раза в PROFILE_FLUSH_INTERVAL секунд. У представления хранится
+    не больше PROFILE_MAX_STACKS стеков: лишние вытесняются, начиная с
+    тех, что дольше всех не встречались.
+    """
+
+    def __init__(self):
+        self.stacks = defaultdict(OrderedDict)
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self.flushed = time.monotonic()
+
+    def add(self, view_name, stacks):
+        with self.lock:
+            kept = self.stacks[view_name]
+            for stack, count in stacks.items():
+                kept[stack] = kept.pop(stack, 0) + count
+            while len(kept) > settings.PROFILE_MAX_STACKS:
+                kept.popitem(last=False)
+            self.requests[view_name] += 1
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flushed >= settings.PROFILE_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self, directory=None):
+        directory = directory or settings.PROFILE_DIR
+        with self.lock:
+            self.flushed = time.monotonic()
+            views = {view: Counter(stacks)
+                     for view, stacks in self.stacks.items()}
+        os.makedirs(directory, exist_ok=True)
+        pid = os.getpid()
+        for view_name, stacks in views.items():
+            path = os.path.join(directory, file_name(view_name, pid))
+            with open(f'{path}.tmp', 'w') as output:
+                write_collapsed(output, stacks)
+            os.replace(f'{path}.tmp', path)
+
+
+store = ProfileStore()
+
+
+def write_collapsed(output, stacks):
+    for stack, count in sorted(stacks.items()):
+        output.write(f'{stack} {count}\n')
+
+
+def merge(directory=None):
+    """Стеки всех процессов из directory: {файл представления: Counter}."""
+    directory = directory or settings.PROFILE_DIR
+    views = defaultdict(Counter)
+    if not os.path.isdir(directory):
+        return views
+    for name in os.listdir(directory):
+        if not name.endswith(SUFFIX):
+            continue
+        view, _pid, _suffix = name.rsplit('.', 2)
+        with open(os.path.join(directory, name)) as source:
+            for line in source:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    views[view][stack] += int(count)
+    return views
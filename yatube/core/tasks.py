@@ -0,0 +1,123 @@
+"""Очередь фоновых задач на БД, без внешнего брокера.
+
+Задача - функция с декоратором @task; вызов func.defer(...) записывает
+ее в таблицу Task в той же транзакции, что и данные запроса: при откате
+пропадет и задача. Выполняет очередь manage.py worker.
+"""
+import functools
+import json
+import logging
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+
+def task(priority=0, max_attempts=None, dedup_key=None):
+    """Делает функцию задачей: появляется метод defer(*args, **kwargs).
+
+    dedup_key - функция от аргументов задачи, возвращающая ключ: пока в
+    очереди ждет задача с тем же ключом, новая не добавляется.
+    Аргументы должны сериализоваться в JSON.
+    """
+    def decorator(func):
+        name = f'{func.__module__}.{func.__qualname__}'
+
+        @functools.wraps(func)
+        def defer(*args, **kwargs):
+            key = dedup_key(*args, **kwargs) if dedup_key else None
+            return enqueue(
+                name, args, kwargs, priority=priority, dedup_key=key,
+                max_attempts=max_attempts or settings.TASK_MAX_ATTEMPTS)
+
+        func.defer = defer
+        func.task_name = name
+        return func
+    return decorator
+
+
+def enqueue(name, args=(), kwargs=None, priority=0, dedup_key=None,
+            max_attempts=1):
+    """Ставит задачу в очередь; возвращает ее или уже ждущую дублирующую."""
+    payload = json.dumps({'args': list(args), 'kwargs': kwargs or {}})
+    try:
+        with transaction.atomic():
+            return Task.objects.create(
+                name=name, payload=payload, priority=priority,
+                dedup_key=dedup_key, max_attempts=max_attempts,
+                run_at=timezone.now())
+    except IntegrityError:
+        if dedup_key is None:
+            raise
+        return Task.objects.filter(dedup_key=dedup_key,
+                                   state=Task.QUEUED).first()
+
+
+def claim(limit, worker_id=None):
+    """Берет в работу до limit готовых задач в порядке приоритета."""
+    worker_id = worker_id or uuid.uuid4().hex
+    now = timezone.now()
+    ready = Task.objects.filter(state=Task.QUEUED, run_at__lte=now).order_by(
+        '-priority', 'run_at').values_list('pk', flat=True)[:limit]
+    # Условие на state повторяется в UPDATE: задачу, которую успел взять
+    # другой обработчик, второй раз не взять.
+    Task.objects.filter(pk__in=list(ready), state=Task.QUEUED).update(
+        state=Task.RUNNING, locked_by=worker_id, locked_at=now,
+        attempts=F('attempts') + 1, dedup_key=None)
+    return list(Task.objects.filter(
+        state=Task.RUNNING, locked_by=worker_id).order_by(
+        '-priority', 'run_at'))
+
+
+def execute(name, payload):
+    """Выполняет задачу; возвращает текст ошибки или None."""
+    try:
+        data = json.loads(payload)
+        import_string(name)(*data['args'], **data['kwargs'])
+    except Exception:
+        logger.exception('task %s failed', name)
+        return traceback.format_exc()
+    return None
+
+
+def finish(task_obj, error=None):
+    """Записывает результат: удаляет выполненную, откладывает повтор."""
+    if error is None:
+        Task.objects.filter(pk=task_obj.pk).delete()
+        return
+    if task_obj.attempts < task_obj.max_attempts:
+        delay = settings.TASK_RETRY_DELAY * 2 ** (task_obj.attempts - 1)
+        Task.objects.filter(pk=task_obj.pk).update(
+            state=Task.QUEUED, locked_by='', locked_at=None,
+            last_error=error,
+            run_at=timezone.now() + timedelta(seconds=delay))
+        return
+    Task.objects.filter(pk=task_obj.pk).update(
+        state=Task.FAILED, last_error=error)
+
+
+def release_stale():
+    """Возвращает в очередь задачи упавших обработчиков."""
+    expired = timezone.now() - timedelta(seconds=settings.TASK_LOCK_TIMEOUT)
+    return Task.objects.filter(
+        Q(locked_at__lt=expired) | Q(locked_at__isnull=True),
+        state=Task.RUNNING).update(
+        state=Task.QUEUED, locked_by='', locked_at=None)
+
+
+def run_pending(limit=None):
+    """Выполняет готовые задачи в текущем процессе; возвращает их число."""
+    done = 0
+    for task_obj in claim(limit or settings.TASK_BATCH_SIZE):
+        finish(task_obj, execute(task_obj.name, task_obj.payload))
+        done += 1
+    return done
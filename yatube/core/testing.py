@@ -0,0 +1,102 @@
+"""Проверки числа запросов для тестов: раннер с бюджетами и фикстуры."""
+import functools
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+
+try:
+    import pytest
+except ImportError:
+    pytest = None
+
+
+BUDGET_MIDDLEWARE = 'core.middleware.QueryBudgetMiddleware'
+SHARED_BACKEND = 'core.cache.SharedMemoryCache'
+LOCAL_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+def local_caches():
+    """override_settings, заменяющий общий кэш хоста кэшем процесса.
+
+    Файл общего кэша пережил бы прогон и отдал бы страницы, собранные
+    по другой базе.
+    """
+    return override_settings(CACHES={
+        alias: ({'BACKEND': LOCAL_BACKEND, 'LOCATION': alias}
+                if params['BACKEND'] == SHARED_BACKEND else params)
+        for alias, params in settings.CACHES.items()})
+
+
+def query_budgets():
+    """override_settings, в котором превышение QUERY_BUDGETS - ошибка.
+
+    QueryBudgetMiddleware подключается, даже если настройки включают его
+    только при DEBUG.
+    """
+    middleware = list(settings.MIDDLEWARE)
+    if BUDGET_MIDDLEWARE not in middleware:
+        middleware.insert(0, BUDGET_MIDDLEWARE)
+    return override_settings(MIDDLEWARE=middleware, QUERY_BUDGET_RAISE=True)
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    """Тестовый раннер, в котором превышение QUERY_BUDGETS - ошибка.
+
+    Кэши на время прогона - в памяти процесса (local_caches).
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._overrides = [query_budgets(), local_caches()]
+        for override in self._overrides:
+            override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        for override in reversed(self._overrides):
+            override.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+def count_queries(client, url):
+    """Число запросов к БД при GET url с пустым кэшем."""
+    cache.clear()
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    assert response.status_code == 200, (
+        f'{url} вернул {response.status_code}')
+    return len(queries)
+
+
+def assert_constant_queries(client, url, populate, small=1, large=100):
+    """Проверяет, что число запросов не растет вместе с данными.
+
+    populate(n) добавляет n объектов, которые показывает url; запросы
+    считаются при small и при large объектах.
+    """
+    populate(small)
+    few = count_queries(client, url)
+    populate(large - small)
+    many = count_queries(client, url)
+    assert few == many, (
+        f'{url}: {few} запросов при {small} объектах и {many} '
+        f'при {large} - похоже на N+1.')
+
+
+if pytest is not None:
+    @pytest.fixture(autouse=True, scope='session')
+    def testing_environment():
+        """Под pytest - те же бюджеты и кэши в памяти, что и в раннере."""
+        with query_budgets(), local_caches():
+            yield
+
+    @pytest.fixture
+    def constant_queries(client, db):
+        """Фикстура pytest-django: constant_queries(url, populate).
+
+        Плагин подключается в conftest.py в корне репозитория:
+        pytest_plugins = ['core.testing'].
+        """
+        return functools.partial(assert_constant_queries, client)
@@ -0,0 +1,69 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core.benchmark import compare, measure, percentile, Scenario
+from posts.models import Post
+
+User = get_user_model()
+
+
+def report(**metrics):
+    return {'results': {'1000': {'index': {
+        'p50_ms': 10, 'p95_ms': 20, 'p99_ms': 30, 'queries': 3,
+        'sql_ms': 1, 'template_ms': 5, 'peak_kb': 100, **metrics}}}}
+
+
+class BenchmarkTest(TestCase):
+    def test_percentile(self):
+        """*** BENCHMARK: Перцентиль по ближайшему рангу."""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+
+    def test_compare(self):
+        """*** BENCHMARK: Регрессии - рост сверх порога и любой запрос."""
+        base = report()
+        self.assertEqual(compare(base, report(p50_ms=11)), [])
+        self.assertEqual(compare(base, report(sql_ms=1.5)), [])
+        regressions = compare(base, report(p95_ms=30, queries=4))
+        self.assertEqual({row['metric'] for row in regressions},
+                         {'p95_ms', 'queries'})
+
+    def test_measure(self):
+        """*** BENCHMARK: Замер считает запросы, шаблоны и память."""
+        user = User.objects.create_user(username='reader')
+        Post.objects.create(author=user, text='Текст')
+        client = Client()
+        client.force_login(user)
+        scenario = Scenario('index', lambda: (reverse('posts:index'), None))
+        metrics = measure(scenario, client, repeat=5, warmup=1)
+        self.assertEqual(metrics['requests'], 5)
+        self.assertGreater(metrics['queries'], 0)
+        self.assertGreater(metrics['template_ms'], 0)
+        self.assertGreater(metrics['peak_kb'], 0)
+        self.assertLessEqual(metrics['p50_ms'], metrics['p99_ms'])
+
+    def test_compare_command(self):
+        """*** BENCHMARK: compare_benchmarks падает при регрессии."""
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for name, data in (('base', report()),
+                               ('current', report(queries=10))):
+                paths.append(os.path.join(directory, f'{name}.json'))
+                with open(paths[-1], 'w') as output:
+                    json.dump(data, output)
+            out = StringIO()
+            with self.assertRaisesMessage(CommandError, 'Регрессий: 1.'):
+                call_command('compare_benchmarks', *paths, stdout=out)
+            self.assertIn('queries', out.getvalue())
+            call_command('compare_benchmarks', paths[0], paths[0],
+                         stdout=out)
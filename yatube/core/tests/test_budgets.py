@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import Client, override_settings, TestCase
+from django.urls import reverse
+
+from core.middleware import QueryBudgetExceeded
+from core.testing import (assert_constant_queries, BUDGET_MIDDLEWARE,
+                          query_budgets)
+from posts.models import Group, Post
+
+User = get_user_model()
+
+
+class QueryBudgetTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(User.objects.create_user(username='reader'))
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 1},
+                       QUERY_BUDGET_RAISE=True)
+    def test_budget_raises(self):
+        """*** BUDGET: Превышение бюджета в тестах - ошибка."""
+        with self.assertRaisesMessage(QueryBudgetExceeded,
+                                      'при бюджете 1'):
+            with self.assertLogs('core.middleware', 'ERROR'):
+                self.client.get(reverse('posts:index'))
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 1},
+                       QUERY_BUDGET_RAISE=False)
+    def test_budget_logs(self):
+        """*** BUDGET: При разработке превышение пишется в лог."""
+        with self.assertLogs('core.middleware', 'ERROR') as logs:
+            response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('posts:index (/)', logs.output[0])
+
+    @override_settings(QUERY_BUDGETS={}, QUERY_BUDGET_RAISE=True)
+    def test_no_budget(self):
+        """*** BUDGET: Представления без бюджета не проверяются."""
+        self.assertEqual(
+            self.client.get(reverse('posts:index')).status_code, 200)
+
+    def test_budgets_enforced(self):
+        """*** BUDGET: Раннер подключает бюджеты и делает их ошибкой."""
+        self.assertIn(BUDGET_MIDDLEWARE, settings.MIDDLEWARE)
+        self.assertTrue(settings.QUERY_BUDGET_RAISE)
+
+    def test_budgets_without_debug(self):
+        """*** BUDGET: Без DEBUG бюджеты включает только core.testing."""
+        middleware = [name for name in settings.MIDDLEWARE
+                      if name != BUDGET_MIDDLEWARE]
+        with override_settings(MIDDLEWARE=middleware,
+                               QUERY_BUDGET_RAISE=False):
+            with query_budgets():
+                self.assertEqual(settings.MIDDLEWARE[0], BUDGET_MIDDLEWARE)
+                self.assertEqual(settings.MIDDLEWARE[1:], middleware)
+                self.assertTrue(settings.QUERY_BUDGET_RAISE)
+            self.assertNotIn(BUDGET_MIDDLEWARE, settings.MIDDLEWARE)
+
+    def test_group_list_queries_constant(self):
+        """*** BUDGET: Число запросов ленты группы не зависит от постов."""
+        author = User.objects.create_user(username='author')
+        group = Group.objects.create(title='Группа', slug='group')
+
+        def populate(count):
+            for _ in range(count):
+                Post.objects.create(text='Пост', author=author, group=group)
+
+        assert_constant_queries(
+            self.client, reverse('posts:group_list', args=(group.slug,)),
+            populate, large=20)
+
+    def test_constant_queries_detects_growth(self):
+        """*** BUDGET: Рост числа запросов с данными обнаруживается."""
+        authors = []
+
+        def populate(count):
+            for _ in range(count):
+                authors.append(User.objects.create_user(
+                    username=f'user{len(authors)}'))
+
+        with self.assertRaisesMessage(AssertionError, 'похоже на N+1'):
+            assert_constant_queries(
+                _GrowingClient(self.client, authors), '/', populate,
+                large=3)
+
+
+class _GrowingClient:
+    """Клиент с N+1: по лишнему запросу на каждого автора."""
+
+    def __init__(self, client, authors):
+        self.client = client
+        self.authors = authors
+
+    def get(self, url):
+        for author in self.authors:
+            User.objects.filter(pk=author.pk).exists()
+        return self.client.get(url)
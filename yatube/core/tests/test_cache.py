@@ -0,0 +1,197 @@
+import fcntl
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase
+
+from core.benchmark import measure_cache, shared_hit_rate
+from core.cache import LocalTier, SharedMemoryCache, TwoTierCache
+
+
+def shared(location, **options):
+    return SharedMemoryCache(location, {'OPTIONS': {
+        'MAX_BYTES': 64 * 1024, 'MAX_ENTRIES': 2048, **options}})
+
+
+def increment(cache, times):
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SharedMemoryCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = f'{self.directory}/cache'
+        self.cache = shared(self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_api(self):
+        """*** SHARED CACHE: Операции кэша Django."""
+        cache = self.cache
+        cache.set('post', {'id': 1})
+        self.assertEqual(cache.get('post'), {'id': 1})
+        self.assertEqual(cache.get('missing', 'default'), 'default')
+        self.assertFalse(cache.add('post', 'other'))
+        self.assertTrue(cache.add('count', 1, None))
+        self.assertEqual(cache.incr('count', 5), 6)
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+        self.assertEqual(cache.set_many({'a': 1, 'b': 2}), [])
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        cache.delete('a')
+        self.assertFalse(cache.has_key('a'))
+        cache.set('expired', 1, 0)
+        self.assertIsNone(cache.get('expired'))
+        self.assertTrue(cache.touch('b', 0))
+        self.assertIsNone(cache.get('b'))
+        cache.set('post', {'id': 2}, version=2)
+        self.assertEqual(cache.get('post'), {'id': 1})
+        cache.clear()
+        self.assertIsNone(cache.get('post'))
+
+    def test_shared_between_processes(self):
+        """*** SHARED CACHE: Записи и incr видны всем процессам."""
+        self.assertEqual(shared_hit_rate(self.cache), 1.0)
+        self.assertEqual(shared_hit_rate(LocMemCache('test', {})), 0.0)
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=increment, args=(self.cache, 50))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(shared(self.location).get('counter'), 200)
+
+    def test_readers_share_lock(self):
+        """*** SHARED CACHE: Чтение не ждет других читателей."""
+        self.cache.set('key', 1)
+        found = []
+        reader = threading.Thread(
+            target=lambda: found.append(self.cache.get_many(['key'])),
+            daemon=True)
+        with open(f'{self.location}.lock') as lock:
+            # Разделяемая блокировка другого процесса (свой дескриптор).
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            try:
+                reader.start()
+                reader.join(5)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self.assertEqual(found, [{'key': 1}])
+
+    def test_byte_budget(self):
+        """*** SHARED CACHE: Новые записи вытесняют самые старые."""
+        value = 'x' * 1000
+        for number in range(200):
+            self.cache.set(f'key{number}', value)
+        kept = self.cache.get_many([f'key{number}' for number in range(200)])
+        self.assertLess(len(kept), 70)
+        self.assertIn('key199', kept)
+        self.assertNotIn('key0', kept)
+        self.assertEqual(self.cache.set_many({'huge': 'x' * 100_000}),
+                         ['huge'])
+
+    def test_layout_change(self):
+        """*** SHARED CACHE: Файл другого размера заводится заново."""
+        self.cache.set('key', 1)
+        self.assertEqual(shared(self.location).get('key'), 1)
+        resized = shared(self.location, MAX_BYTES=128 * 1024)
+        self.assertIsNone(resized.get('key'))
+        resized.set('key', 2)
+        self.assertEqual(resized.get('key'), 2)
+
+    def test_replaced_file_followed(self):
+        """*** SHARED CACHE: Процессы переходят на замененный файл."""
+        self.cache.set('key', 1)
+        resized = shared(self.location, MAX_BYTES=128 * 1024)
+        resized.set('key', 2)
+        # Файл другого устройства не трогается.
+        self.assertEqual(self.cache.get('key'), 1)
+        self.assertEqual(resized.get('key'), 2)
+        os.unlink(self.location)
+        other = shared(self.location)
+        other.set('key', 3)
+        self.assertEqual(self.cache.get('key'), 3)
+        self.cache.set('key', 4)
+        self.assertEqual(other.get('key'), 4)
+
+    def test_owner_only(self):
+        """*** SHARED CACHE: Файлы кэша доступны только владельцу."""
+        self.cache.set('key', 1)
+        for path in (self.location, f'{self.location}.lock'):
+            with self.subTest(path=path):
+                self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+    def test_measure(self):
+        """*** SHARED CACHE: Замер операций бэкенда."""
+        result = measure_cache(self.cache, keys=40, value_size=10)
+        self.assertEqual(set(result), {'set_us', 'get_us', 'miss_us',
+                                       'set_many_us', 'get_many_us'})
+        self.assertEqual(self.cache.get('bench:39'), 'x' * 10)
+
+
+class TwoTierCacheTest(SimpleTestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.cache = self.process()
+
+    def process(self, **options):
+        """Кэш с собственным L1, как в отдельном процессе."""
+        cache = TwoTierCache('shared', {'OPTIONS': {
+            'L1_TIMEOUT': 60, 'SYNC_INTERVAL': 0,
+            'VOLATILE_PREFIXES': ['version:'], **options}})
+        cache._tier = LocalTier(100, 2 ** 20)
+        return cache
+
+    def test_tests_use_local_cache(self):
+        """*** TWO TIER: Тесты не пишут в общий кэш хоста."""
+        self.assertIsInstance(caches['shared'], LocMemCache)
+
+    def test_reads_from_l1(self):
+        """*** TWO TIER: Повторное чтение не обращается к L2."""
+        self.cache.set('group', ['slug'])
+        caches['shared'].delete('group')
+        value = self.cache.get('group')
+        self.assertEqual(value, ['slug'])
+        value.append('changed')
+        self.assertEqual(self.cache.get_many(['group']),
+                         {'group': ['slug']})
+        self.assertEqual(self.cache.get('missing', 'default'), 'default')
+        stats = self.cache.tier_stats()
+        self.assertEqual((stats['l1_hit'], stats['l1_miss'],
+                          stats['l2_miss']), (2, 1, 1))
+        self.assertEqual(stats['l1_hit_rate'], 2 / 3)
+
+    def test_other_process_writes(self):
+        """*** TWO TIER: Чужая запись поколения сбрасывает L1 сразу."""
+        other = self.process()
+        for cache in (self.cache, other):
+            cache.get_many(['version:index', 'page'])
+        self.cache.set_many({'version:index': 1, 'page': 'old'})
+        self.assertEqual(other.get('version:index'), 1)
+        self.assertEqual(other.get('page'), 'old')
+        self.cache.set_many({'version:index': 2, 'page': 'new'})
+        self.assertEqual(other.get('version:index'), 2)
+        # Остальные ключи обновляются по сроку L1.
+        self.assertEqual(other.get('page'), 'old')
+        fresh = self.process(L1_TIMEOUT=0)
+        self.assertEqual(fresh.get('page'), 'new')
+
+    def test_writes_update_both_tiers(self):
+        """*** TWO TIER: Запись, incr и удаление видны через L1."""
+        self.cache.set('count', 1)
+        self.assertEqual(self.cache.incr('count'), 2)
+        self.assertEqual(self.cache.get('count'), 2)
+        self.assertFalse(self.cache.add('count', 5))
+        self.cache.delete('count')
+        self.assertIsNone(self.cache.get('count'))
+        self.cache.set('expired', 1, 0)
+        self.assertIsNone(self.cache.get('expired'))
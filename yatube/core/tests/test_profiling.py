@@ -0,0 +1,134 @@
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, override_settings, TestCase
+from django.urls import reverse
+
+from core import profiling
+
+User = get_user_model()
+TEMP_DIR = tempfile.mkdtemp()
+
+
+def busy(seconds):
+    until = time.perf_counter() + seconds
+    while time.perf_counter() < until:
+        pass
+
+
+@override_settings(PROFILE_DIR=TEMP_DIR, PROFILE_INTERVAL=0.001,
+                   PROFILE_FLUSH_INTERVAL=0)
+class ProfilingTest(TestCase):
+    def setUp(self):
+        profiling.store.stacks.clear()
+        profiling.store.requests.clear()
+        self.staff = User.objects.create_user(username='staff', is_staff=True)
+        self.reader = User.objects.create_user(username='reader')
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    def test_collapse(self):
+        """*** PROFILE: Стек записывается от корня к текущей функции."""
+        stack = profiling.collapse(sys._getframe())
+        self.assertTrue(stack.endswith(
+            f'{__name__}:test_collapse'), stack)
+        self.assertIn(';', stack)
+
+    def test_sampler(self):
+        """*** PROFILE: Сэмплер снимает стеки только своих потоков."""
+        sampler = profiling.sampler()
+        stacks = sampler.start_sampling(threading.get_ident())
+        try:
+            busy(0.05)
+        finally:
+            sampler.stop_sampling(threading.get_ident())
+        self.assertTrue(stacks)
+        self.assertTrue(any(stack.endswith(f'{__name__}:busy')
+                            for stack in stacks))
+        self.assertFalse(sampler.targets)
+
+    def test_sampler_stop_is_final(self):
+        """*** PROFILE: После stop_sampling стеки запроса не меняются."""
+        sampler = profiling.Sampler(0.001)
+        ident = threading.get_ident()
+        stopped = threading.Event()
+
+        def collapse(frame):
+            # Запрос завершился, пока сэмплер разбирал его стек.
+            sampler.stop_sampling(ident)
+            stopped.set()
+            return 'stack'
+
+        with mock.patch.object(profiling, 'collapse', collapse):
+            stacks = sampler.start_sampling(ident)
+            sampler.start()
+            self.assertTrue(stopped.wait(5))
+            sampler.join(0.05)
+        self.assertEqual(stacks, Counter())
+
+    @override_settings(PROFILE_STAFF=True, PROFILE_SAMPLE_RATE=0)
+    def test_staff_requests(self):
+        """*** PROFILE: Профилируются запросы персонала, не читателей."""
+        client = Client()
+        client.force_login(self.reader)
+        client.get(reverse('posts:index'))
+        self.assertEqual(profiling.store.requests['posts:index'], 0)
+        client.force_login(self.staff)
+        client.get(reverse('posts:index'))
+        self.assertEqual(profiling.store.requests['posts:index'], 1)
+
+    @override_settings(PROFILE_MAX_STACKS=2)
+    def test_stacks_bounded(self):
+        """*** PROFILE: Давно не встречавшиеся стеки вытесняются."""
+        store = profiling.ProfileStore()
+        store.add('posts:index', Counter({'a;b': 1, 'a;c': 1}))
+        store.add('posts:index', Counter({'a;b': 1}))
+        store.add('posts:index', Counter({'a;d': 1}))
+        self.assertEqual(dict(store.stacks['posts:index']),
+                         {'a;b': 2, 'a;d': 1})
+        self.assertEqual(store.requests['posts:index'], 3)
+
+    def test_merge_and_views(self):
+        """*** PROFILE: Стеки процессов объединяются и видны персоналу."""
+        profiling.store.add('posts:index', Counter({'a;b': 2, 'a;c': 1}))
+        profiling.store.flush()
+        other = profiling.ProfileStore()
+        other.add('posts:index', Counter({'a;b': 3}))
+        with open(f'{TEMP_DIR}/{profiling.file_name("posts:index", 0)}',
+                  'w') as output:
+            profiling.write_collapsed(output, other.stacks['posts:index'])
+        self.assertEqual(profiling.merge()['posts.index'],
+                         Counter({'a;b': 5, 'a;c': 1}))
+
+        url = reverse('core:profile_stacks', args=('posts.index',))
+        for user in (None, self.reader):
+            client = Client()
+            if user:
+                client.force_login(user)
+            for page in (reverse('core:profiles'), url):
+                response = client.get(page)
+                self.assertEqual(response.status_code, 302, page)
+        client = Client()
+        client.force_login(self.staff)
+        self.assertEqual(client.get(url).content.decode(),
+                         'a;b 5\na;c 1\n')
+        self.assertEqual(
+            client.get(reverse('core:profiles')).content.decode(),
+            'posts.index 6')
+        self.assertEqual(client.get(reverse(
+            'core:profile_stacks', args=('posts.missing',))).status_code,
+            404)
+
+        output = f'{TEMP_DIR}/merged'
+        call_command('collapse_profiles', output, stdout=StringIO())
+        with open(f'{output}/posts.index.folded') as merged:
+            self.assertEqual(merged.read(), 'a;b 5\na;c 1\n')
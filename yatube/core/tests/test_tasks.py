@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.db import transaction
+from django.test import override_settings, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import Task
+from core.tasks import claim, run_pending, task
+
+User = get_user_model()
+
+CALLS = []
+
+
+@task(dedup_key=lambda value: f'record:{value}')
+def record(value):
+    CALLS.append(value)
+
+
+@task(priority=5)
+def urgent(value):
+    CALLS.append(value)
+
+
+@task(max_attempts=2)
+def broken():
+    raise RuntimeError('сбой')
+
+
+@task()
+def touch(path):
+    # Обработчик пула - другой процесс: результат виден только через файл.
+    open(path, 'w').close()
+
+
+@task(max_attempts=2)
+def crash():
+    os._exit(1)
+
+
+class TaskQueueTest(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_tasks_deferred_and_run(self):
+        """*** TASKS: отложенная задача выполняется обработчиком."""
+        record.defer('a')
+        self.assertEqual(CALLS, [])
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(CALLS, ['a'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_tasks_dedup_and_priority(self):
+        """*** TASKS: дубли не ставятся, срочные задачи идут первыми."""
+        first = record.defer('a')
+        self.assertEqual(record.defer('a'), first)
+        record.defer('b')
+        urgent.defer('c')
+        self.assertEqual(Task.objects.count(), 3)
+        run_pending()
+        self.assertEqual(CALLS, ['c', 'a', 'b'])
+
+    def test_tasks_rolled_back_with_transaction(self):
+        """*** TASKS: задача пропадает при откате транзакции."""
+        try:
+            with transaction.atomic():
+                record.defer('a')
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(TASK_RETRY_DELAY=60)
+    def test_tasks_retried_then_failed(self):
+        """*** TASKS: упавшая задача повторяется с задержкой."""
+        broken.defer()
+        run_pending()
+        task_obj = Task.objects.get()
+        self.assertEqual((task_obj.state, task_obj.attempts),
+                         (Task.QUEUED, 1))
+        self.assertIn('сбой', task_obj.last_error)
+        self.assertGreater(task_obj.run_at, timezone.now())
+        self.assertEqual(claim(10), [])
+
+        Task.objects.update(run_at=timezone.now() - timedelta(seconds=1))
+        run_pending()
+        self.assertEqual(Task.objects.get().state, Task.FAILED)
+
+    def test_tasks_password_reset_mail(self):
+        """*** TASKS: письмо сброса пароля уходит из очереди."""
+        User.objects.create_user(username='user', email='user@example.com',
+                                 password='пароль-123')
+        self.client.post(reverse('users:password_reset'),
+                         {'email': 'user@example.com'})
+        self.assertEqual(len(mail.outbox), 0)
+        run_pending()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['user@example.com'])
+
+    @override_settings(TASK_RETRY_DELAY=60)
+    def test_tasks_worker_pool(self):
+        """*** TASKS: worker --once выполняет задачи в пуле процессов."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'done')
+        touch.defer(path)
+        output = StringIO()
+        call_command('worker', '--once', '--processes', '2', stdout=output)
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(Task.objects.exists())
+        self.assertIn('готово', output.getvalue())
+
+        # Умерший процесс ломает пул: задача возвращается в очередь.
+        crash.defer()
+        call_command('worker', '--once', stdout=StringIO())
+        task_obj = Task.objects.get()
+        self.assertEqual((task_obj.state, task_obj.attempts),
+                         (Task.QUEUED, 1))
+        self.assertIn('worker process died', task_obj.last_error)
+        Task.objects.update(run_at=timezone.now() - timedelta(seconds=1))
+        call_command('worker', '--once', stdout=StringIO())
+        self.assertEqual(Task.objects.get().state, Task.FAILED)
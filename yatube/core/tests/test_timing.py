@@ -0,0 +1,71 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, override_settings, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import timing
+
+User = get_user_model()
+
+
+def parse(header):
+    metrics = {}
+    for part in header.split(', '):
+        name, *params = part.split(';')
+        metrics[name] = dict(param.split('=', 1) for param in params)
+    return metrics
+
+
+class ServerTimingTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(User.objects.create_user(username='reader'))
+
+    def test_header(self):
+        """*** TIMING: Заголовок Server-Timing с SQL, шаблонами и кэшем."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:index'))
+        metrics = parse(response['Server-Timing'])
+        for name in ('db', 'template', 'cache_get', 'total'):
+            self.assertIn(name, metrics)
+            self.assertGreaterEqual(float(metrics[name]['dur']), 0)
+        self.assertEqual(metrics['db']['desc'], f'"{len(queries)} calls"')
+        # Шаблон страницы с вложенными include - один вызов верхнего уровня.
+        self.assertEqual(metrics['template']['desc'], '"1 calls"')
+
+    def test_log_line(self):
+        """*** TIMING: Те же метрики пишутся JSON-строкой в лог."""
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            self.client.get(reverse('posts:index'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'posts:index')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['db_count'], 0)
+        self.assertIn('thumbnail_ms', record)
+
+    @override_settings(SERVER_TIMING=False)
+    def test_disabled(self):
+        """*** TIMING: SERVER_TIMING=False выключает middleware."""
+        response = Client().get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class RequestTimingTest(TestCase):
+    def test_nested_calls_counted_once(self):
+        """*** TIMING: Вложенные вызовы метрики не складываются."""
+        @timing.timed('thumbnail')
+        def resolve(depth):
+            return resolve(depth - 1) if depth else 'done'
+
+        current, token = timing.start()
+        try:
+            self.assertEqual(resolve(3), 'done')
+        finally:
+            timing.stop(token)
+        self.assertEqual(current.counts['thumbnail'], 1)
+        # Вне запроса обертка просто вызывает функцию.
+        self.assertEqual(resolve(1), 'done')
+        self.assertEqual(current.counts['thumbnail'], 1)
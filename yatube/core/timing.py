@@ -0,0 +1,125 @@
+"""Время обработки запроса по частям: SQL, шаблоны, кэш, миниатюры.
+
+Замеры копятся в RequestTiming текущего запроса (contextvar), который
+заводит core.middleware.ServerTimingMiddleware. Шаблоны и кэш
+оборачиваются один раз при старте (install); вне замеряемого запроса
+обертка стоит одного чтения contextvar.
+
+Вложенные вызовы одной метрики ({% include %}, get_many через get)
+уже входят во время внешнего и не складываются повторно.
+"""
+import functools
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.template.base import Template
+from django.utils.module_loading import import_string
+
+METRICS = ('db', 'template', 'cache_get', 'cache_set', 'thumbnail')
+CACHE_READS = ('get', 'get_many', 'has_key')
+CACHE_WRITES = ('set', 'add', 'set_many', 'delete', 'delete_many',
+                'incr', 'decr', 'touch')
+
+_current = ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    """Суммарное время и число вызовов по метрикам одного запроса."""
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.counts = Counter()
+        self.active = set()
+        self.started = time.perf_counter()
+
+    def track(self, name, func, *args, **kwargs):
+        if name in self.active:
+            return func(*args, **kwargs)
+        self.active.add(name)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.active.discard(name)
+            self.durations[name] += time.perf_counter() - started
+            self.counts[name] += 1
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper: SQL-запросы не бывают вложенными.
+        return self.track('db', execute, sql, params, many, context)
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def header(self):
+        """Значение заголовка Server-Timing: длительности в мс, в desc -
+        число вызовов (заголовок - latin-1, поэтому без кириллицы).
+        """
+        parts = []
+        for name in METRICS:
+            if name in self.counts:
+                parts.append(
+                    f'{name};dur={self.durations[name] * 1000:.1f};'
+                    f'desc="{self.counts[name]} calls"')
+        parts.append(f'total;dur={self.total() * 1000:.1f}')
+        return ', '.join(parts)
+
+    def summary(self):
+        """Метрики для структурированной записи в лог."""
+        record = {'total_ms': round(self.total() * 1000, 2)}
+        for name in METRICS:
+            record[f'{name}_ms'] = round(self.durations[name] * 1000, 2)
+            record[f'{name}_count'] = self.counts[name]
+        return record
+
+
+def start():
+    """Начинает замеры текущего запроса; возвращает (timing, token)."""
+    timing = RequestTiming()
+    return timing, _current.set(timing)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+def track(name, func, *args, **kwargs):
+    timing = _current.get()
+    if timing is None:
+        return func(*args, **kwargs)
+    return timing.track(name, func, *args, **kwargs)
+
+
+def timed(name):
+    """Декоратор: время вызовов функции идет в метрику name."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return track(name, func, *args, **kwargs)
+        wrapper.timed = name
+        return wrapper
+    return decorator
+
+
+def _wrap(owner, attr, name):
+    original = getattr(owner, attr, None)
+    if original is None or getattr(original, 'timed', None):
+        return
+    setattr(owner, attr, timed(name)(original))
+
+
+def install():
+    """Оборачивает Template.render и методы бэкендов из CACHES."""
+    _wrap(Template, 'render', 'template')
+    for options in settings.CACHES.values():
+        backend = import_string(options['BACKEND'])
+        for attr in CACHE_READS:
+            _wrap(backend, attr, 'cache_get')
+        for attr in CACHE_WRITES:
+            _wrap(backend, attr, 'cache_set')
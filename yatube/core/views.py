@@ -1,7 +1,12 @@
 from http import HTTPStatus
+from io import StringIO
 
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
 
+from . import profiling
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию;
@@ -21,3 +26,25 @@ def csrf_failure(request, reason=''):
 def server_error(request):
     return render(request, 'core/500.html',
                   status=HTTPStatus.INTERNAL_SERVER_ERROR)
+
+
+@staff_member_required
+def profiles(request):
+    """Представления, для которых есть стеки, и число снимков."""
+    lines = [f'{view} {sum(stacks.values())}'
+             for view, stacks in sorted(profiling.merge().items())]
+    return HttpResponse('\n'.join(lines), content_type='text/plain')
+
+
+@staff_member_required
+def profile_stacks(request, view):
+    """Стеки представления всех процессов в формате collapsed stacks."""
+    stacks = profiling.merge().get(view)
+    if not stacks:
+        raise Http404
+    output = StringIO()
+    profiling.write_collapsed(output, stacks)
+    response = HttpResponse(output.getvalue(), content_type='text/plain')
+    response['Content-Disposition'] = (
+        f'attachment; filename="{view}{profiling.SUFFIX}"')
+    return response
@@ -1,29 +1,236 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin import helpers
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.template.response import TemplateResponse
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.html import format_html
 
+from . import timeline
+from .cache import bump_versions, post_scopes
 from .models import Comment, Follow, Group, Post
+from .search import COMMENT_INDEX, POST_INDEX, search_queryset
+from .utils import LimitedCountPaginator
 
+User = get_user_model()
 
-class PostAdmin(admin.ModelAdmin):
+
+class UserFilter(admin.SimpleListFilter):
+    """Фильтр по пользователю без списка всех пользователей в панели.
+
+    В панели виден только выбранный пользователь; выбирают его ссылкой
+    из колонки списка (см. filter_link).
+    """
+
+    def lookups(self, request, model_admin):
+        user_id = self.user_id()
+        if user_id is None:
+            return ()
+        return User.objects.filter(pk=user_id).values_list('pk', 'username')
+
+    def user_id(self):
+        if self.value() is None:
+            return None
+        try:
+            return int(self.value())
+        except ValueError:
+            raise IncorrectLookupParameters(self.value())
+
+    def queryset(self, request, queryset):
+        user_id = self.user_id()
+        if user_id is None:
+            return queryset
+        return queryset.filter(**{f'{self.parameter_name}_id': user_id})
+
+
+class AuthorFilter(UserFilter):
+    title = 'автор'
+    parameter_name = 'author'
+
+
+class FollowerFilter(UserFilter):
+    title = 'подписчик'
+    parameter_name = 'user'
+
+
+def filter_link(field, description):
+    """Колонка со ссылкой на список, отфильтрованный по пользователю."""
+    def column(obj):
+        user = getattr(obj, field)
+        return format_html('<a href="?{}={}">{}</a>',
+                           field, user.pk, user.username)
+    column.short_description = description
+    column.admin_order_field = f'{field}__username'
+    return column
+
+
+def move_posts(queryset, group):
+    """Переносит посты queryset в group (None - без группы) одним UPDATE.
+
+    update() не вызывает сигналы, поэтому кэши затронутых лент
+    сбрасываются здесь же; updated обновляется, чтобы устарел
+    кэш карточек. Возвращает число перенесенных постов.
+    """
+    with transaction.atomic():
+        rows = list(queryset.values_list(
+            'pk', 'author_id', 'author__username', 'group__slug'))
+        if not rows:
+            return 0
+        moved = queryset.update(group=group, updated=timezone.now())
+    scopes = {'feeds'}
+    slugs = {group.slug} if group else set()
+    for pk, _, username, slug in rows:
+        scopes.update(post_scopes(pk, username, slugs | {slug}))
+    bump_versions(*scopes)
+    for author_id in {row[1] for row in rows}:
+        timeline.touch(author_id)
+    return moved
+
+
+class KnownChoicesAutocomplete(AutocompleteSelect):
+    """Автодополнение, которому подписи выбранных значений уже известны.
+
+    Обычный виджет ищет выбранное значение отдельным запросом - в
+    list_editable это запрос на каждую строку. known ({pk: подпись})
+    заполняет формсет списка; неизвестные значения ищутся как обычно.
+    """
+
+    known = None
+
+    def optgroups(self, name, value, attr=None):
+        selected = {str(v) for v in value
+                    if str(v) not in self.choices.field.empty_values}
+        if self.known is None or not selected <= self.known.keys():
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        for pk in selected:
+            options.append(self.create_option(
+                name, pk, self.known[pk], True, len(options)))
+        return [(None, options, 0)]
+
+
+class MoveToGroupForm(forms.Form):
+    def __init__(self, admin_site, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['group'] = forms.ModelChoiceField(
+            Group.objects.all(),
+            required=False,
+            label='Группа',
+            help_text='Пустое значение убирает посты из групп.',
+            widget=AutocompleteSelect(
+                Post._meta.get_field('group').remote_field, admin_site)
+        )
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Основа админки больших таблиц: без полного COUNT(*) на странице."""
+    paginator = LimitedCountPaginator
+    show_full_result_count = False
+
+
+class PostAdmin(LargeTableAdmin):
     list_display = ('pk', 'text', 'group', 'pub_date', 'author')
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    list_filter = ('pub_date', AuthorFilter)
     search_fields = ('text',)
-    list_filter = ('pub_date',)
+    autocomplete_fields = ('author', 'group')
+    actions = ('move_to_group',)
     empty_value_display = '-пусто-'
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'group':
+            kwargs['widget'] = KnownChoicesAutocomplete(
+                db_field.remote_field, self.admin_site,
+                using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_changelist_formset(self, request, **kwargs):
+        # Группы строк страницы читаются одним запросом на весь формсет:
+        # иначе автодополнение каждой строки ищет свою группу отдельно.
+        base = super().get_changelist_formset(request, **kwargs)
+
+        class FormSet(base):
+            @cached_property
+            def group_labels(self):
+                ids = {post.group_id for post in self.get_queryset()}
+                return {str(group.pk): str(group)
+                        for group in Group.objects.filter(pk__in=ids)}
+
+            def _construct_form(self, i, **kwargs):
+                form = super()._construct_form(i, **kwargs)
+                form.fields['group'].widget.widget.known = self.group_labels
+                return form
+
+        return FormSet
+
+    def move_to_group(self, request, queryset):
+        form = MoveToGroupForm(
+            self.admin_site, request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            group = form.cleaned_data['group']
+            moved = move_posts(queryset, group)
+            self.message_user(
+                request, f'Перенесено постов: {moved} '
+                         f'в «{group or self.empty_value_display}».')
+            return None
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Перенести посты в группу',
+            'opts': self.model._meta,
+            'form': form,
+            'media': self.media + form.media,
+            'count': queryset.count(),
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(
+            request, 'admin/posts/post/move_to_group.html', context)
+    move_to_group.short_description = 'Перенести выбранные посты в группу'
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по индексу FTS5 вместо LIKE '%...%' по всей таблице.
+        if not search_term:
+            return queryset, False
+        return search_queryset(queryset, POST_INDEX, search_term), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('title', 'slug', 'description')
     search_fields = ('title',)
 
 
-class CommentAdmin(admin.ModelAdmin):
-    list_display = ('post', 'text', 'author', 'created')
-    list_filter = ('author',)
+class CommentAdmin(LargeTableAdmin):
+    list_display = ('post', 'text', filter_link('author', 'автор'),
+                    'created')
+    list_select_related = ('post', 'author')
+    list_filter = (AuthorFilter,)
+    search_fields = ('text',)
+    autocomplete_fields = ('post', 'author')
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search_queryset(queryset, COMMENT_INDEX, search_term), False
+
 
+class FollowAdmin(LargeTableAdmin):
+    list_display = (filter_link('user', 'подписчик'),
+                    filter_link('author', 'подписан на'))
+    list_filter = (FollowerFilter, AuthorFilter)
+    autocomplete_fields = ('user', 'author')
 
-class FollowAdmin(admin.ModelAdmin):
-    list_display = ('user', 'author')
-    list_filter = ('user', 'author')
+    def get_queryset(self, request):
+        # Follow.__str__ читает оба имени: без join каждая подписка в
+        # подтверждении удаления и в журнале стоила бы двух запросов.
+        return super().get_queryset(request).select_related('user', 'author')
 
 
 admin.site.register(Post, PostAdmin)
@@ -0,0 +1,91 @@
+"""Сценарии замеров представлений posts (manage.py benchmark_views)."""
+import itertools
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from core.benchmark import Scenario
+from .models import Follow, Group, Post, User
+
+
+def _fixed(url):
+    return lambda: (url, None)
+
+
+def _cold(prepare):
+    # Холодный прогон: ни ленты, ни фрагменты постов не закэшированы.
+    def cold():
+        cache.clear()
+        return prepare()
+    return cold
+
+
+def scenarios(cold=False, requests=54):
+    """Сценарии по самым тяжелым объектам сгенерированных данных.
+
+    Читатель - пользователь с наибольшим числом подписок; группа,
+    автор и пост - самые большие (поток группы, профиль, ветка).
+    requests - сколько раз будет вызван каждый сценарий, с разогревом.
+    """
+    reader = User.objects.annotate(
+        total=Count('follower')).order_by('-total', 'pk').first()
+    group = Group.objects.annotate(
+        total=Count('posts')).order_by('-total', 'pk').first()
+    author = User.objects.annotate(
+        total=Count('posts')).order_by('-total', 'pk').first()
+    post = Post.objects.order_by('-comments_count', 'pk').first()
+    client = Client()
+    client.force_login(reader)
+    own_post = Post.objects.create(author=reader, text='Пост для замеров')
+
+    # Каждая подписка - на нового автора, а отписки снимают их по
+    # порядку: повторная подписка ничего не создала бы, а повторная
+    # отписка вернула бы 404. Недостающих авторов создаем.
+    candidates = list(User.objects.exclude(pk=reader.pk).exclude(
+        pk__in=Follow.objects.filter(user=reader).values('author_id')
+    ).values_list('username', flat=True)[:requests])
+    for number in range(len(candidates), requests):
+        candidates.append(User.objects.create_user(
+            username=f'benchmark{own_post.pk}-{number}').username)
+    to_follow = itertools.cycle(candidates)
+    to_unfollow = itertools.cycle(candidates)
+    texts = (f'Новый пост {number}' for number in itertools.count())
+    comments = (f'Комментарий {number}' for number in itertools.count())
+
+    reads = [
+        Scenario('index', _fixed(reverse('posts:index'))),
+        Scenario('index_anonymous', _fixed(reverse('posts:index')),
+                 client=Client()),
+        Scenario('group_posts', _fixed(
+            reverse('posts:group_list', args=(group.slug,)))),
+        Scenario('profile', _fixed(
+            reverse('posts:profile', args=(author.username,)))),
+        Scenario('post_detail', _fixed(
+            reverse('posts:post_detail', args=(post.pk,)))),
+        Scenario('follow_index', _fixed(reverse('posts:follow_index'))),
+    ]
+    if cold:
+        for scenario in reads:
+            scenario.prepare = _cold(scenario.prepare)
+    writes = [
+        Scenario('post_create', lambda: (
+            reverse('posts:post_create'),
+            {'text': next(texts), 'group': group.pk}), method='post'),
+        Scenario('post_edit', lambda: (
+            reverse('posts:post_edit', args=(own_post.pk,)),
+            {'text': next(texts)}), method='post'),
+        Scenario('add_comment', lambda: (
+            reverse('posts:add_comment', args=(post.pk,)),
+            {'text': next(comments)}), method='post'),
+        Scenario('profile_follow', lambda: (
+            reverse('posts:profile_follow', args=(next(to_follow),)),
+            None)),
+        Scenario('profile_unfollow', lambda: (
+            reverse('posts:profile_unfollow', args=(next(to_unfollow),)),
+            None)),
+    ]
+    for scenario in reads + writes:
+        scenario.client = scenario.client or client
+    return reads + writes
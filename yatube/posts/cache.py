@@ -0,0 +1,69 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'version:{}'
+# Названия групп и имена авторов видны на карточках во всех лентах и
+# страницах, поэтому эта область входит в ключ каждой из них.
+NAMES_SCOPE = 'names'
+
+
+def _seed():
+    # Номер поколения - время в наносекундах: новый номер (и заново
+    # заведенный после вытеснения) не совпадет ни с одним из прежних.
+    return time.time_ns()
+
+
+def get_versions(*scopes):
+    """Возвращает текущие номера поколений для областей scopes."""
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, _seed(), None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+def _bump(scopes):
+    seed = _seed()
+    cache.set_many({VERSION_KEY.format(scope): seed for scope in scopes}, None)
+
+
+def bump_versions(*scopes):
+    """Начинает новое поколение: все ключи старых поколений устаревают.
+
+    Внутри транзакции поколение сменяется дважды: сразу, чтобы сама
+    транзакция видела свежие страницы, и после фиксации. Иначе
+    параллельный читатель успел бы закэшировать еще не зафиксированное
+    состояние под новым поколением, и оно жило бы до конца таймаута.
+    """
+    if not scopes:
+        return
+    _bump(scopes)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(scopes))
+
+
+def versioned_key(*scopes):
+    """Часть ключа кэша, которая меняется при записи в любую из scopes."""
+    return ':'.join(f'{scope}={version}' for scope, version
+                    in zip(scopes, get_versions(*scopes)))
+
+
+def feed_cache(*scopes):
+    """Параметры {% cache %} для ленты, зависящей от областей scopes."""
+    return {
+        'timeout': settings.FEED_CACHE_TIMEOUT,
+        'key': versioned_key(NAMES_SCOPE, *scopes),
+    }
+
+
+def post_scopes(post_id, username, group_slugs=()):
+    """Области, которые затрагивает изменение поста."""
+    scopes = {'index', f'post:{post_id}', f'author:{username}'}
+    scopes.update(f'group:{slug}' for slug in group_slugs if slug)
+    return scopes
@@ -1,5 +1,7 @@
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
 
+from .images import ingest_image
 from .models import Comment, Post
 
 
@@ -16,6 +18,13 @@ class PostForm(ModelForm):
             'group': 'Группа, к которой будет относиться пост'
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # Перекодируется только новая загрузка, а не уже сохраненный файл.
+        if isinstance(image, UploadedFile):
+            return ingest_image(image)
+        return image
+
 
 class CommentForm(ModelForm):
     class Meta:
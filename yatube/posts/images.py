@@ -0,0 +1,150 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from PIL import features, Image, ImageOps
+
+from .models import Post, StoredImage
+from .thumbnails import forget_thumbnails, make_thumbnails
+
+# Анимацию при перекодировании не сохранить - такие форматы хранятся как есть.
+PASSTHROUGH_FORMATS = {'GIF'}
+EXTENSIONS = {'WEBP': '.webp', 'JPEG': '.jpg'}
+
+
+def output_format():
+    """Первый из POST_IMAGE_FORMATS, который умеет сохранять Pillow."""
+    for image_format in settings.POST_IMAGE_FORMATS:
+        if features.check(image_format.lower().replace('jpeg', 'jpg')):
+            return image_format
+    return 'JPEG'
+
+
+def open_checked(file):
+    """Открывает картинку, прочитав только заголовок.
+
+    Размер берется из заголовка до декодирования, поэтому
+    декомпрессионная бомба отклоняется, не заняв память.
+    """
+    file.seek(0)
+    try:
+        image = Image.open(file)
+    except (Image.DecompressionBombError, OSError):
+        raise ValidationError('Файл не является картинкой или поврежден.',
+                              code='invalid_image')
+    width, height = image.size
+    if not width or not height:
+        raise ValidationError('У картинки нет размера.', code='invalid_image')
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Слишком большая картинка: %(width)s×%(height)s.',
+            code='image_too_large',
+            params={'width': width, 'height': height})
+    return image
+
+
+def ingest_image(file):
+    """Готовит загруженную картинку к хранению.
+
+    Поворачивает по EXIF, отбрасывает метаданные, уменьшает до
+    POST_IMAGE_MAX_SIZE по большей стороне и перекодирует. Возвращает
+    новый файл или исходный, если формат хранится как есть.
+    """
+    image = open_checked(file)
+    if image.format in PASSTHROUGH_FORMATS:
+        file.seek(0)
+        return file
+    max_size = settings.POST_IMAGE_MAX_SIZE
+    # JPEG умеет декодироваться сразу в уменьшенном масштабе.
+    image.draft('RGB', (max_size, max_size))
+    try:
+        image = ImageOps.exif_transpose(image)
+        image_format = output_format()
+        keep_alpha = image_format == 'WEBP' and 'A' in image.getbands()
+        image = image.convert('RGBA' if keep_alpha else 'RGB')
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+        # Метаданные не переносятся: exif в save() не передается.
+        buffer = BytesIO()
+        image.save(buffer, image_format,
+                   quality=settings.POST_IMAGE_QUALITY, optimize=True)
+    except (Image.DecompressionBombError, OSError, ValueError):
+        raise ValidationError('Файл не является картинкой или поврежден.',
+                              code='invalid_image')
+    stem = os.path.splitext(os.path.basename(file.name))[0]
+    return ContentFile(buffer.getvalue(),
+                       name=stem + EXTENSIONS[image_format])
+
+
+def _storage():
+    return Post._meta.get_field('image').storage
+
+
+def _counted(name):
+    # Удаляются только файлы с именем по содержимому: прочие
+    # (загруженные раньше или присвоенные путем) остаются. Ссылки на
+    # старые файлы все равно считаются, если у них есть строка
+    # (миграция 0020): по ней для них создаются миниатюры.
+    return _storage().owns(name)
+
+
+def retain_image(name, content=None):
+    """Добавляет ссылку поста на файл картинки.
+
+    content - загруженный файл. Хранилище не пишет файл, который уже
+    есть, а collect_image мог удалить его сразу после проверки:
+    создав строку заново, файл восстанавливаем из content.
+    """
+    if not name:
+        return
+    with transaction.atomic():
+        if StoredImage.objects.filter(name=name).update(
+                references=F('references') + 1):
+            return
+        if not _counted(name):
+            return
+        try:
+            with transaction.atomic():
+                StoredImage.objects.create(name=name, references=1)
+        except IntegrityError:
+            # Строку только что создал параллельный запрос.
+            StoredImage.objects.filter(name=name).update(
+                references=F('references') + 1)
+            return
+        if content is not None:
+            _storage().restore(name, content)
+        # Новый файл: миниатюры создаст обработчик очереди.
+        make_thumbnails.defer(name)
+
+
+def release_image(name):
+    """Убирает ссылку на файл; последний файл удаляется после коммита."""
+    if not name:
+        return
+    StoredImage.objects.filter(name=name, references__gt=0).update(
+        references=F('references') - 1)
+    if _counted(name):
+        transaction.on_commit(lambda: collect_image(name))
+
+
+def collect_image(name):
+    """Удаляет файл и миниатюры картинки, на которую не осталось ссылок.
+
+    Строка заблокирована, пока удаляется файл: retain_image той же
+    картинки ждет коммита и либо увидит ссылку, либо создаст строку
+    заново.
+    """
+    if not _counted(name):
+        return False
+    with transaction.atomic():
+        stored = StoredImage.objects.select_for_update().filter(
+            name=name, references=0).first()
+        if stored is None:
+            return False
+        stored.delete()
+        forget_thumbnails(name)
+        _storage().delete(name)
+    return True
@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+
+class LRU:
+    """Потокобезопасный словарь ограниченного размера.
+
+    Запись живет не дольше timeout секунд: изменения, сделанные другими
+    процессами, этот процесс видит не позже чем через timeout.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires <= time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def update(self, values):
+        expires = time.monotonic() + self.timeout
+        with self.lock:
+            for key, value in values.items():
+                self.data[key] = expires, value
+                self.data.move_to_end(key)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def discard(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    """Хранилище ключей sorl с LRU процесса перед кэшем и таблицей.
+
+    В LRU попадают только найденные значения: миниатюру, которую фоновый
+    поток создал в другом процессе, здесь увидят при следующем чтении.
+    Имена картинок - хеши содержимого (posts.storage), поэтому одно имя
+    может быть удалено и загружено снова. Удаление в этом процессе
+    чистит и LRU, а удаление в другом процессе LRU не заметит: записи
+    живут в нем не дольше THUMBNAIL_LRU_TIMEOUT секунд.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lru = LRU(settings.THUMBNAIL_LRU_SIZE,
+                       settings.THUMBNAIL_LRU_TIMEOUT)
+
+    def prefetch(self, image_files):
+        """Загружает записи image_files в LRU одним чтением кэша.
+
+        В таблицу идет не больше одного запроса - за тем, чего нет в кэше.
+        """
+        keys = {add_prefix(image_file.key) for image_file in image_files}
+        missing = [key for key in keys if self.lru.get(key) is None]
+        if not missing:
+            return
+        values = self.cache.get_many(missing)
+        absent = [key for key in missing if key not in values]
+        if absent:
+            stored = dict(KVStoreModel.objects.filter(
+                key__in=absent).values_list('key', 'value'))
+            values.update(stored)
+            self.cache.set_many(
+                {key: stored.get(key, cached_db_kvstore.EMPTY_VALUE)
+                 for key in absent},
+                thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+        self.lru.update({key: value for key, value in values.items()
+                         if value != cached_db_kvstore.EMPTY_VALUE})
+
+    def clear(self, delete_thumbnails=False):
+        self.lru.clear()
+        super().clear(delete_thumbnails)
+
+    def _get_raw(self, key):
+        value = self.lru.get(key)
+        if value is None:
+            value = super()._get_raw(key)
+            if value is not None:
+                self.lru.update({key: value})
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self.lru.update({key: value})
+
+    def _delete_raw(self, *keys):
+        self.lru.discard(*keys)
+        super()._delete_raw(*keys)
@@ -0,0 +1,104 @@
+import datetime
+import json
+import platform
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (override_settings, setup_databases,
+                               teardown_databases)
+
+from core.benchmark import measure
+from posts.benchmarks import scenarios
+from posts.synthetic import generate, Plan
+
+UNTIL = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def private_caches():
+    """Кэши замера: те же уровни, что в бою, но общий уровень - в памяти.
+
+    Иначе замер читал бы страницы и фрагменты работающего сайта из
+    общего кэша хоста, а flush и cache.clear() стирали бы их.
+    """
+    return {
+        'default': {**settings.CACHES['default'], 'LOCATION': 'benchmark'},
+        'benchmark': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'benchmark_views',
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = ('Замеряет представления posts на нескольких объемах данных '
+            'во временной тестовой БД и пишет отчет в JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales', type=int, nargs='+', default=[1000, 10000],
+            help='Число постов в каждом прогоне.')
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Запросов на сценарий.')
+        parser.add_argument('--warmup', type=int, default=3,
+                            help='Неучтенных запросов перед замером.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--views', nargs='*',
+                            help='Замерить только эти сценарии.')
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кэш перед каждым чтением.')
+        parser.add_argument('--output', default='benchmark.json',
+                            help='Файл отчета.')
+
+    def handle(self, *args, **options):
+        report = {
+            'meta': {
+                'created': datetime.datetime.now(
+                    datetime.timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'options': {key: options[key] for key in (
+                    'scales', 'repeat', 'warmup', 'seed', 'cold')},
+            },
+            'results': {},
+        }
+        # Замеры идут как в бою: без DEBUG и панели отладки.
+        with override_settings(DEBUG=False, CACHES=private_caches()):
+            databases = setup_databases(verbosity=0, interactive=False)
+            try:
+                report['meta']['database'] = connection.vendor
+                for scale in options['scales']:
+                    report['results'][str(scale)] = self.run_scale(
+                        scale, options)
+            finally:
+                teardown_databases(databases, verbosity=0)
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(
+            f'Отчет записан в {options["output"]}.'))
+
+    def run_scale(self, scale, options):
+        call_command('flush', interactive=False, verbosity=0)
+        generate(Plan(seed=options['seed'], posts=scale,
+                      users=max(100, scale // 50),
+                      groups=max(5, scale // 1000), until=UNTIL))
+        self.stdout.write(f'{scale} постов:')
+        results = {}
+        # Каждый сценарий вызывается еще раз для замера памяти.
+        requests = options['warmup'] + options['repeat'] + 1
+        for scenario in scenarios(cold=options['cold'], requests=requests):
+            if options['views'] and scenario.name not in options['views']:
+                continue
+            metrics = measure(scenario, repeat=options['repeat'],
+                              warmup=options['warmup'])
+            results[scenario.name] = metrics
+            self.stdout.write(
+                f'  {scenario.name:<18} p50 {metrics["p50_ms"]:>8} мс  '
+                f'p95 {metrics["p95_ms"]:>8} мс  '
+                f'p99 {metrics["p99_ms"]:>8} мс  '
+                f'SQL {metrics["queries"]:>3} / {metrics["sql_ms"]} мс  '
+                f'шаблоны {metrics["template_ms"]} мс  '
+                f'память {metrics["peak_kb"]} КБ')
+        return results
@@ -0,0 +1,98 @@
+import datetime
+import os
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import timeline
+from posts.synthetic import default_until, generate, Plan
+
+
+class Command(BaseCommand):
+    help = ('Создает синтетических пользователей, группы, посты, '
+            'комментарии и подписки для нагрузочных замеров.')
+
+    def add_arguments(self, parser):
+        defaults = Plan()
+        parser.add_argument('--seed', type=int, default=defaults.seed,
+                            help='Зерно: с ним результат воспроизводим.')
+        parser.add_argument('--users', type=int, default=defaults.users)
+        parser.add_argument('--groups', type=int, default=defaults.groups)
+        parser.add_argument('--posts', type=int, default=defaults.posts)
+        parser.add_argument(
+            '--follows-per-user', type=float,
+            default=defaults.follows_per_user,
+            help='Среднее число подписок пользователя.')
+        parser.add_argument(
+            '--comments-per-post', type=float,
+            default=defaults.comments_per_post,
+            help='Среднее число комментариев поста.')
+        parser.add_argument(
+            '--author-skew', type=float, default=defaults.author_skew,
+            help='Показатель степенного закона активности авторов.')
+        parser.add_argument(
+            '--follow-skew', type=float, default=defaults.follow_skew,
+            help='Показатель степенного закона числа подписчиков.')
+        parser.add_argument(
+            '--group-skew', type=float, default=defaults.group_skew,
+            help='Показатель степенного закона популярности групп.')
+        parser.add_argument(
+            '--ungrouped', type=float, default=defaults.ungrouped,
+            help='Доля постов без группы.')
+        parser.add_argument(
+            '--thread-alpha', type=float, default=defaults.thread_alpha,
+            help='Хвост Парето длины веток комментариев (> 1).')
+        parser.add_argument(
+            '--max-thread', type=int, default=defaults.max_thread,
+            help='Предел длины одной ветки.')
+        parser.add_argument(
+            '--days', type=int, default=defaults.days,
+            help='За сколько дней до --until распределены посты.')
+        parser.add_argument(
+            '--until', type=datetime.datetime.fromisoformat,
+            help='Дата последнего поста (ISO 8601); '
+                 'по умолчанию полночь UTC сегодня.')
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='Число процессов; 1 - без пула. В SQLite пула нет.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=defaults.chunk_size,
+            help='Сколько постов создает один процесс за задание.')
+        parser.add_argument(
+            '--batch-size', type=int, default=defaults.batch_size,
+            help='Сколько строк копить в памяти перед bulk_create.')
+        parser.add_argument(
+            '--skip-timelines', action='store_true',
+            help='Не пересобирать ленты подписок.')
+
+    def handle(self, *args, **options):
+        if options['thread_alpha'] <= 1:
+            raise CommandError('--thread-alpha должен быть больше 1.')
+        until = options['until'] or default_until()
+        if until.tzinfo is None:
+            until = until.replace(tzinfo=datetime.timezone.utc)
+        plan = Plan(
+            until=until,
+            **{field: options[field] for field in (
+                'seed', 'users', 'groups', 'posts', 'follows_per_user',
+                'comments_per_post', 'author_skew', 'follow_skew',
+                'group_skew', 'ungrouped', 'thread_alpha', 'max_thread',
+                'days', 'chunk_size', 'batch_size')})
+        self.verbosity = options['verbosity']
+        started = time.monotonic()
+        created = generate(plan, options['processes'],
+                           progress=self.progress)
+        self.stdout.write(', '.join(
+            f'{kind}: {count}' for kind, count in created.items()))
+        if not options['skip_timelines']:
+            timeline.rebuild()
+            self.stdout.write('Ленты подписок пересобраны.')
+        # bulk_create не вызывает сигналы: закэшированные ленты устарели.
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с.'))
+
+    def progress(self, kind):
+        if self.verbosity > 1:
+            self.stdout.write(f'{kind}: кусок готов')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts.thumbnails import generate_pending
+
+
+class Command(BaseCommand):
+    help = ('Ставит в очередь задачи на миниатюры картинок, для которых '
+            'их еще нет (например, после исчерпанных повторов).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='Сколько файлов поставить в очередь.')
+
+    def handle(self, *args, **options):
+        queued = generate_pending(options['limit'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Поставлено в очередь файлов: {queued}.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts.middleware import page_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кэша страниц по представлениям.'
+
+    def handle(self, *args, **options):
+        for view_name, counts in page_cache_stats().items():
+            total = counts['hit'] + counts['miss']
+            ratio = counts['hit'] / total if total else 0
+            self.stdout.write(
+                f'{view_name}: попаданий {counts["hit"]}, '
+                f'промахов {counts["miss"]}, доля попаданий {ratio:.0%}')
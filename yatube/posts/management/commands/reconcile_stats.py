@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.stats import reconcile_comments_count, reconcile_stats
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счетчики постов и подписок пользователей '
+            'и комментариев постов.')
+
+    def handle(self, *args, **options):
+        fixed = reconcile_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счетчиков пользователей: {fixed}.'))
+        fixed = reconcile_comments_count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счетчиков комментариев: {fixed}.'))
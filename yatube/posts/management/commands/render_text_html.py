@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Comment, Post, render_text
+
+
+class Command(BaseCommand):
+    help = ('Заполняет готовый HTML текста постов и комментариев '
+            'порциями по первичному ключу.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько записей обновлять за один запрос.')
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перерисовать все записи, а не только пустые.')
+
+    def handle(self, *args, **options):
+        for model in (Post, Comment):
+            rendered = self.backfill(model, options['batch_size'],
+                                     options['all'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: '
+                f'обновлено {rendered}.'))
+
+    def backfill(self, model, batch_size, everything):
+        # bulk_update не трогает Post.updated: HTML совпадает с тем, что
+        # рисовал фильтр linebreaks, и кэш карточек остается верным.
+        queryset = model.objects.order_by('pk').only('pk', 'text')
+        if not everything:
+            queryset = queryset.filter(text_html='')
+        rendered, last_pk = 0, 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return rendered
+            for obj in batch:
+                obj.text_html = render_text(obj.text)
+            model.objects.bulk_update(batch, ['text_html'])
+            rendered += len(batch)
+            last_pk = batch[-1].pk
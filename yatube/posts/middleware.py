@@ -0,0 +1,138 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import Resolver404, resolve
+
+from .cache import get_versions, NAMES_SCOPE, versioned_key
+
+logger = logging.getLogger(__name__)
+
+# Страницы, которые кэшируются целиком, и области, запись в которые
+# их сбрасывает (см. posts.signals).
+PAGE_SCOPES = {
+    'posts:index': lambda kwargs: ('index',),
+    'posts:group_list': lambda kwargs: (f'group:{kwargs["slug"]}',),
+    'posts:profile': lambda kwargs: (f'author:{kwargs["username"]}',),
+    'posts:post_detail': lambda kwargs: (f'post:{kwargs["post_id"]}',),
+    'posts:post_comments': lambda kwargs: (f'post:{kwargs["post_id"]}',),
+}
+
+STATS_KEY = 'pagecache:{}:{}'
+# Как часто процесс сбрасывает свои счетчики в общий кэш, секунды.
+STATS_INTERVAL = 1.0
+
+
+class _Counts:
+    """Счетчики попаданий процесса: отдача из кэша ничего в него не пишет."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.flushed = time.monotonic()
+
+    def add(self, view_name, outcome):
+        now = time.monotonic()
+        with self.lock:
+            self.counts[view_name, outcome] += 1
+            if now - self.flushed < STATS_INTERVAL:
+                return
+        self.flush(now)
+
+    def flush(self, now):
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            self.flushed = now
+        for (view_name, outcome), count in counts.items():
+            key = STATS_KEY.format(outcome, view_name)
+            cache.add(key, 0, None)
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                pass
+
+
+_counts = _Counts()
+
+
+def page_depends_on(request, *scopes):
+    """Отмечает области, которых нет в URL, но от которых зависит страница.
+
+    Страница из кэша отдается, только пока их поколения не сменились.
+    """
+    request.page_versions = dict(zip(scopes, get_versions(*scopes)))
+
+
+def page_cache_stats():
+    """Попадания и промахи кэша страниц по именам представлений.
+
+    Другие процессы сбрасывают свои счетчики не чаще раза в STATS_INTERVAL
+    и только при очередном запросе, поэтому их данные могут отставать.
+    """
+    _counts.flush(time.monotonic())
+    keys = {(view_name, outcome): STATS_KEY.format(outcome, view_name)
+            for view_name in PAGE_SCOPES for outcome in ('hit', 'miss')}
+    values = cache.get_many(keys.values())
+    return {
+        view_name: {outcome: values.get(keys[view_name, outcome], 0)
+                    for outcome in ('hit', 'miss')}
+        for view_name in PAGE_SCOPES
+    }
+
+
+class AnonymousPageCacheMiddleware:
+    """Отдает страницы анонимам из кэша, не трогая сессию, ORM и шаблоны.
+
+    Стоит перед SessionMiddleware. Ключ - URL и поколения областей
+    страницы, поэтому запись, затрагивающая страницу, сразу ее сбрасывает.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        view_name, scopes = self.page_scopes(request)
+        if scopes is None:
+            return self.get_response(request)
+        digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        key = f'page:{versioned_key(*scopes)}:{digest}'
+        response, versions = cache.get(key, (None, None))
+        if response is not None and self.fresh(versions):
+            _counts.add(view_name, 'hit')
+            logger.debug('page cache hit %s %s', view_name, request.path)
+            response['X-Page-Cache'] = 'HIT'
+            return response
+        response = self.get_response(request)
+        if response.status_code == 200 and not response.cookies:
+            versions = getattr(request, 'page_versions', {})
+            cache.set(key, (response, versions), settings.PAGE_CACHE_TIMEOUT)
+        _counts.add(view_name, 'miss')
+        logger.debug('page cache miss %s %s', view_name, request.path)
+        response['X-Page-Cache'] = 'MISS'
+        return response
+
+    @staticmethod
+    def fresh(versions):
+        return not versions or get_versions(*versions) == list(
+            versions.values())
+
+    def page_scopes(self, request):
+        if (request.method not in ('GET', 'HEAD')
+                or settings.SESSION_COOKIE_NAME in request.COOKIES):
+            return None, None
+        # Тем, кому показывается debug_toolbar, нужна живая страница.
+        if (settings.DEBUG
+                and request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS):
+            return None, None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None, None
+        scopes = PAGE_SCOPES.get(match.view_name)
+        if scopes is None:
+            return None, None
+        return match.view_name, (NAMES_SCOPE, *scopes(match.kwargs))
@@ -0,0 +1,77 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    # То же, что rebuild_timelines, но на моделях миграции: авторы с
+    # большим числом подписчиков - в режиме pull, посты остальных
+    # раскладываются по лентам одним INSERT ... SELECT.
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    PullAuthor = apps.get_model('posts', 'PullAuthor')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    popular = Follow.objects.values('author_id').annotate(
+        followers=models.Count('pk')).filter(
+        followers__gt=settings.TIMELINE_FANOUT_LIMIT).order_by()
+    PullAuthor.objects.bulk_create(
+        PullAuthor(author_id=row['author_id']) for row in popular)
+    entry, post, follow, pull = (TimelineEntry._meta, Post._meta,
+                                 Follow._meta, PullAuthor._meta)
+    columns = ', '.join(entry.get_field(name).column for name in (
+        'user', 'post', 'author', 'pub_date'))
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {entry.db_table} ({columns}) '
+            f'SELECT f.user_id, p.{post.pk.column}, p.author_id, p.pub_date '
+            f'FROM {follow.db_table} f JOIN {post.db_table} p '
+            f'ON p.author_id = f.author_id '
+            f'WHERE f.author_id NOT IN '
+            f'(SELECT author_id FROM {pull.db_table})')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0011_auto_20230305_2040'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PullAuthor',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pull_mode', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Автор без рассылки',
+                'verbose_name_plural': 'Авторы без рассылки',
+            },
+        ),
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post', verbose_name='Пост')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи лент',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
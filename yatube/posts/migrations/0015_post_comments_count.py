@@ -0,0 +1,31 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:48
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_comments_count(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Post.objects.update(comments_count=Coalesce(
+        models.Subquery(
+            Comment.objects.filter(post=models.OuterRef('pk')).order_by()
+            .values('post').annotate(total=models.Count('pk'))
+            .values('total')),
+        0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_userstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.RunPython(fill_comments_count, migrations.RunPython.noop),
+    ]
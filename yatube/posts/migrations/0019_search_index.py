@@ -0,0 +1,54 @@
+from django.db import migrations
+
+INDEXES = (
+    ('posts_post_fts', 'posts_post'),
+    ('posts_comment_fts', 'posts_comment'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    # FTS5 есть только в SQLite; на других СУБД поиск не включается.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for index, table in INDEXES:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {index} USING fts5(text, "
+            f"content='{table}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2')")
+        schema_editor.execute(
+            f"CREATE TRIGGER {index}_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {index}(rowid, text) VALUES (new.id, new.text); "
+            f"END")
+        schema_editor.execute(
+            f"CREATE TRIGGER {index}_delete AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {index}({index}, rowid, text) "
+            f"VALUES ('delete', old.id, old.text); END")
+        schema_editor.execute(
+            f"CREATE TRIGGER {index}_update AFTER UPDATE OF text ON {table} "
+            f"BEGIN "
+            f"INSERT INTO {index}({index}, rowid, text) "
+            f"VALUES ('delete', old.id, old.text); "
+            f"INSERT INTO {index}(rowid, text) VALUES (new.id, new.text); "
+            f"END")
+        schema_editor.execute(
+            f"INSERT INTO {index}({index}) VALUES ('rebuild')")
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for index, table in INDEXES:
+        for action in ('insert', 'delete', 'update'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {index}_{action}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {index}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_storedimage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
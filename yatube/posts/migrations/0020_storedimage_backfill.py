@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+def fill_stored_images(apps, schema_editor):
+    # Картинки, загруженные до подсчета ссылок: без строки StoredImage
+    # generate_thumbnails не создал бы для них миниатюр, и в ленте
+    # навсегда остался бы оригинал.
+    Post = apps.get_model('posts', 'Post')
+    StoredImage = apps.get_model('posts', 'StoredImage')
+    images = Post.objects.exclude(image='').exclude(
+        image__isnull=True).values('image').annotate(
+        total=models.Count('pk')).order_by()
+    StoredImage.objects.bulk_create(
+        (StoredImage(name=row['image'], references=row['total'])
+         for row in images),
+        batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_stored_images, migrations.RunPython.noop),
+    ]
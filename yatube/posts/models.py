@@ -1,10 +1,37 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils.html import linebreaks
+
+from .storage import content_storage
 
 User = get_user_model()
 
 
+def render_text(text):
+    """HTML текста поста или комментария, как у фильтра linebreaks."""
+    return linebreaks(text, autoescape=True)
+
+
+class RenderedTextModel(models.Model):
+    """Хранит готовый HTML поля text, чтобы не рендерить его при показе."""
+    text_html = models.TextField(
+        verbose_name='HTML текста',
+        blank=True,
+        editable=False,
+    )
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        self.text_html = render_text(self.text)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'text' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'text_html'}
+        super().save(*args, **kwargs)
+
+
 class Group(models.Model):
     title = models.CharField(
         verbose_name='Название группы',
@@ -26,7 +53,7 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class Post(RenderedTextModel):
     text = models.TextField(
         verbose_name='Текст поста',
         help_text='Введите текст поста'
@@ -35,6 +62,11 @@ class Post(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    # Ревизия поста: по ней сбрасывается кэш его HTML.
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -54,20 +86,39 @@ class Post(models.Model):
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='posts/',
+        storage=content_storage,
         blank=True,
         help_text='Выберите файл с картинкой',
     )
+    # Хранится в посте, чтобы ленты не считали комментарии запросами.
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Комментариев',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('-pub_date', '-id')
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Индексы повторяют фильтр и сортировку лент: главной, группы
+        # и профиля.
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+            # Посты файла, которым обновить ревизию после миниатюр.
+            models.Index(fields=['image'], name='post_image_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.text[:settings.POST_FIRST_CHARS]
 
 
-class Comment(models.Model):
+class Comment(RenderedTextModel):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -93,6 +144,10 @@ class Comment(models.Model):
         ordering = ('-created',)
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'],
+                         name='comment_post_created_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.text[:settings.POST_FIRST_CHARS]
@@ -121,6 +176,134 @@ class Follow(models.Model):
             models.CheckConstraint(name='prevent_self_follow',
                                    check=~models.Q(user=models.F('author')))
         ]
+        # unique_follow начинается с author и не помогает искать
+        # подписки пользователя.
+        indexes = [
+            models.Index(fields=['user', 'author'],
+                         name='follow_user_author_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'{self.user.username} -> {self.author.username}'
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    # Автор и дата поста повторены здесь, чтобы лента читалась и
+    # чистилась по индексу без соединения с таблицей постов.
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_pub_date_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user_id} <- {self.post_id}'
+
+
+class PullAuthor(models.Model):
+    """Автор со слишком большим числом подписчиков для рассылки постов.
+
+    Его посты не раскладываются по лентам, а подмешиваются при чтении.
+    """
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='pull_mode',
+        verbose_name='Автор'
+    )
+
+    class Meta:
+        verbose_name = 'Автор без рассылки'
+        verbose_name_plural = 'Авторы без рассылки'
+
+    def __str__(self) -> str:
+        return str(self.author_id)
+
+
+class UserStats(models.Model):
+    """Счетчики пользователя для профиля и страницы поста."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Постов',
+        default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Подписок',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'Счетчики пользователя'
+        verbose_name_plural = 'Счетчики пользователей'
+
+    def __str__(self) -> str:
+        return str(self.user_id)
+
+
+class StoredImage(models.Model):
+    """Число постов, ссылающихся на файл картинки.
+
+    Файлы одинаковых картинок общие (см. posts.storage), поэтому файл
+    удаляется, только когда ссылок не осталось.
+    """
+    name = models.CharField(
+        verbose_name='Файл',
+        max_length=100,
+        primary_key=True
+    )
+    references = models.PositiveIntegerField(
+        verbose_name='Ссылок',
+        default=0
+    )
+    # Миниатюры создает отдельный процесс: manage.py generate_thumbnails.
+    thumbnails_ready = models.BooleanField(
+        verbose_name='Миниатюры созданы',
+        default=False
+    )
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self) -> str:
+        return self.name
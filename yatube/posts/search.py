@@ -0,0 +1,119 @@
+import re
+
+from django.db import connection
+from django.utils.html import escape
+
+from .models import Post
+from .utils import CursorPaginator
+
+# Таблицы FTS5 и триггеры, которые их наполняют, - в миграции 0019.
+POST_INDEX = 'posts_post_fts'
+COMMENT_INDEX = 'posts_comment_fts'
+
+MAX_TERMS = 10
+# Маркеры подсветки не встречаются в тексте и переживают escape().
+MARK_START, MARK_END = '\x02', '\x03'
+SNIPPET_TOKENS = 24
+
+
+def match_expression(query):
+    """Запрос пользователя как выражение FTS5 MATCH или None.
+
+    Слова берутся в кавычки, поэтому синтаксис FTS5 (OR, NEAR, *)
+    из ввода не исполняется; последнее слово ищется как префикс.
+    """
+    terms = re.findall(r'\w+', query)[:MAX_TERMS]
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search_queryset(queryset, index, query):
+    """queryset, суженный до строк, которые индекс index находит по query."""
+    expression = match_expression(query)
+    if expression is None:
+        return queryset.none()
+    # pk__in=RawSQL(...) дает "IN ((SELECT ...))": скалярный подзапрос,
+    # который вернул бы только первую найденную строку.
+    column = f'"{queryset.model._meta.db_table}"."id"'
+    return queryset.extra(
+        where=[f'{column} IN (SELECT rowid FROM {index} '
+               f'WHERE {index} MATCH %s)'],
+        params=[expression])
+
+
+def highlight(snippet):
+    return (escape(snippet).replace(MARK_START, '<mark>')
+            .replace(MARK_END, '</mark>'))
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорная выдача поиска по постам в порядке BM25.
+
+    Ключ страницы - (rank, id): следующая страница продолжается после
+    последнего результата, сниппеты строятся только для строк страницы.
+    """
+
+    ordering = ('rank', 'id')
+
+    def __init__(self, query, per_page, **kwargs):
+        super().__init__(Post.objects.all(), per_page, **kwargs)
+        self.query = query
+        self.expression = match_expression(query)
+
+    def cursor_value(self, field, value):
+        if field == 'rank':
+            return float(value)
+        return super().cursor_value(field, value)
+
+    def fetch(self, values, reverse, limit):
+        if self.expression is None:
+            return []
+        sql = (f'SELECT id, rank FROM (SELECT rowid AS id, '
+               f'bm25({POST_INDEX}) AS rank FROM {POST_INDEX} '
+               f'WHERE {POST_INDEX} MATCH %s)')
+        params = [self.expression]
+        order = 'DESC' if reverse else 'ASC'
+        if values is not None:
+            compare = '<' if reverse else '>'
+            sql += (f' WHERE rank {compare} %s OR '
+                    f'(rank = %s AND id {compare} %s)')
+            params += [values[0], values[0], values[1]]
+        sql += f' ORDER BY rank {order}, id {order} LIMIT %s'
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            ranks = dict(cursor.fetchall())
+        if not ranks:
+            return []
+        posts = Post.objects.select_related('author', 'group').in_bulk(ranks)
+        snippets = self.snippets(list(ranks))
+        results = []
+        for pk, rank in ranks.items():
+            post = posts.get(pk)
+            if post is None:
+                continue
+            post.rank = rank
+            post.snippet = highlight(snippets.get(pk, post.text))
+            results.append(post)
+        return results
+
+    def snippets(self, ids):
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, snippet({POST_INDEX}, 0, %s, %s, %s, %s) '
+                f'FROM {POST_INDEX} WHERE {POST_INDEX} MATCH %s '
+                f'AND rowid IN ({placeholders})',
+                [MARK_START, MARK_END, '…', SNIPPET_TOKENS,
+                 self.expression, *ids])
+            return dict(cursor.fetchall())
+
+    def get_cursor_page(self, cursor=None):
+        page = super().get_cursor_page(cursor)
+        # У выдачи поиска нет «последней страницы».
+        page.last_cursor = None
+        page.query = self.query
+        return page
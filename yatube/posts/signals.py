@@ -0,0 +1,217 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import timeline
+from .cache import bump_versions, NAMES_SCOPE, post_scopes
+from .images import release_image, retain_image
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .stats import change_comments_count, change_stats
+
+
+@receiver((post_save, post_delete), sender=Post)
+@receiver((post_save, post_delete), sender=Follow)
+def feeds_changed(**kwargs):
+    """Сбрасывает закэшированные размеры лент."""
+    bump_versions('feeds')
+
+
+@receiver(post_save, sender=Post)
+def post_saved(instance, created, **kwargs):
+    # Правка не меняет ни автора, ни даты: ленты уже верны.
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(instance, **kwargs):
+    timeline.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=User)
+def user_created(instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_counted(instance, created, **kwargs):
+    if created:
+        change_stats(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def post_uncounted(instance, **kwargs):
+    change_stats(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_counted(instance, created, **kwargs):
+    if created:
+        change_stats(instance.author_id, followers_count=1)
+        change_stats(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_uncounted(instance, **kwargs):
+    change_stats(instance.author_id, followers_count=-1)
+    change_stats(instance.user_id, following_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_counted(instance, created, **kwargs):
+    if created:
+        change_comments_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_uncounted(instance, **kwargs):
+    change_comments_count(instance.post_id, -1)
+
+
+@receiver(pre_save, sender=Post)
+def post_group_remembered(instance, **kwargs):
+    # Пост может уйти из группы - ее ленту тоже нужно сбросить,
+    # а у замененной картинки - удалить миниатюры.
+    instance._previous_group_slug = instance._previous_image = None
+    # Содержимое новой загрузки - на случай, если файл придется
+    # восстановить (см. retain_image).
+    instance._image_upload = (
+        None if instance.image._committed else instance.image.file)
+    if instance.pk:
+        instance._previous_group_slug, instance._previous_image = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                'group__slug', 'image').first() or (None, None))
+
+
+@receiver(post_save, sender=Post)
+def post_image_replaced(instance, **kwargs):
+    previous = getattr(instance, '_previous_image', None)
+    if previous == (instance.image.name or None):
+        return
+    if instance.image:
+        retain_image(instance.image.name,
+                     getattr(instance, '_image_upload', None))
+    if previous:
+        release_image(previous)
+
+
+@receiver(post_delete, sender=Post)
+def post_image_deleted(instance, **kwargs):
+    if instance.image:
+        release_image(instance.image.name)
+
+
+# Пользователи, которых сейчас удаляют вместе с постами, подписками и
+# комментариями. Кэш для всего каскада сбрасывается один раз, а строки
+# каскада не ищут в базе имена авторов и названия групп.
+_cascade = threading.local()
+
+
+def _deleting_users():
+    # Вне транзакции удаления (например, после ее отката) отметки
+    # устарели.
+    users = getattr(_cascade, 'users', None)
+    if users is None or not transaction.get_connection().in_atomic_block:
+        users = _cascade.users = set()
+    return users
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(instance, **kwargs):
+    # Посты и комментарии пользователя пропадают со многих страниц:
+    # проще сменить поколение NAMES_SCOPE, которое входит в каждый ключ.
+    _deleting_users().add(instance.pk)
+    bump_versions(NAMES_SCOPE, 'feeds')
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(instance, **kwargs):
+    _deleting_users().discard(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=Post)
+def post_cache_expired(instance, **kwargs):
+    if instance.author_id in _deleting_users():
+        return
+    slugs = {getattr(instance, '_previous_group_slug', None)}
+    if instance.group_id:
+        slugs.add(instance.group.slug)
+    bump_versions(*post_scopes(instance.pk, instance.author.username, slugs))
+    timeline.touch(instance.author_id)
+
+
+@receiver((post_save, post_delete), sender=Comment)
+def comment_cache_expired(instance, **kwargs):
+    if instance.author_id in _deleting_users():
+        return
+    # Число комментариев видно в лентах, поэтому сбрасываются и они.
+    post = Post.objects.filter(pk=instance.post_id).values(
+        'author_id', 'author__username', 'group__slug').first()
+    if post is None:
+        return
+    bump_versions(*post_scopes(instance.post_id, post['author__username'],
+                               {post['group__slug']}))
+    timeline.touch(post['author_id'])
+
+
+def _usernames(instance, *fields):
+    """Имена пользователей из полей fields: незагруженные - одним запросом."""
+    usernames, missing = [], []
+    for field in fields:
+        if getattr(type(instance), field).is_cached(instance):
+            usernames.append(getattr(instance, field).username)
+        else:
+            missing.append(getattr(instance, f'{field}_id'))
+    if missing:
+        usernames += User.objects.filter(pk__in=missing).values_list(
+            'username', flat=True)
+    return usernames
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def follow_cache_expired(instance, **kwargs):
+    if {instance.user_id, instance.author_id} & _deleting_users():
+        return
+    bump_versions(f'follower:{instance.user_id}',
+                  *(f'author:{username}' for username
+                    in _usernames(instance, 'user', 'author')))
+
+
+@receiver((post_save, post_delete), sender=Group)
+def group_cache_expired(**kwargs):
+    # Название группы есть на карточках всех лент, а при удалении группы
+    # посты теряют ее без сигналов (SET_NULL) - сбрасываются все страницы.
+    bump_versions(NAMES_SCOPE, 'feeds')
+
+
+# Поля пользователя, которые показываются на карточках постов.
+USER_NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def user_name_remembered(instance, update_fields=None, **kwargs):
+    # Вход сохраняет только last_login - лишний запрос ни к чему.
+    instance._name_changed = False
+    if not instance.pk or (update_fields is not None and not set(
+            update_fields) & set(USER_NAME_FIELDS)):
+        return
+    previous = User.objects.filter(pk=instance.pk).values_list(
+        *USER_NAME_FIELDS).first()
+    current = tuple(getattr(instance, field) for field in USER_NAME_FIELDS)
+    instance._name_changed = previous is not None and previous != current
+
+
+@receiver(post_save, sender=User)
+def user_cache_expired(instance, **kwargs):
+    if getattr(instance, '_name_changed', False):
+        bump_versions(NAMES_SCOPE, f'author:{instance.username}')
@@ -0,0 +1,67 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserStats
+
+STATS_FIELDS = {
+    'posts_count': (Post, 'author'),
+    'followers_count': (Follow, 'author'),
+    'following_count': (Follow, 'user'),
+}
+
+
+def change_stats(user_id, **deltas):
+    """Сдвигает счетчики пользователя на deltas одним UPDATE."""
+    with transaction.atomic():
+        updated = UserStats.objects.filter(user_id=user_id).update(
+            **{field: F(field) + delta for field, delta in deltas.items()})
+        # Строки нет (пользователь старше счетчиков) - считаем заново,
+        # но только при добавлении: при удалении пользователя она не нужна.
+        if not updated and any(delta > 0 for delta in deltas.values()):
+            reconcile_stats(User.objects.filter(pk=user_id))
+
+
+def _real_count(model, field, outer='user'):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef(outer)}).order_by()
+        .values(field).annotate(total=Count('pk')).values('total')), 0)
+
+
+def reconcile_stats(users=None):
+    """Пересчитывает расходящиеся счетчики; возвращает число исправленных."""
+    if users is None:
+        users = User.objects.all()
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk) for pk in users.filter(
+            stats__isnull=True).values_list('pk', flat=True).iterator()),
+        batch_size=1000, ignore_conflicts=True)
+    stats = UserStats.objects.filter(user__in=users).annotate(**{
+        f'real_{field}': _real_count(model, lookup)
+        for field, (model, lookup) in STATS_FIELDS.items()
+    }).exclude(**{field: F(f'real_{field}') for field in STATS_FIELDS})
+    fixed = 0
+    for row in stats.iterator():
+        for field in STATS_FIELDS:
+            setattr(row, field, getattr(row, f'real_{field}'))
+        row.save(update_fields=list(STATS_FIELDS))
+        fixed += 1
+    return fixed
+
+
+def change_comments_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F('comments_count') + delta)
+
+
+def reconcile_comments_count():
+    """Пересчитывает расходящиеся счетчики комментариев постов."""
+    posts = Post.objects.annotate(
+        real_count=_real_count(Comment, 'post', 'pk')
+    ).exclude(comments_count=F('real_count'))
+    fixed = 0
+    for post_id, real_count in posts.values_list(
+            'pk', 'real_count').iterator():
+        Post.objects.filter(pk=post_id).update(comments_count=real_count)
+        fixed += 1
+    return fixed
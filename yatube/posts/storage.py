@@ -0,0 +1,56 @@
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит файлы под именем из хеша содержимого.
+
+    Одинаковые загрузки становятся одним файлом (и одним набором
+    миниатюр sorl, который привязан к имени файла). Удалять такой файл
+    можно только после последней ссылки - см. StoredImage.
+    """
+
+    name_re = re.compile(r'(.*/)?([0-9a-f]{2})/\2[0-9a-f]{62}(\.\w+)?')
+
+    def owns(self, name):
+        """Назван ли файл этим хранилищем (а не присвоен готовым путем)."""
+        return bool(name) and self.name_re.fullmatch(name) is not None
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def restore(self, name, content):
+        """Записывает файл под прежним именем, если его успели удалить."""
+        if self.exists(name):
+            return
+        saved = self._save(name, content)
+        if saved != name:
+            # Параллельный запрос записал файл раньше - копия не нужна.
+            self.delete(saved)
+
+
+content_storage = ContentAddressedStorage()
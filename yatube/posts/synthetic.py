@@ -0,0 +1,367 @@
+"""Синтетические данные для нагрузочных замеров (manage.py generate_data).
+
+Строки пишутся bulk_create порциями в пуле процессов (в SQLite, где
+пишет один процесс за раз, - в текущем). Работа делится на
+куски с явными первичными ключами и собственным генератором случайных
+чисел от (seed, вид, номер куска), поэтому результат не зависит от
+числа процессов и порядка, в котором они берут куски.
+
+Перекосы как в жизни: популярность авторов (подписчики, число постов)
+и групп распределена по степенному закону, у большинства постов нет
+комментариев, а у немногих - длинные ветки.
+"""
+import contextlib
+import datetime
+import multiprocessing
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import Max
+
+from .models import Comment, Follow, Group, Post, render_text, User, UserStats
+from .search import COMMENT_INDEX, POST_INDEX
+
+WORDS = (
+    'кот пес лес дом река город утро вечер дорога письмо книга окно '
+    'чай снег дождь солнце ветер море поле сад мост школа работа друг '
+    'новый старый большой тихий быстрый яркий теплый холодный далекий '
+    'идет видит пишет читает думает ждет любит помнит знает строит '
+    'сегодня вчера завтра всегда снова почти очень вместе рядом потом'
+).split()
+
+# Простые числа больше любого числа строк: умножение на них по модулю n
+# переставляет ранги, и популярными оказываются не первые ключи подряд.
+# У популярности и активности перестановки разные: иначе самый читаемый
+# автор писал бы и больше всех, и ленты подписок разрастались бы на
+# порядки сильнее, чем в жизни.
+SCATTER = {
+    'popular': 2_147_483_647,
+    'active': 1_000_000_007,
+    'group': 2_147_483_647,
+}
+
+
+@dataclass(frozen=True)
+class Plan:
+    """Параметры генерации; общие для всех процессов пула."""
+    seed: int = 0
+    users: int = 1000
+    groups: int = 50
+    posts: int = 100_000
+    follows_per_user: float = 20
+    comments_per_post: float = 2
+    author_skew: float = 1.0
+    follow_skew: float = 1.1
+    group_skew: float = 1.2
+    ungrouped: float = 0.3
+    thread_alpha: float = 1.5
+    max_thread: int = 5000
+    days: int = 365
+    until: datetime.datetime = None
+    chunk_size: int = 50_000
+    batch_size: int = 5000
+    first_user: int = 1
+    first_group: int = 1
+    first_post: int = 1
+
+
+def power_law_rank(rng, n, exponent):
+    """Ранг из [0, n) с вероятностью ~ 1 / (ранг + 1) ** exponent.
+
+    Обратная функция непрерывного распределения: O(1) на выборку
+    без таблицы весов размером n.
+    """
+    u = rng.random()
+    if abs(exponent - 1) < 1e-9:
+        x = (n + 1) ** u
+    else:
+        a = 1 - exponent
+        x = (1 + u * ((n + 1) ** a - 1)) ** (1 / a)
+    return min(int(x) - 1, n - 1)
+
+
+def scatter(rank, n, kind):
+    return rank * SCATTER[kind] % n
+
+
+def heavy_tail(rng, mean, alpha, limit):
+    """Целое с тяжелым хвостом (Парето) и заданным средним."""
+    value = mean * (alpha - 1) * (rng.paretovariate(alpha) - 1)
+    return min(int(value), limit)
+
+
+def sentence(rng, low, high):
+    words = rng.choices(WORDS, k=rng.randint(low, high))
+    return ' '.join(words).capitalize() + '.'
+
+
+def text(rng, low=3, high=12):
+    paragraphs = []
+    for _ in range(1 + (rng.random() < 0.2)):
+        paragraphs.append(' '.join(
+            sentence(rng, low, high) for _ in range(rng.randint(1, 4))))
+    return '\n\n'.join(paragraphs)
+
+
+def chunk_rng(plan, kind, index):
+    # Строковое зерно хешируется sha512 и не зависит от PYTHONHASHSEED.
+    return random.Random(f'{plan.seed}:{kind}:{index}')
+
+
+@contextlib.contextmanager
+def explicit_dates(*fields):
+    """Отключает auto_now/auto_now_add у fields, чтобы записать свои даты."""
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def user_id(plan, rng, exponent, kind):
+    rank = power_law_rank(rng, plan.users, exponent)
+    return plan.first_user + scatter(rank, plan.users, kind)
+
+
+def make_users(plan, index, start, stop):
+    User.objects.bulk_create([
+        User(pk=pk, username=f'user{pk}', first_name='Пользователь',
+             last_name=str(pk), password=UNUSABLE_PASSWORD_PREFIX)
+        for pk in range(start, stop)])
+    return {}
+
+
+def make_follows(plan, index, start, stop):
+    """Подписки пользователей [start, stop) на популярных авторов."""
+    rng = chunk_rng(plan, 'follows', index)
+    followers, following = Counter(), Counter()
+    batch = []
+    for pk in range(start, stop):
+        wanted = heavy_tail(rng, plan.follows_per_user, 2, plan.users - 1)
+        authors = set()
+        # Популярных авторов выбирают чаще, поэтому повторы неизбежны;
+        # попыток с запасом, чтобы не зациклиться на маленькой выборке.
+        for _ in range(wanted * 3):
+            if len(authors) >= wanted:
+                break
+            author = user_id(plan, rng, plan.follow_skew, 'popular')
+            if author != pk:
+                authors.add(author)
+        for author in sorted(authors):
+            batch.append(Follow(user_id=pk, author_id=author))
+            followers[author] += 1
+        following[pk] = len(authors)
+        if len(batch) >= plan.batch_size:
+            Follow.objects.bulk_create(batch)
+            batch = []
+    Follow.objects.bulk_create(batch)
+    return {'followers_count': followers, 'following_count': following}
+
+
+def make_posts(plan, index, start, stop):
+    """Посты [start, stop) вместе с их комментариями.
+
+    Даты растут вместе с ключом, как у настоящих записей; comments_count
+    известен сразу, потому что ветка пишется тем же процессом.
+    """
+    rng = chunk_rng(plan, 'posts', index)
+    until = plan.until
+    span = datetime.timedelta(days=plan.days).total_seconds()
+    posts_count = Counter()
+    posts, comments = [], []
+    fields = [Post._meta.get_field('pub_date'),
+              Post._meta.get_field('updated'),
+              Comment._meta.get_field('created')]
+    with explicit_dates(*fields):
+        for pk in range(start, stop):
+            position = (pk - plan.first_post + rng.random()) / plan.posts
+            pub_date = until - datetime.timedelta(
+                seconds=span * (1 - position))
+            author = user_id(plan, rng, plan.author_skew, 'active')
+            group = None
+            if plan.groups and rng.random() >= plan.ungrouped:
+                rank = power_law_rank(rng, plan.groups, plan.group_skew)
+                group = plan.first_group + scatter(
+                    rank, plan.groups, 'group')
+            thread = heavy_tail(rng, plan.comments_per_post,
+                                plan.thread_alpha, plan.max_thread)
+            body = text(rng)
+            posts.append(Post(
+                pk=pk, text=body, text_html=render_text(body),
+                author_id=author, group_id=group, pub_date=pub_date,
+                updated=pub_date, comments_count=thread))
+            posts_count[author] += 1
+            created = pub_date
+            for _ in range(thread):
+                created += datetime.timedelta(
+                    seconds=rng.expovariate(1 / 600))
+                body = text(rng, 2, 8)
+                comments.append(Comment(
+                    post_id=pk, text=body, text_html=render_text(body),
+                    author_id=user_id(plan, rng, plan.author_skew,
+                                      'active'),
+                    created=created))
+            if len(posts) >= plan.batch_size:
+                Post.objects.bulk_create(posts)
+                posts = []
+            if len(comments) >= plan.batch_size:
+                Post.objects.bulk_create(posts)
+                Comment.objects.bulk_create(comments)
+                posts, comments = [], []
+        Post.objects.bulk_create(posts)
+        Comment.objects.bulk_create(comments)
+    return {'posts_count': posts_count}
+
+
+def chunks(kind, first, total, size):
+    for index, start in enumerate(range(first, first + total, size)):
+        yield kind, index, start, min(start + size, first + total)
+
+
+def run_chunk(plan, kind, index, start, stop):
+    # Кусок - одна транзакция: фиксация на каждый bulk_create дороже.
+    with transaction.atomic():
+        return KINDS[kind](plan, index, start, stop)
+
+
+KINDS = {
+    'users': make_users,
+    'follows': make_follows,
+    'posts': make_posts,
+}
+
+
+def continue_plan(plan):
+    """План с ключами после уже существующих строк."""
+    def next_pk(model):
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+    return replace(plan, first_user=next_pk(User),
+                   first_group=next_pk(Group), first_post=next_pk(Post))
+
+
+def generate(plan, processes=1, progress=None):
+    """Создает данные по plan; возвращает число строк по видам."""
+    plan = continue_plan(plan)
+    Group.objects.bulk_create(
+        Group(pk=pk, title=f'Группа {pk}', slug=f'group-{pk}',
+              description=f'Сгенерированная группа {pk}')
+        for pk in range(plan.first_group, plan.first_group + plan.groups))
+    size = plan.chunk_size
+    phases = [
+        list(chunks('users', plan.first_user, plan.users, size)),
+        # Подписки и посты ссылаются только на пользователей.
+        list(chunks('follows', plan.first_user, plan.users,
+                    max(1, size // 10)))
+        + list(chunks('posts', plan.first_post, plan.posts, size)),
+    ]
+    counters = {}
+    with _bulk_load(), _pool(processes) as submit:
+        for phase in phases:
+            for kind, result in submit(plan, phase):
+                for field, counter in result.items():
+                    counters.setdefault(field, Counter()).update(counter)
+                if progress:
+                    progress(kind)
+    _write_stats(plan, counters)
+    return {
+        'groups': plan.groups,
+        'users': plan.users,
+        'posts': plan.posts,
+        'follows': sum(counters.get('following_count', {}).values()),
+    }
+
+
+@contextlib.contextmanager
+def _pool(processes):
+    # В SQLite пишет один процесс за раз: пул только ждал бы блокировку
+    # базы, а тестовую базу в памяти процессы пула и вовсе не видят.
+    if processes <= 1 or connections['default'].vendor == 'sqlite':
+        def submit(plan, tasks):
+            for task in tasks:
+                yield task[0], run_chunk(plan, *task)
+        yield submit
+        return
+    # Пул создается форком: открытое соединение с БД наследовать нельзя.
+    connections.close_all()
+    pool = ProcessPoolExecutor(processes, multiprocessing.get_context('fork'))
+
+    def submit(plan, tasks):
+        futures = [(task[0], pool.submit(run_chunk, plan, *task))
+                   for task in tasks]
+        for kind, future in futures:
+            yield kind, future.result()
+    try:
+        yield submit
+    finally:
+        pool.shutdown()
+
+
+@contextlib.contextmanager
+def _bulk_load():
+    """Ускоряет загрузку в SQLite на время генерации.
+
+    Триггеры FTS5 снимаются, а индексы поиска перестраиваются в конце
+    одной командой 'rebuild'. Журнал ведется в памяти и без fsync:
+    при сбое теряются только сгенерированные данные. Внутри транзакции
+    (в тестах) PRAGMA не меняются - SQLite этого не позволяет.
+    """
+    connection = connections['default']
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    indexes = (POST_INDEX, COMMENT_INDEX)
+    pragmas = {}
+    with connection.cursor() as cursor:
+        if not connection.in_atomic_block:
+            for name, value in (('synchronous', 'OFF'),
+                                ('journal_mode', 'MEMORY')):
+                cursor.execute(f'PRAGMA {name}')
+                pragmas[name] = cursor.fetchone()[0]
+                cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")
+        triggers = [(name, sql) for name, sql in cursor.fetchall()
+                    if name.startswith(tuple(f'{i}_' for i in indexes))]
+        for name, _ in triggers:
+            cursor.execute(f'DROP TRIGGER {name}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for _, sql in triggers:
+                cursor.execute(sql)
+            for index in indexes:
+                cursor.execute(
+                    f"INSERT INTO {index}({index}) VALUES ('rebuild')")
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def _write_stats(plan, counters):
+    """Создает счетчики новых пользователей, собранные процессами."""
+    first, last = plan.first_user, plan.first_user + plan.users
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk, **{field: counter.get(pk, 0)
+                                  for field, counter in counters.items()})
+         for pk in range(first, last)))
+    # Явные ключи не сдвигают последовательности PostgreSQL.
+    connection = connections['default']
+    statements = connection.ops.sequence_reset_sql(
+        no_style(), [User, Group, Post])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def default_until():
+    """Полночь UTC сегодня: даты воспроизводимы в течение суток."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
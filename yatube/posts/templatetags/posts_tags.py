@@ -0,0 +1,74 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts.cache import get_versions, NAMES_SCOPE
+from posts.thumbnails import prefetch_thumbnails, ready_thumbnail
+
+register = template.Library()
+
+
+@register.filter
+def page_window(page_obj):
+    """Номера страниц паджинатора вокруг текущей страницы."""
+    window = getattr(page_obj.paginator, 'page_window', None)
+    if window is None:
+        return page_obj.paginator.page_range
+    return window(page_obj.number)
+
+
+@register.simple_tag
+def post_fragments(posts, is_profile=False, is_group=False):
+    """HTML карточек постов ленты из кэша фрагментов.
+
+    Ключ - пост, его ревизия (updated, группа и число комментариев),
+    поколение названий групп и имен авторов и вариант карточки, поэтому
+    фрагмент общий для всех лент, а правка поста сбрасывает только его.
+    Фрагменты читаются одним get_many, рендерятся только промахи.
+    """
+    variant = f'{int(is_profile)}{int(is_group)}'
+    names, = get_versions(NAMES_SCOPE)
+    keys = [
+        f'post:{post.pk}:{post.updated.timestamp()}:{post.group_id}:'
+        f'{post.comments_count}:{names}:{variant}'
+        for post in posts
+    ]
+    cached = cache.get_many(keys)
+    prefetch_thumbnails([post.image for key, post in zip(keys, posts)
+                         if key not in cached],
+                        'card', *settings.POST_IMAGE_SRCSET)
+    missing = {}
+    for key, post in zip(keys, posts):
+        if key not in cached:
+            missing[key] = render_to_string('posts/includes/post.html', {
+                'post': post,
+                'is_profile': is_profile,
+                'is_group': is_group,
+            })
+    if missing:
+        cache.set_many(missing, settings.POST_CACHE_TIMEOUT)
+        cached.update(missing)
+    return [mark_safe(cached[key]) for key in keys]
+
+
+@register.simple_tag
+def post_image(image):
+    """Адрес и srcset картинки поста из уже готовых миниатюр.
+
+    Миниатюры создаются в фоне; пока основной нет, показывается оригинал.
+    """
+    if not image:
+        return None
+    card = ready_thumbnail(image, 'card')
+    widths = {}
+    for size in settings.POST_IMAGE_SRCSET:
+        thumbnail = ready_thumbnail(image, size)
+        if thumbnail is not None:
+            widths.setdefault(thumbnail.width, thumbnail.url)
+    return {
+        'src': card.url if card is not None else image.url,
+        'srcset': ', '.join(f'{url} {width}w'
+                            for width, url in sorted(widths.items())),
+    }
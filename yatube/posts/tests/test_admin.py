@@ -0,0 +1,127 @@
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import override_settings, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class AdminChangelistTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, start, stop):
+        group = Group.objects.create(title=f'Группа {start}',
+                                     slug=f'group-{start}')
+        for number in range(start, stop):
+            author = User.objects.create_user(username=f'user{number}')
+            post = Post.objects.create(author=author, group=group,
+                                       text=f'Пост {number}')
+            Comment.objects.create(post=post, author=author,
+                                   text=f'Комментарий {number}')
+            Follow.objects.create(user=author, author=self.admin)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_constant(self):
+        """*** ADMIN: Число запросов списка не зависит от числа строк."""
+        urls = [reverse(f'admin:posts_{model}_changelist')
+                for model in ('post', 'comment', 'follow')]
+        self.add_rows(0, 1)
+        few = [self.count_queries(url) for url in urls]
+        self.add_rows(1, 10)
+        many = [self.count_queries(url) for url in urls]
+        self.assertEqual(few, many)
+
+    def test_group_column_autocomplete(self):
+        """*** ADMIN: Колонка группы - автодополнение без списка групп."""
+        self.add_rows(0, 1)
+        Group.objects.create(title='Лишняя группа', slug='extra')
+        response = self.client.get(reverse('admin:posts_post_changelist'))
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertContains(response, 'selected>Группа 0</option>')
+        self.assertNotContains(response, 'Лишняя группа')
+
+    @override_settings(PAGINATOR_COUNT_LIMIT=2)
+    def test_pages_past_count_limit(self):
+        """*** ADMIN: Страницы за порогом подсчета открываются."""
+        self.add_rows(0, 5)
+        url = reverse('admin:posts_post_changelist')
+        with mock.patch.object(admin.site._registry[Post],
+                               'list_per_page', 1):
+            response = self.client.get(url, {'p': 3})
+            self.assertEqual(len(response.context['cl'].result_list), 1)
+            self.assertRedirects(self.client.get(url, {'p': 5}),
+                                 f'{url}?e=1')
+
+    def test_user_filter(self):
+        """*** ADMIN: Фильтр по пользователю не перечисляет всех."""
+        self.add_rows(0, 3)
+        url = reverse('admin:posts_follow_changelist')
+        response = self.client.get(url)
+        self.assertNotContains(response, '?user=1&amp;')
+        user = User.objects.get(username='user1')
+        response = self.client.get(url, {'user': user.pk})
+        self.assertEqual(
+            [follow.user for follow in response.context['cl'].result_list],
+            [user])
+        response = self.client.get(url, {'user': 'x'})
+        self.assertRedirects(response, f'{url}?e=1')
+
+    def test_follow_delete_confirmation(self):
+        """*** ADMIN: Подтверждение удаления подписок не ходит за именами."""
+        self.add_rows(0, 1)
+        follow = Follow.objects.get()
+        url = reverse('admin:posts_follow_changelist')
+        self.add_rows(1, 10)
+        pks = list(Follow.objects.values_list('pk', flat=True))
+        with CaptureQueriesContext(connection) as few:
+            self.client.post(url, {'action': 'delete_selected',
+                                   '_selected_action': [follow.pk]})
+        with CaptureQueriesContext(connection) as many:
+            self.client.post(url, {'action': 'delete_selected',
+                                   '_selected_action': pks})
+        self.assertEqual(len(few), len(many))
+
+    def test_move_to_group(self):
+        """*** ADMIN: Посты переносятся в группу одним UPDATE."""
+        self.add_rows(0, 3)
+        target = Group.objects.create(title='Новая', slug='new')
+        old = Post.objects.first().group
+        posts = list(Post.objects.values_list('pk', flat=True)[:2])
+        url = reverse('admin:posts_post_changelist')
+        data = {'action': 'move_to_group', '_selected_action': posts}
+        response = self.client.post(url, data)
+        self.assertTemplateUsed(response,
+                                'admin/posts/post/move_to_group.html')
+        self.assertContains(response, 'Выбрано постов: 2.')
+        old_feed = self.client.get(reverse('posts:group_list',
+                                           args=(old.slug,)))
+        self.assertEqual(len(old_feed.context['page_obj']), 3)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                url, {**data, 'apply': '1', 'group': target.pk})
+        updates = [query for query in queries.captured_queries
+                   if query['sql'].startswith('UPDATE "posts_post"')]
+        self.assertEqual(len(updates), 1)
+        self.assertRedirects(response, url)
+        self.assertEqual(
+            set(target.posts.values_list('pk', flat=True)), set(posts))
+        old_feed = self.client.get(reverse('posts:group_list',
+                                           args=(old.slug,)))
+        self.assertEqual(len(old_feed.context['page_obj']), 1)
@@ -1,8 +1,18 @@
+from unittest import mock
+
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.db import connection, transaction
+from django.test import (Client, SimpleTestCase, TestCase,
+                         TransactionTestCase)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from posts.models import Post, User
+from posts.cache import bump_versions, get_versions, NAMES_SCOPE
+from posts.kvstore import LRU
+
+from posts.middleware import page_cache_stats
+from posts.models import Comment, Follow, Group, Post, User
+from posts.templatetags.posts_tags import post_fragments
 
 
 class PostCacheTest(TestCase):
@@ -11,18 +21,250 @@ class PostCacheTest(TestCase):
         super().setUpClass()
 
         cls.user: User = User.objects.create_user(username='author')
+        cls.reader: User = User.objects.create_user(username='reader')
+        cls.group: Group = Group.objects.create(
+            title='Заголовок тестовой группы',
+            slug='test-slug',
+            description='Описание тестовой группы',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.user)
 
     def setUp(self):
         self.authorized_client = Client()
-        self.authorized_client.force_login(self.user)
+        self.authorized_client.force_login(self.reader)
         cache.clear()
+        self.feeds = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.user.username,)),
+            reverse('posts:follow_index'),
+        )
 
     def test_cache_index(self):
-        Post.objects.create(text='Тестовый текст поста', author=self.user)
-        response_before = self.authorized_client.get(reverse('posts:index'))
-        Post.objects.all().delete()
-        response_cache = self.authorized_client.get(reverse('posts:index'))
-        self.assertEqual(response_before.content, response_cache.content)
+        """*** CACHE: лента берется из кэша, пока посты не менялись."""
+        Post.objects.create(text='Тестовый текст поста', author=self.user,
+                            group=self.group)
+        for url in self.feeds:
+            with self.subTest(url=url):
+                response_before = self.authorized_client.get(url)
+                # update() не отправляет сигналов - кэш не сбрасывается.
+                Post.objects.update(text='Незаметная правка')
+                response_cache = self.authorized_client.get(url)
+                self.assertEqual(response_before.content,
+                                 response_cache.content)
+
+    def test_cache_invalidated_on_delete(self):
+        """*** CACHE: удаленный пост сразу пропадает из всех лент."""
+        post = Post.objects.create(text='Тестовый текст поста',
+                                   author=self.user, group=self.group)
+        for url in self.feeds:
+            self.assertContains(self.authorized_client.get(url), post.text)
+        post.delete()
+        for url in self.feeds:
+            with self.subTest(url=url):
+                self.assertNotContains(self.authorized_client.get(url),
+                                       post.text)
+
+    def test_cache_invalidated_on_comment(self):
+        """*** CACHE: новый комментарий обновляет число в лентах."""
+        post = Post.objects.create(text='Тестовый текст поста',
+                                   author=self.user, group=self.group)
+        for url in self.feeds:
+            self.authorized_client.get(url)
+        Comment.objects.create(post=post, author=self.reader,
+                               text='Комментарий')
+        for url in self.feeds:
+            with self.subTest(url=url):
+                self.assertContains(self.authorized_client.get(url),
+                                    'Комментариев: 1')
+
+    def test_cache_invalidated_on_user_delete(self):
+        """*** CACHE: удаление автора сбрасывает кэш без запросов на строку."""
+        writer = User.objects.create_user(username='writer')
+        Follow.objects.create(user=writer, author=self.user)
+        Follow.objects.create(user=self.reader, author=writer)
+        for number in range(3):
+            post = Post.objects.create(text=f'Пост {number}', author=writer,
+                                       group=self.group)
+            Comment.objects.create(post=post, author=writer, text='Ответ')
+        feeds = [url for url in self.feeds
+                 if url != reverse('posts:profile', args=(self.user,))]
+        for url in feeds:
+            self.assertContains(self.authorized_client.get(url), 'Пост 2')
+        with CaptureQueriesContext(connection) as queries:
+            writer.delete()
+        lookups = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('SELECT') and (
+                       'FROM "auth_user"' in query['sql']
+                       or 'FROM "posts_group"' in query['sql'])]
+        self.assertEqual(lookups, [])
+        for url in feeds:
+            with self.subTest(url=url):
+                self.assertNotContains(self.authorized_client.get(url),
+                                       'Пост 2')
+
+
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user: User = User.objects.create_user(username='author')
+        cls.post: Post = Post.objects.create(text='Тестовый текст поста',
+                                             author=cls.user)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        # Счетчики процесса других тестов попадут в кэш и будут стерты.
+        page_cache_stats()
+        cache.clear()
+
+    def test_page_cache_anonymous(self):
+        """*** CACHE: анониму страница повторно отдается из кэша."""
+        url = reverse('posts:post_detail', args=(self.post.id,))
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertIsNone(response.context)
+        self.assertEqual(page_cache_stats()['posts:post_detail'],
+                         {'hit': 1, 'miss': 1})
+
+    def test_page_cache_hit_not_written(self):
+        """*** CACHE: попадание считается в процессе, без записи в кэш."""
+        url = reverse('posts:post_detail', args=(self.post.id,))
+        self.client.get(url)
+        with mock.patch.object(cache, 'add') as add, \
+                mock.patch.object(cache, 'incr') as incr:
+            self.assertEqual(self.client.get(url)['X-Page-Cache'], 'HIT')
+        add.assert_not_called()
+        incr.assert_not_called()
+
+    def test_page_cache_author_posts(self):
+        """*** CACHE: новый пост автора обновляет счетчик на странице поста."""
+        url = reverse('posts:post_detail', args=(self.post.id,))
+        self.assertContains(self.client.get(url), '<span >1</span>')
+        Post.objects.create(text='Второй пост', author=self.user)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, '<span >2</span>')
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'HIT')
+
+    def test_page_cache_purged(self):
+        """*** CACHE: запись сбрасывает только затронутые страницы."""
+        index = reverse('posts:index')
+        detail = reverse('posts:post_detail', args=(self.post.id,))
+        for url in (index, detail):
+            self.client.get(url)
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Новый комментарий')
+        response = self.client.get(detail)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Новый комментарий')
+        Post.objects.create(text='Новый пост', author=self.user)
+        response = self.client.get(index)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Новый пост')
+
+    def test_page_cache_skips_authorized(self):
+        """*** CACHE: страницы авторизованных пользователей не кэшируются."""
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('X-Page-Cache'))
+
+
+class PostFragmentCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user: User = User.objects.create_user(username='author')
+        cls.group: Group = Group.objects.create(
+            title='Заголовок тестовой группы',
+            slug='test-slug',
+            description='Описание тестовой группы',
+        )
+
+    def setUp(self):
         cache.clear()
-        response_after = self.authorized_client.get(reverse('posts:index'))
-        self.assertNotEqual(response_before.content, response_after.content)
+        self.post = Post.objects.create(text='Тестовый текст поста',
+                                        author=self.user, group=self.group)
+
+    def render(self):
+        posts = list(Post.objects.all())
+        return post_fragments(posts), posts
+
+    def test_fragment_shared_between_renders(self):
+        """*** CACHE: карточка поста рендерится один раз на ревизию."""
+        fragments, _ = self.render()
+        Post.objects.update(text='Незаметная правка')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.render()[0], fragments)
+
+    def test_fragment_reset_on_edit(self):
+        """*** CACHE: правка поста меняет ключ его карточки."""
+        self.render()
+        self.post.text = 'Новый текст'
+        self.post.save()
+        fragments, _ = self.render()
+        self.assertIn('Новый текст', fragments[0])
+
+    def test_feeds_render_from_fragments(self):
+        """*** CACHE: новый пост в ленте не перерисовывает старые."""
+        url = reverse('posts:group_list', args=(self.group.slug,))
+        self.client.get(url)
+        Post.objects.filter(pk=self.post.pk).update(text='Незаметная правка')
+        Post.objects.create(text='Новый пост', author=self.user,
+                            group=self.group)
+        response = self.client.get(url)
+        self.assertContains(response, 'Новый пост')
+        self.assertContains(response, 'Тестовый текст поста')
+        self.assertNotContains(response, 'Незаметная правка')
+
+
+class VersionBumpTest(TransactionTestCase):
+    def test_bump_repeated_on_commit(self):
+        """*** CACHE: поколение сменяется и после фиксации транзакции."""
+        with transaction.atomic():
+            bump_versions('index')
+            inside, = get_versions('index')
+        after, = get_versions('index')
+        self.assertNotEqual(inside, after)
+
+    def test_group_change_expires_pages(self):
+        """*** CACHE: правка и удаление группы сбрасывают все страницы."""
+        for change in ('save', 'delete'):
+            with self.subTest(change=change):
+                group = Group.objects.create(title='Группа', slug=change)
+                before, = get_versions(NAMES_SCOPE)
+                getattr(group, change)()
+                self.assertNotEqual(get_versions(NAMES_SCOPE), [before])
+
+    def test_fragments_follow_names(self):
+        """*** CACHE: карточки обновляются при смене группы и имени."""
+        author = User.objects.create_user(username='writer',
+                                          first_name='Старое')
+        group = Group.objects.create(title='Старая группа', slug='old')
+        Post.objects.create(text='Текст', author=author, group=group)
+        client = Client()
+        url = reverse('posts:index')
+        self.assertContains(client.get(url), 'Старая группа')
+        group.title = 'Новая группа'
+        group.save()
+        self.assertContains(client.get(url), 'Новая группа')
+        author.first_name = 'Новое'
+        author.save()
+        self.assertContains(client.get(url), 'Новое')
+        group.delete()
+        self.assertContains(client.get(url),
+                            'Этой публикации нет ни в одном сообществе')
+
+
+class KVStoreLRUTest(SimpleTestCase):
+    def test_entries_expire(self):
+        """*** CACHE: записи LRU миниатюр живут не дольше таймаута."""
+        lru = LRU(2, timeout=60)
+        lru.update({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual((lru.get('a'), lru.get('c')), (None, 3))
+        expired = LRU(2, timeout=0)
+        expired.update({'a': 1})
+        self.assertIsNone(expired.get('a'))
@@ -1,10 +1,16 @@
 from http import HTTPStatus
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
 
+from django.apps import apps
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.db import connection
+from django.core.management import call_command
+from django.test import Client, override_settings, TestCase
 from django.urls import reverse
 
-from posts.models import Follow, Post, User
+from posts.models import Follow, Post, PullAuthor, TimelineEntry, User
 
 
 class PostFollowTests(TestCase):
@@ -108,3 +114,64 @@ class PostFollowTests(TestCase):
                                   args=(self.author.username,)))
             # Проверяем, увеличилось ли число подписок
             self.assertEqual(Follow.objects.count(), 1)
+
+    def test_timeline_fan_out(self):
+        """*** FOLLOW: пост раскладывается по лентам и убирается из них."""
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Тестовый текст', author=self.author)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists())
+        Follow.objects.filter(user=self.user).delete()
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user).exists())
+
+    def test_timeline_edit_not_fanned_out(self):
+        """*** FOLLOW: правка поста не рассылает его по лентам заново."""
+        post = Post.objects.create(text='Тестовый текст', author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        TimelineEntry.objects.all().delete()
+        post.text = 'Новый текст'
+        post.save()
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_timeline_pull_author(self):
+        """*** FOLLOW: посты популярного автора подмешиваются при чтении."""
+        other: User = User.objects.create_user(username='other')
+        fan: User = User.objects.create_user(username='fan')
+        Follow.objects.create(user=fan, author=other)
+        Follow.objects.create(user=self.user, author=other)
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertTrue(PullAuthor.objects.filter(author=other).exists())
+        self.assertFalse(
+            PullAuthor.objects.filter(author=self.author).exists())
+        posts = [
+            Post.objects.create(text='Тестовый текст', author=author)
+            for author in (self.author, other, self.author)
+        ]
+        self.assertEqual(TimelineEntry.objects.count(), 2)
+        response = self.follow_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), posts[::-1])
+
+    def test_rebuild_timelines(self):
+        """*** FOLLOW: команда rebuild_timelines восстанавливает ленты."""
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Тестовый текст', author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list('user', 'post')),
+            [(self.user.id, post.id)])
+
+    def test_migration_fills_timelines(self):
+        """*** FOLLOW: миграция заполняет ленты существующих подписок."""
+        migration = import_module('posts.migrations.0012_auto_20261018_0545')
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Тестовый текст', author=self.author)
+        PullAuthor.objects.all().delete()
+        TimelineEntry.objects.all().delete()
+        # Функции нужно только соединение редактора схемы.
+        migration.fill_timelines(apps, SimpleNamespace(connection=connection))
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list('user', 'post')),
+            [(self.user.id, post.id)])
+        self.assertFalse(PullAuthor.objects.exists())
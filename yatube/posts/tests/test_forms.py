@@ -1,18 +1,50 @@
+import hashlib
 from http import HTTPStatus
+from importlib import import_module
+from io import BytesIO
 import shutil
 import tempfile
+from unittest import mock
 
+from django.apps import apps
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, override_settings, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
 
+from posts.cache import get_versions
 from posts.forms import PostForm
-from posts.models import Comment, Group, Post, User
+from core.models import Task
+from core.tasks import run_pending
+from posts.images import collect_image
+from posts.models import Comment, Follow, Group, Post, StoredImage, User
+from posts.thumbnails import (generate_pending, generate_thumbnails,
+                              prefetch_thumbnails, ready_thumbnail)
 
 # Создаем временную папку для медиа-файлов;
 # на момент теста медиа папка будет переопределена
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def gif_file(color, name=None):
+    buffer = BytesIO()
+    Image.new('RGB', (2, 1), color).save(buffer, 'GIF')
+    return SimpleUploadedFile(name or f'{color}.gif', buffer.getvalue(),
+                              content_type='image/gif')
 
 
 # Для сохранения media-файлов в тестах будет использоваться
@@ -53,6 +85,9 @@ class PostFormsTests(TestCase):
     def setUp(self):
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
+        # Записи sorl в кэше и LRU процесса не откатываются вместе с БД.
+        default.kvstore.lru.clear()
+        cache.clear()
 
     def test_create_post_forms_by_guest(self):
         """*** FORMS: проверка создания нового поста."""
@@ -109,8 +144,182 @@ class PostFormsTests(TestCase):
         self.assertEqual(new_post.author, self.user)
         self.assertEqual(new_post.group.id, form_data['group'])
         self.assertEqual(new_post.text, form_data['text'])
+        # Файл назван по хешу содержимого.
+        digest = hashlib.sha256(small_gif).hexdigest()
         self.assertEqual(new_post.image.name,
-                         'posts/' + form_data['image'].name)
+                         f'posts/{digest[:2]}/{digest}.gif')
+
+    def test_forms_thumbnails_in_background(self):
+        """*** FORMS: миниатюры не создаются в обработчике запроса."""
+        create = mock.patch.object(
+            ThumbnailBackend, '_create_thumbnail', autospec=True,
+            side_effect=ThumbnailBackend._create_thumbnail)
+        with create as create_thumbnail:
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Пост с картинкой',
+                      'image': gif_file('purple')},
+                follow=True
+            )
+            post = Post.objects.get(text='Пост с картинкой')
+            self.assertFalse(StoredImage.objects.get(
+                name=post.image.name).thumbnails_ready)
+            detail = reverse('posts:post_detail', args=(post.id,))
+            for url in (reverse('posts:index'), detail):
+                # Пока миниатюры нет, показывается оригинал.
+                self.assertContains(self.authorized_client.get(url),
+                                    post.image.url)
+            create_thumbnail.assert_not_called()
+
+            self.assertEqual(run_pending(), 1)
+            self.assertEqual(create_thumbnail.call_count,
+                             len(settings.POST_THUMBNAILS))
+        self.assertTrue(StoredImage.objects.get(
+            name=post.image.name).thumbnails_ready)
+        response = self.authorized_client.get(detail)
+        self.assertNotContains(response, post.image.url)
+        self.assertContains(response, 'cache/')
+
+    def test_forms_thumbnails_prefetch(self):
+        """*** FORMS: миниатюры страницы читаются одним запросом."""
+        posts = [
+            Post.objects.create(text=f'Пост {color}', author=self.user,
+                                image=gif_file(color))
+            for color in ('red', 'blue')
+        ]
+        for post in posts:
+            generate_thumbnails(post.image.name)
+        default.kvstore.lru.clear()
+        cache.clear()
+        with self.assertNumQueries(1):
+            prefetch_thumbnails([post.image for post in posts], 'card')
+        with self.assertNumQueries(0):
+            for post in posts:
+                self.assertIsNotNone(ready_thumbnail(post.image, 'card'))
+
+        old_image = posts[0].image
+        posts[0].image = gif_file('green')
+        posts[0].save()
+        self.assertEqual(
+            StoredImage.objects.get(name=old_image.name).references, 0)
+        self.assertTrue(collect_image(old_image.name))
+        self.assertIsNone(ready_thumbnail(old_image, 'card'))
+        self.assertFalse(old_image.storage.exists(old_image.name))
+
+    def test_forms_thumbnails_refresh_posts(self):
+        """*** FORMS: миниатюры обновляют ревизию постов без сигналов."""
+        Follow.objects.create(
+            user=User.objects.create_user(username='reader'),
+            author=self.user)
+        post = Post.objects.create(text='С картинкой', author=self.user,
+                                   group=self.group, image=gif_file('red'))
+        scopes = (f'post:{post.pk}', f'group:{self.group.slug}')
+        versions = get_versions(*scopes)
+        with CaptureQueriesContext(connection) as queries:
+            generate_thumbnails(post.image.name)
+        self.assertGreater(Post.objects.get(pk=post.pk).updated,
+                           post.updated)
+        self.assertNotEqual(get_versions(*scopes), versions)
+        statements = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(len([sql for sql in statements
+                              if sql.startswith('UPDATE "posts_post"')]), 1)
+        self.assertFalse([sql for sql in statements
+                          if 'posts_timelineentry' in sql])
+
+    def test_forms_image_deduplication(self):
+        """*** FORMS: одинаковые картинки хранятся одним файлом."""
+        first, second = (
+            Post.objects.create(text=f'Копия {i}', author=self.user,
+                                image=gif_file('red', f'copy{i}.gif'))
+            for i in range(2)
+        )
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(StoredImage.objects.get(name=name).references, 2)
+        first.delete()
+        self.assertFalse(collect_image(name))
+        self.assertTrue(second.image.storage.exists(name))
+        second.delete()
+        self.assertTrue(collect_image(name))
+        self.assertFalse(second.image.storage.exists(name))
+
+    def test_forms_image_collected_concurrently(self):
+        """*** FORMS: файл, удаленный при сохранении, восстанавливается."""
+        first = Post.objects.create(text='Первый', author=self.user,
+                                    image=gif_file('red', 'first.gif'))
+        name = first.image.name
+        first.delete()
+        storage = first.image.storage
+        storage_save = type(storage).save
+
+        def save_and_collect(self, *args, **kwargs):
+            # Сборщик успел удалить файл сразу после проверки exists().
+            saved = storage_save(self, *args, **kwargs)
+            collect_image(saved)
+            return saved
+
+        with mock.patch.object(type(storage), 'save', save_and_collect):
+            second = Post.objects.create(text='Второй', author=self.user,
+                                         image=gif_file('red', 'second.gif'))
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(StoredImage.objects.get(name=name).references, 1)
+        self.assertTrue(storage.exists(name))
+        self.assertFalse(collect_image(name))
+
+    def test_forms_legacy_images_counted(self):
+        """*** FORMS: миграция учитывает картинки, загруженные раньше."""
+        migration = import_module('posts.migrations.0020_storedimage_backfill')
+        legacy = [Post.objects.create(text=f'Старый {i}', author=self.user,
+                                      image='posts/old.gif')
+                  for i in range(2)]
+        self.assertFalse(StoredImage.objects.filter(
+            name='posts/old.gif').exists())
+        migration.fill_stored_images(apps, None)
+        self.assertEqual(
+            StoredImage.objects.get(name='posts/old.gif').references, 2)
+        Task.objects.all().delete()
+        self.assertEqual(generate_pending(), 1)
+        self.assertTrue(Task.objects.filter(
+            payload__contains='posts/old.gif').exists())
+        legacy[0].delete()
+        self.assertEqual(
+            StoredImage.objects.get(name='posts/old.gif').references, 1)
+        # Старые файлы по-прежнему не удаляются.
+        legacy[1].delete()
+        self.assertFalse(collect_image('posts/old.gif'))
+
+    def test_forms_image_ingestion(self):
+        """*** FORMS: картинка поворачивается, уменьшается и перекодируется."""
+        buffer = BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90° по часовой
+        exif[0x010F] = 'Camera'
+        Image.new('RGB', (3000, 1000), 'red').save(buffer, 'JPEG', exif=exif)
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Фото с телефона',
+                  'image': SimpleUploadedFile('photo.jpeg', buffer.getvalue(),
+                                              content_type='image/jpeg')},
+        )
+        post = Post.objects.get(text='Фото с телефона')
+        with Image.open(post.image) as image:
+            self.assertEqual(
+                max(image.size), settings.POST_IMAGE_MAX_SIZE)
+            self.assertGreater(image.height, image.width)
+            self.assertFalse(image.getexif())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1)
+    def test_forms_image_too_large(self):
+        """*** FORMS: слишком большая картинка отклоняется по заголовку."""
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Бомба',
+                  'image': SimpleUploadedFile('bomb.gif', SMALL_GIF,
+                                              content_type='image/gif')},
+        )
+        self.assertFormError(response, 'form', 'image',
+                             'Слишком большая картинка: 2×1.')
+        self.assertFalse(Post.objects.filter(text='Бомба').exists())
 
     def test_forms_edit_post(self):
         """*** FORMS: проверка редактирования поста."""
@@ -1,6 +1,9 @@
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 
-from posts.models import Group, Post, User
+from posts.models import Comment, Follow, Group, Post, User, UserStats
 
 TEST_STR_CHAR = 15
 
@@ -55,3 +58,62 @@ class PostModelTest(TestCase):
                          'Введите текст поста')
         self.assertEqual(self.post._meta.get_field('group').help_text,
                          'Выберите группу')
+
+    def test_models_text_html(self):
+        """*** MODEL: HTML текста рендерится при сохранении."""
+        post = Post.objects.create(author=self.user, text='<b>раз</b>\n\nдва')
+        self.assertEqual(post.text_html,
+                         '<p>&lt;b&gt;раз&lt;/b&gt;</p>\n\n<p>два</p>')
+        post.text = 'три'
+        post.save(update_fields=['text'])
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, '<p>три</p>')
+        comment = Comment.objects.create(post=post, author=self.user,
+                                         text='ответ')
+        self.assertEqual(comment.text_html, '<p>ответ</p>')
+
+    def test_models_text_html_backfill(self):
+        """*** MODEL: команда render_text_html заполняет пустой HTML."""
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Пост {i}') for i in range(3))
+        call_command('render_text_html', batch_size=2, stdout=StringIO())
+        self.assertFalse(Post.objects.filter(text_html='').exists())
+        self.assertEqual(
+            Post.objects.filter(text='Пост 2').get().text_html,
+            '<p>Пост 2</p>')
+
+
+class UserStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user: User = User.objects.create_user(username='author')
+        cls.reader: User = User.objects.create_user(username='reader')
+
+    def assertStats(self, user, posts, followers, following):
+        stats = UserStats.objects.get(user=user)
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count, stats.following_count),
+            (posts, followers, following))
+
+    def test_stats_follow_writes(self):
+        """*** MODEL: счетчики меняются вместе с постами и подписками."""
+        post = Post.objects.create(author=self.user, text='Тестовый пост')
+        follow = Follow.objects.create(user=self.reader, author=self.user)
+        self.assertStats(self.user, 1, 1, 0)
+        self.assertStats(self.reader, 0, 0, 1)
+        post.delete()
+        follow.delete()
+        self.assertStats(self.user, 0, 0, 0)
+        self.assertStats(self.reader, 0, 0, 0)
+
+    def test_stats_reconcile(self):
+        """*** MODEL: reconcile_stats исправляет расхождения."""
+        Post.objects.create(author=self.user, text='Тестовый пост')
+        UserStats.objects.filter(user=self.user).update(posts_count=7)
+        UserStats.objects.filter(user=self.reader).delete()
+        out = StringIO()
+        call_command('reconcile_stats', stdout=out)
+        self.assertIn('1', out.getvalue())
+        self.assertStats(self.user, 1, 0, 0)
+        self.assertStats(self.reader, 0, 0, 0)
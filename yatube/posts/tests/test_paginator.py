@@ -0,0 +1,72 @@
+from django.core.cache import cache
+from django.core.paginator import EmptyPage
+from django.test import override_settings, TestCase
+
+from posts.models import Post, User
+from posts.utils import CachedCountPaginator
+
+TEST_POSTS_NUM = 13
+
+
+class CachedCountPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user: User = User.objects.create_user(username='author')
+        Post.objects.bulk_create(
+            Post(text='Тестовый текст поста', author=cls.user)
+            for _ in range(TEST_POSTS_NUM)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_paginator_count_cached(self):
+        """*** PAGINATOR: число записей берется из кэша."""
+        self.assertEqual(CachedCountPaginator(Post.objects.all(), 1).count,
+                         TEST_POSTS_NUM)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                CachedCountPaginator(Post.objects.all(), 1).count,
+                TEST_POSTS_NUM)
+
+    def test_paginator_count_invalidated(self):
+        """*** PAGINATOR: новый и удаленный пост сбрасывают кэш."""
+        CachedCountPaginator(Post.objects.all(), 1).count
+        post = Post.objects.create(text='Новый пост', author=self.user)
+        self.assertEqual(CachedCountPaginator(Post.objects.all(), 1).count,
+                         TEST_POSTS_NUM + 1)
+        post.delete()
+        self.assertEqual(CachedCountPaginator(Post.objects.all(), 1).count,
+                         TEST_POSTS_NUM)
+
+    @override_settings(PAGINATOR_COUNT_LIMIT=5)
+    def test_paginator_count_estimate(self):
+        """*** PAGINATOR: за порогом число записей оценочное."""
+        paginator = CachedCountPaginator(Post.objects.all(), 1)
+        self.assertEqual(paginator.count, 5)
+        self.assertTrue(paginator.count_is_estimate)
+
+    @override_settings(PAGINATOR_COUNT_LIMIT=5)
+    def test_paginator_pages_past_estimate(self):
+        """*** PAGINATOR: страницы за оценочным числом доступны."""
+        paginator = CachedCountPaginator(Post.objects.all(), 2)
+        self.assertEqual(paginator.num_pages, 3)
+        page = paginator.page(5)
+        self.assertEqual(len(page), 2)
+        self.assertTrue(page.has_next())
+        page = paginator.page(7)
+        self.assertEqual(len(page), 1)
+        self.assertFalse(page.has_next())
+        with self.assertRaises(EmptyPage):
+            paginator.page(8)
+
+    @override_settings(PAGINATOR_WINDOW=2)
+    def test_paginator_page_window(self):
+        """*** PAGINATOR: выводится только окно страниц вокруг текущей."""
+        paginator = CachedCountPaginator(Post.objects.all(), 1)
+        self.assertEqual(list(paginator.page_window(1)), [1, 2, 3])
+        self.assertEqual(list(paginator.page_window(7)), [5, 6, 7, 8, 9])
+        self.assertEqual(list(paginator.page_window(TEST_POSTS_NUM)),
+                         [11, 12, 13])
@@ -0,0 +1,52 @@
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core.testing import assert_constant_queries
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class ConstantQueriesTest(TestCase):
+    """Число запросов страниц не зависит от числа записей на них."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(author=cls.reader, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.created = 0
+
+    def add_posts(self, count):
+        # У каждого поста свой автор: N+1 по author сразу заметен.
+        for _ in range(count):
+            self.created += 1
+            author = User.objects.create_user(username=f'a{self.created}')
+            Follow.objects.create(user=self.reader, author=author)
+            Post.objects.create(author=author, group=self.group,
+                                text=f'Пост {self.created}')
+
+    def add_comments(self, count):
+        for _ in range(count):
+            self.created += 1
+            author = User.objects.create_user(username=f'c{self.created}')
+            Comment.objects.create(post=self.post, author=author,
+                                   text=f'Комментарий {self.created}')
+
+    def test_feeds(self):
+        """*** QUERIES: Ленты не делают запросов на каждый пост."""
+        for url in (reverse('posts:index'),
+                    reverse('posts:group_list', args=(self.group.slug,)),
+                    reverse('posts:follow_index')):
+            with self.subTest(url=url):
+                assert_constant_queries(self.client, url, self.add_posts)
+
+    def test_post_detail(self):
+        """*** QUERIES: Комментарии поста не делают запросов на каждый."""
+        assert_constant_queries(
+            self.client, reverse('posts:post_detail', args=(self.post.pk,)),
+            self.add_comments)
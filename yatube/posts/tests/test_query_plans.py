@@ -0,0 +1,74 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+TEST_POSTS_NUM = 13
+
+
+class QueryPlanTests(TestCase):
+    """Запросы страниц не должны сканировать таблицы и сортировать
+    результат во временном B-дереве."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user: User = User.objects.create_user(username='reader')
+        cls.author: User = User.objects.create_user(username='author')
+        cls.group: Group = Group.objects.create(
+            title='Заголовок тестовой группы',
+            slug='test-slug',
+            description='Описание тестовой группы',
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        for _ in range(TEST_POSTS_NUM):
+            cls.post: Post = Post.objects.create(
+                text='Тестовый текст поста',
+                author=cls.author,
+                group=cls.group,
+            )
+        Comment.objects.create(post=cls.post, author=cls.user,
+                               text='Тестовый комментарий')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def get_plans(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(url)
+            cursor = response.context['page_obj'].next_cursor if (
+                'page_obj' in response.context) else None
+            if cursor:
+                self.authorized_client.get(url, {'cursor': cursor})
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plans.append(
+                    (query['sql'], [row[-1] for row in cursor.fetchall()]))
+        return plans
+
+    def test_query_plans(self):
+        """*** PLANS: запросы страниц идут по индексам."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.author.username,)),
+            reverse('posts:post_detail', args=(self.post.id,)),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            for sql, plan in self.get_plans(url):
+                for step in plan:
+                    with self.subTest(url=url, sql=sql, step=step):
+                        self.assertNotIn('TEMP B-TREE', step)
+                        if step.startswith('SCAN'):
+                            self.assertIn('INDEX', step)
@@ -0,0 +1,91 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Post
+from posts.search import (COMMENT_INDEX, POST_INDEX, match_expression,
+                          search_queryset, SearchPaginator)
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.rare = Post.objects.create(
+            author=cls.user, text='Про котов и <b>кошек</b>')
+        cls.often = Post.objects.create(
+            author=cls.user, text='Кот, кот и еще раз кот')
+        cls.other = Post.objects.create(author=cls.user, text='Про собак')
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query, per_page=10, cursor=None):
+        return SearchPaginator(query, per_page).get_cursor_page(cursor)
+
+    def test_match_expression(self):
+        """*** SEARCH: Синтаксис FTS5 из запроса не исполняется."""
+        self.assertEqual(match_expression('кот OR "пес*'),
+                         '"кот" "OR" "пес"*')
+        self.assertIsNone(match_expression('  *** '))
+
+    def test_ranking_and_snippet(self):
+        """*** SEARCH: Выдача по BM25, подсветка, HTML экранирован."""
+        page = self.search('кот')
+        self.assertEqual([post.pk for post in page],
+                         [self.often.pk, self.rare.pk])
+        snippet = page.object_list[1].snippet
+        self.assertIn('<mark>котов</mark>', snippet)
+        self.assertIn('&lt;b&gt;', snippet)
+
+    def test_cursor_pages(self):
+        """*** SEARCH: Следующая страница продолжает выдачу по курсору."""
+        first = self.search('кот', per_page=1)
+        self.assertIsNotNone(first.next_cursor)
+        second = self.search('кот', per_page=1, cursor=first.next_cursor)
+        self.assertEqual(list(second), [self.rare])
+        self.assertIsNone(second.next_cursor)
+        back = self.search('кот', per_page=1, cursor=second.previous_cursor)
+        self.assertEqual(list(back), [self.often])
+
+    def test_triggers_keep_index(self):
+        """*** SEARCH: Индекс следует за изменением и удалением строк."""
+        Post.objects.filter(pk=self.other.pk).update(text='Про котят')
+        self.assertIn(self.other, list(self.search('котят')))
+        self.other.delete()
+        self.assertEqual(list(self.search('котят')), [])
+        comment = Comment.objects.create(
+            post=self.rare, author=self.user, text='Пушистый комментарий')
+        self.assertEqual(list(search_queryset(
+            Comment.objects.all(), COMMENT_INDEX, 'пушист')), [comment])
+        self.assertEqual(list(search_queryset(
+            Post.objects.all(), POST_INDEX, 'пушист')), [])
+
+    def test_search_page(self):
+        """*** SEARCH: Страница поиска показывает найденные посты."""
+        response = Client().get(reverse('posts:search'), {'q': 'собак'})
+        self.assertEqual(list(response.context['page_obj']), [self.other])
+        self.assertContains(response, '<mark>собак</mark>')
+        response = Client().get(reverse('posts:search'))
+        self.assertIsNone(response.context['page_obj'])
+
+    def test_admin_search(self):
+        """*** SEARCH: Поиск в админке идет через индекс."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        client = Client()
+        client.force_login(admin)
+        response = client.get(reverse('admin:posts_post_changelist'),
+                              {'q': 'собак'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.other])
+        response = client.get(reverse('admin:posts_post_changelist'),
+                              {'q': 'кот'})
+        self.assertEqual(set(response.context['cl'].result_list),
+                         {self.rare, self.often})
+        response = client.get(reverse('admin:posts_comment_changelist'),
+                              {'q': 'собак'})
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,101 @@
+import datetime
+from dataclasses import replace
+from io import StringIO
+
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.test import override_settings, TestCase
+
+from posts.models import Comment, Follow, Group, Post, User, UserStats
+from core.benchmark import measure
+from posts.benchmarks import scenarios
+from posts.management.commands.benchmark_views import private_caches
+from posts.search import POST_INDEX, search_queryset
+from posts.synthetic import generate, Plan
+
+PLAN = Plan(seed=7, users=40, groups=5, posts=300, chunk_size=100,
+            batch_size=50, until=datetime.datetime(
+                2024, 1, 1, tzinfo=datetime.timezone.utc))
+
+
+def snapshot():
+    return (
+        list(Post.objects.order_by('pk').values_list(
+            'pk', 'text', 'author_id', 'group_id', 'pub_date',
+            'comments_count')),
+        list(Comment.objects.order_by('post_id', 'created').values_list(
+            'post_id', 'author_id', 'text', 'created')),
+        sorted(Follow.objects.values_list('user_id', 'author_id')),
+    )
+
+
+class SyntheticDataTest(TestCase):
+    def test_reproducible(self):
+        """*** SYNTHETIC: С тем же зерном данные совпадают."""
+        generate(PLAN)
+        first = snapshot()
+        for model in (Comment, Follow, Post, Group, User):
+            model.objects.all().delete()
+        generate(PLAN)
+        self.assertEqual(snapshot(), first)
+        generate(replace(PLAN, seed=8))
+        texts = [row[1] for row in snapshot()[0]]
+        self.assertNotEqual(texts[PLAN.posts:], texts[:PLAN.posts])
+
+    def test_counters_consistent(self):
+        """*** SYNTHETIC: Счетчики совпадают с созданными строками."""
+        generate(PLAN)
+        self.assertEqual(Post.objects.count(), PLAN.posts)
+        for post in Post.objects.all():
+            self.assertEqual(post.comments_count, post.comments.count())
+        for stats in UserStats.objects.all():
+            self.assertEqual(stats.posts_count,
+                             Post.objects.filter(author=stats.user).count())
+            self.assertEqual(stats.followers_count,
+                             Follow.objects.filter(author=stats.user).count())
+
+    def test_search_index_rebuilt(self):
+        """*** SYNTHETIC: Индекс поиска перестроен, триггеры на месте."""
+        generate(PLAN)
+        post = Post.objects.order_by('pk').last()
+        word = post.text.split()[0]
+        self.assertIn(post, search_queryset(Post.objects.all(), POST_INDEX,
+                                            word))
+        new = Post.objects.create(text='Небывалоеслово',
+                                  author=post.author)
+        self.assertEqual(list(search_queryset(
+            Post.objects.all(), POST_INDEX, 'небывалоеслово')), [new])
+
+    def test_command(self):
+        """*** SYNTHETIC: Команда generate_data создает данные и ленты."""
+        call_command('generate_data', users=20, posts=50, groups=2,
+                     processes=1, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 50)
+        follow = Follow.objects.first()
+        self.assertEqual(
+            follow.user.timeline.filter(author=follow.author).count(),
+            Post.objects.filter(author=follow.author).count())
+
+    def test_benchmark_scenarios(self):
+        """*** SYNTHETIC: Сценарии замеров проходят на этих данных."""
+        generate(PLAN)
+        for scenario in scenarios():
+            metrics = measure(scenario, repeat=2, warmup=1)
+            self.assertEqual(metrics['requests'], 2, scenario.name)
+
+    def test_follow_scenarios_sized(self):
+        """*** SYNTHETIC: Подписок хватает на все запросы сценария."""
+        generate(PLAN)
+        requests = PLAN.users + 10
+        for scenario in scenarios(requests=requests):
+            if scenario.name in ('profile_follow', 'profile_unfollow'):
+                metrics = measure(scenario, repeat=requests - 1, warmup=0)
+                self.assertEqual(metrics['requests'], requests - 1)
+
+    def test_benchmark_private_cache(self):
+        """*** SYNTHETIC: Замеры не пишут в общий кэш."""
+        with override_settings(CACHES=private_caches()):
+            cache.set('benchmark:key', 1)
+            self.assertEqual(cache.get('benchmark:key'), 1)
+        self.assertIsNone(cache.get('benchmark:key'))
+        self.assertIsNone(caches['shared'].get('benchmark:key'))
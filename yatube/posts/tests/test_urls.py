@@ -68,6 +68,14 @@ class PostURLTests(TestCase):
         response = self.client.get('/unexisting_page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
 
+    def test_missing_post_comments404(self):
+        """*** URLS: Комментарии несуществующего поста - 404, не в кэш."""
+        url = reverse('posts:post_comments', args=(10 ** 6,))
+        for _ in range(2):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+            self.assertNotEqual(response.get('X-Page-Cache'), 'HIT')
+
     def test_template_page404(self):
         """*** URLS: Проверяем шаблон страницы 404."""
         # Проверьте, что используется шаблон core/404.html
@@ -1,11 +1,14 @@
+import base64
+import json
+
 from django.conf import settings
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.test import Client, override_settings, TestCase
 from django.urls import reverse
 from django import forms
 
 from posts.forms import PostForm
-from posts.models import Follow, Group, Post, User
+from posts.models import Comment, Follow, Group, Post, User
 
 TEST_POSTS_NUM = 13
 
@@ -138,6 +141,71 @@ class PostPagesTests(TestCase):
                         self.assertEqual(len(response.context['page_obj']),
                                          num)
 
+    def test_view_cursor_paginator(self):
+        """*** VIEWS: проверка курсорной паджинации ленты."""
+        Post.objects.all().delete()
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=self.user, group=self.group)
+            for i in range(TEST_POSTS_NUM)
+        )
+        expected = list(Post.objects.values_list('id', flat=True))
+        url = reverse('posts:index')
+
+        seen, cursor = [], ''
+        while True:
+            response = self.authorized_client.get(url, {'cursor': cursor})
+            page_obj = response.context['page_obj']
+            seen.extend(post.id for post in page_obj)
+            cursor = page_obj.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+        response = self.authorized_client.get(
+            url, {'cursor': page_obj.previous_cursor})
+        self.assertEqual([post.id for post in response.context['page_obj']],
+                         expected[:settings.POSTS_NUM])
+        self.assertIsNone(response.context['page_obj'].previous_cursor)
+
+        bad_cursors = ['мусор'] + [
+            base64.urlsafe_b64encode(json.dumps(
+                ['n', ['2024-01-01T00:00:00+00:00', value]]).encode()).decode()
+            for value in (10 ** 30, 1e400, 1.5, float('nan'), '5')]
+        for bad in bad_cursors:
+            with self.subTest(cursor=bad):
+                response = self.authorized_client.get(url, {'cursor': bad})
+                self.assertEqual(
+                    [post.id for post in response.context['page_obj']],
+                    expected[:settings.POSTS_NUM])
+
+    @override_settings(COMMENTS_NUM=2)
+    def test_view_post_detail_comments(self):
+        """*** VIEWS: комментарии поста выводятся страницами."""
+        comments = [
+            Comment.objects.create(post=self.post, author=self.user,
+                                   text=f'Комментарий {i}')
+            for i in range(3)
+        ]
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', args=(self.post.id,)))
+        page = response.context['comments']
+        self.assertEqual(list(page), comments[:0:-1])
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.id,)),
+            {'cursor': page.next_cursor})
+        self.assertTemplateUsed(response, 'posts/includes/comment_list.html')
+        self.assertEqual(list(response.context['comments']), comments[:1])
+        self.assertIsNone(response.context['comments'].next_cursor)
+
+    def test_view_comments_count(self):
+        """*** VIEWS: в ленте выводится число комментариев поста."""
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Комментарий')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Комментариев: 1')
+
     def test_view_post_not_in_group2(self):
         """"*** VIEWS: пост не попал в группу2"""
         group2 = Group.objects.create(
@@ -0,0 +1,116 @@
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from core.tasks import task
+from core.timing import timed
+
+from . import timeline
+from .cache import bump_versions, post_scopes
+from .models import Post, StoredImage
+
+logger = logging.getLogger(__name__)
+
+
+class PostThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который умеет искать миниатюру, не создавая ее."""
+
+    def thumbnail_options(self, source, options):
+        # Те же умолчания, что в ThumbnailBackend.get_thumbnail: иначе имя
+        # файла миниатюры не совпадет с созданным в фоне.
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        return options
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """Файл миниатюры, который создал бы get_thumbnail."""
+        source = ImageFile(file_)
+        options = self.thumbnail_options(source, options)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def get_ready_thumbnail(self, file_, geometry_string, **options):
+        """Готовая миниатюра из хранилища ключей sorl или None."""
+        return default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, **options))
+
+
+backend = PostThumbnailBackend()
+
+
+@timed('thumbnail')
+def ready_thumbnail(image, size):
+    """Миниатюра размера size из POST_THUMBNAILS, если она уже создана."""
+    if not image:
+        return None
+    geometry, options = settings.POST_THUMBNAILS[size]
+    return backend.get_ready_thumbnail(image.name, geometry, **options)
+
+
+@timed('thumbnail')
+def prefetch_thumbnails(images, *sizes):
+    """Читает записи миниатюр всех картинок страницы одним запросом."""
+    prefetch = getattr(default.kvstore, 'prefetch', None)
+    if prefetch is None:
+        return
+    prefetch([
+        backend.thumbnail_file(image.name, geometry, **options)
+        for geometry, options in (settings.POST_THUMBNAILS[size]
+                                  for size in set(sizes))
+        for image in images if image
+    ])
+
+
+def forget_thumbnails(name):
+    """Удаляет миниатюры картинки, которую больше не показывают."""
+    default.kvstore.delete(ImageFile(name))
+
+
+def generate_thumbnails(name):
+    """Создает все миниатюры файла и обновляет ревизии его постов."""
+    for geometry, options in settings.POST_THUMBNAILS.values():
+        backend.get_thumbnail(name, geometry, **options)
+    # Новая ревизия сбрасывает кэш карточек и страниц с постом. update()
+    # не вызывает сигналы с раскладкой по лентам: правке это не нужно,
+    # а кэши сбрасываются здесь же.
+    posts = Post.objects.filter(image=name)
+    rows = list(posts.values_list(
+        'pk', 'author_id', 'author__username', 'group__slug'))
+    if not rows:
+        return
+    posts.update(updated=timezone.now())
+    scopes = set()
+    for pk, _, username, slug in rows:
+        scopes.update(post_scopes(pk, username, {slug}))
+    bump_versions(*scopes)
+    for author_id in {row[1] for row in rows}:
+        timeline.touch(author_id)
+
+
+@task(priority=1, dedup_key=lambda name: f'thumbnails:{name}')
+def make_thumbnails(name):
+    """Фоновая задача: миниатюры нового файла картинки."""
+    generate_thumbnails(name)
+    StoredImage.objects.filter(name=name).update(thumbnails_ready=True)
+
+
+def generate_pending(limit=None):
+    """Ставит в очередь файлы, для которых миниатюр еще нет."""
+    pending = StoredImage.objects.filter(
+        thumbnails_ready=False, references__gt=0).values_list(
+        'name', flat=True)[:limit]
+    for name in pending:
+        make_thumbnails.defer(name)
+    return len(pending)
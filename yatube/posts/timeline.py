@@ -0,0 +1,180 @@
+import heapq
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Q
+from django.utils.functional import cached_property
+
+from .cache import bump_versions
+from .models import Follow, Post, PullAuthor, TimelineEntry
+from .utils import CursorPaginator
+
+ENTRY_ORDERING = ('-pub_date', '-post_id')
+
+
+def _entries(user_ids, post):
+    return (TimelineEntry(user_id=user_id, post_id=post.id,
+                          author_id=post.author_id, pub_date=post.pub_date)
+            for user_id in user_ids)
+
+
+def _bulk_insert(entries):
+    # Явный batch_size не проверяется на пределы СУБД (в SQLite - не больше
+    # 500 строк в одном INSERT), поэтому ограничиваем его сами.
+    limit = connection.ops.bulk_batch_size(
+        TimelineEntry._meta.concrete_fields, [])
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=min(settings.TIMELINE_BATCH_SIZE, limit),
+        ignore_conflicts=True)
+
+
+def is_pull_author(author_id):
+    return PullAuthor.objects.filter(author_id=author_id).exists()
+
+
+def update_mode(author_id):
+    """Переводит автора в режим pull, когда подписчиков стало много.
+
+    Режим не снимается сам по себе (его пересчитывает rebuild_timelines),
+    поэтому лента не теряет посты, написанные в режиме pull.
+    """
+    if is_pull_author(author_id):
+        return True
+    followers = Follow.objects.filter(author_id=author_id).count()
+    if followers <= settings.TIMELINE_FANOUT_LIMIT:
+        return False
+    PullAuthor.objects.get_or_create(author_id=author_id)
+    TimelineEntry.objects.filter(author_id=author_id).delete()
+    return True
+
+
+def fan_out(post):
+    """Раскладывает пост по лентам подписчиков автора."""
+    if is_pull_author(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    _bulk_insert(_entries(followers.iterator(), post))
+
+
+def touch(author_id):
+    """Сбрасывает кэш лент подписок, в которые попадают посты автора."""
+    if is_pull_author(author_id):
+        bump_versions(f'pull:{author_id}')
+        return
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    bump_versions(*(f'follower:{user_id}' for user_id in followers))
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту нового подписчика посты автора."""
+    if update_mode(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).only(
+        'id', 'author_id', 'pub_date').order_by()
+    _bulk_insert(TimelineEntry(user_id=user_id, post_id=post.id,
+                               author_id=author_id, pub_date=post.pub_date)
+                 for post in posts.iterator())
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты посты автора, от которого отписались."""
+    TimelineEntry.objects.filter(user_id=user_id,
+                                 author_id=author_id).delete()
+
+
+def rebuild(users=None):
+    """Пересобирает ленты (все или только users) по таблице Follow.
+
+    Работает множествами: авторы в режиме pull отмечаются одним
+    запросом, а ленты заполняются одним INSERT ... SELECT.
+    """
+    entries = TimelineEntry.objects.all()
+    follows = Follow.objects.all()
+    if users is not None:
+        entries = entries.filter(user__in=users)
+        follows = follows.filter(user__in=users)
+    else:
+        PullAuthor.objects.all().delete()
+    entries.delete()
+    popular = Follow.objects.filter(
+        author__in=follows.values('author_id')).values('author_id').annotate(
+        followers=Count('pk')).filter(
+        followers__gt=settings.TIMELINE_FANOUT_LIMIT).order_by()
+    PullAuthor.objects.bulk_create(
+        (PullAuthor(author_id=row['author_id']) for row in popular),
+        ignore_conflicts=True)
+    TimelineEntry.objects.filter(
+        author__in=PullAuthor.objects.values('author_id')).delete()
+    pushed = follows.exclude(
+        author__in=PullAuthor.objects.values('author_id')).values(
+        'user_id', 'author_id').order_by()
+    _insert_from_follows(pushed)
+    readers = follows.values_list('user_id', flat=True).distinct()
+    bump_versions(*(f'follower:{user_id}' for user_id in readers))
+
+
+def _insert_from_follows(follows):
+    # Follow уникальна по (author, user), поэтому строки SELECT не
+    # повторяются, а старые записи этих лент уже удалены.
+    follows_sql, params = follows.query.sql_with_params()
+    entry, post = TimelineEntry._meta, Post._meta
+    columns = ', '.join(entry.get_field(name).column for name in (
+        'user', 'post', 'author', 'pub_date'))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {entry.db_table} ({columns}) '
+            f'SELECT f.user_id, p.{post.pk.column}, p.author_id, p.pub_date '
+            f'FROM ({follows_sql}) f JOIN {post.db_table} p '
+            f'ON p.author_id = f.author_id', params)
+
+
+def posts_for(user):
+    """Посты ленты подписок одним запросом (для нумерованных страниц)."""
+    pushed = TimelineEntry.objects.filter(user=user).values('post_id')
+    return Post.objects.select_related('group', 'author').filter(
+        Q(pk__in=pushed) | Q(author__in=pull_authors(user)))
+
+
+def pull_authors(user):
+    return PullAuthor.objects.filter(
+        author__following__user=user).values('author_id')
+
+
+class TimelinePaginator(CursorPaginator):
+    """Курсорная лента подписок.
+
+    Разосланные посты читаются из TimelineEntry по индексу, посты
+    авторов в режиме pull подмешиваются слиянием двух упорядоченных
+    выборок.
+    """
+
+    def __init__(self, object_list, per_page, user=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.user = user
+
+    @cached_property
+    def pull_author_ids(self):
+        return list(pull_authors(self.user).values_list('author_id',
+                                                        flat=True))
+
+    def fetch(self, values, reverse, limit):
+        entries = TimelineEntry.objects.filter(
+            user=self.user).select_related('post__author', 'post__group')
+        posts = [entry.post for entry in self.fetch_queryset(
+            entries, values, reverse, limit, ENTRY_ORDERING)]
+        if not self.pull_author_ids:
+            return posts
+        pulled = self.fetch_queryset(
+            Post.objects.select_related('group', 'author').filter(
+                author_id__in=self.pull_author_ids),
+            values, reverse, limit)
+        merged, seen = [], set()
+        for post in heapq.merge(
+                posts, pulled, reverse=not reverse,
+                key=lambda post: (post.pub_date, post.id)):
+            if post.id not in seen:
+                seen.add(post.id)
+                merged.append(post)
+        return merged[:limit]
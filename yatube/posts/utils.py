@@ -1,10 +1,235 @@
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .cache import get_versions
+
+# Направления курсора: к более старым записям и к более новым.
+NEXT = 'n'
+PREVIOUS = 'p'
+# Целые в курсоре - ключи в 64-битных колонках БД: большее число
+# драйвер не передаст (OverflowError), поэтому такой курсор негоден.
+INTEGER_RANGE = range(-2 ** 63, 2 ** 63)
+
+
+def _cursor_value(value):
+    # DjangoJSONEncoder отбрасывает микросекунды, а для ключа они важны.
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+class LimitedCountPaginator(Paginator):
+    """Паджинатор, который считает не дальше PAGINATOR_COUNT_LIMIT строк.
+
+    За этим порогом число оценочное: COUNT(*) по всей большой таблице
+    не выполняется. num_pages тогда - нижняя граница: страницы дальше
+    нее допустимы, пока на них есть записи.
+    """
+
+    count_is_estimate = False
+
+    def count_rows(self):
+        limit = settings.PAGINATOR_COUNT_LIMIT
+        return self.object_list.order_by()[:limit + 1].count()
+
+    @cached_property
+    def count(self):
+        if getattr(self.object_list, 'query', None) is None:
+            return super().count
+        count = self.count_rows()
+        if count > settings.PAGINATOR_COUNT_LIMIT:
+            self.count_is_estimate = True
+            count = settings.PAGINATOR_COUNT_LIMIT
+        return count
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if self.count_is_estimate and int(number) > self.num_pages:
+                return int(number)
+            raise
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_is_estimate:
+            return super().page(number)
+        top = number * self.per_page
+        # Срез остается QuerySet: его ждут формы list_editable админки.
+        object_list = self.object_list[top - self.per_page:top]
+        if not object_list and number > 1:
+            raise EmptyPage('That page contains no results')
+        if (number >= self.num_pages and len(object_list) == self.per_page
+                and self.object_list[top:top + 1].exists()):
+            self.num_pages = number + 1
+        return self._get_page(object_list, number, self)
+
+
+class CachedCountPaginator(LimitedCountPaginator):
+    """Паджинатор для больших лент без COUNT(*) на каждый запрос.
+
+    Число записей кэшируется до следующего изменения лент (поколение
+    'feeds' сбрасывают сигналы).
+    """
+
+    def count_rows(self):
+        version, = get_versions('feeds')
+        digest = hashlib.md5(str(self.object_list.query).encode()).hexdigest()
+        key = f'paginator:count:{version}:{digest}'
+        count = cache.get(key)
+        if count is None:
+            count = super().count_rows()
+            cache.set(key, count, settings.PAGINATOR_COUNT_TIMEOUT)
+        return count
 
+    def page_window(self, number):
+        """Номера страниц вокруг текущей вместо полного page_range."""
+        radius = settings.PAGINATOR_WINDOW
+        first = max(1, number - radius)
+        last = min(self.num_pages, number + radius)
+        return range(first, last + 1)
 
-def paginator(request, post_list, post_num=settings.POSTS_NUM):
+
+class CursorPaginator(CachedCountPaginator):
+    """Паджинатор по ключу сортировки (keyset).
+
+    Страница выбирается условием «после записи X» вместо OFFSET,
+    поэтому глубокие страницы стоят столько же, сколько первая.
+    Нумерованные страницы (get_page) по-прежнему доступны.
+    """
+
+    ordering = ('-pub_date', '-id')
+
+    def __init__(self, object_list, per_page, ordering=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if ordering is not None:
+            self.ordering = ordering
+        self.fields = tuple(name.lstrip('-') for name in self.ordering)
+
+    def encode_cursor(self, direction, obj=None):
+        values = None
+        if obj is not None:
+            values = [getattr(obj, field) for field in self.fields]
+        data = json.dumps([direction, values], default=_cursor_value)
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Возвращает (направление, значения ключа) или бросает ValueError."""
+        try:
+            padding = '=' * (-len(cursor) % 4)
+            data = base64.urlsafe_b64decode(cursor + padding)
+            direction, values = json.loads(data.decode())
+            if direction not in (NEXT, PREVIOUS):
+                raise ValueError(direction)
+            if values is None:
+                return direction, None
+            if len(values) != len(self.fields):
+                raise ValueError(values)
+            converted = [self.cursor_value(field, value)
+                         for field, value in zip(self.fields, values)]
+            for raw, value in zip(values, converted):
+                # Целое поле - только из целого JSON: 1.5 или NaN поле
+                # молча округлило бы или не смогло бы преобразовать.
+                if isinstance(value, int) and (
+                        type(raw) is not int or value not in INTEGER_RANGE):
+                    raise ValueError(raw)
+            return direction, converted
+        except (binascii.Error, TypeError, UnicodeDecodeError,
+                OverflowError, ValidationError) as error:
+            raise ValueError(cursor) from error
+
+    def cursor_value(self, field, value):
+        """Значение поля ключа из курсора в тип поля модели."""
+        return self.object_list.model._meta.get_field(field).to_python(value)
+
+    def keyset_filter(self, values, reverse=False, ordering=None):
+        """Условие «строго после values» в порядке ordering."""
+        lookups = []
+        for name in ordering or self.ordering:
+            descending = name.startswith('-') != reverse
+            lookups.append((name.lstrip('-'), 'lt' if descending else 'gt'))
+        condition = Q()
+        for i, (field, lookup) in enumerate(lookups):
+            equal = {prev: value for (prev, _), value
+                     in zip(lookups[:i], values)}
+            condition |= Q(**equal, **{f'{field}__{lookup}': values[i]})
+        # Нестрогая граница по первому полю позволяет СУБД искать
+        # по диапазону индекса, а не фильтровать его целиком.
+        field, lookup = lookups[0]
+        return Q(**{f'{field}__{lookup}e': values[0]}) & condition
+
+    def fetch_queryset(self, queryset, values, reverse, limit, ordering=None):
+        """Возвращает до limit строк queryset после values в порядке ordering.
+
+        values=None означает «с начала» (или с конца при reverse).
+        """
+        ordering = ordering or self.ordering
+        if values is not None:
+            queryset = queryset.filter(
+                self.keyset_filter(values, reverse, ordering))
+        if reverse:
+            ordering = [name[1:] if name.startswith('-') else f'-{name}'
+                        for name in ordering]
+        return list(queryset.order_by(*ordering)[:limit])
+
+    def fetch(self, values, reverse, limit):
+        """Возвращает до limit объектов после values (None - с края)."""
+        return self.fetch_queryset(self.object_list, values, reverse, limit)
+
+    def get_cursor_page(self, cursor=None):
+        """Страница по курсору; неверный курсор означает первую страницу."""
+        direction, values = NEXT, None
+        if cursor:
+            try:
+                direction, values = self.decode_cursor(cursor)
+            except ValueError:
+                cursor = ''
+        reverse = direction == PREVIOUS
+        items = self.fetch(values, reverse, self.per_page + 1)
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if reverse:
+            items.reverse()
+            has_previous, has_next = has_more, values is not None
+        else:
+            has_previous, has_next = values is not None, has_more
+        page = self._get_page(items, 1 if not has_previous else None, self)
+        page.is_cursor = True
+        page.cursor = cursor or ''
+        page.next_cursor = (self.encode_cursor(NEXT, items[-1])
+                            if has_next and items else None)
+        page.previous_cursor = (self.encode_cursor(PREVIOUS, items[0])
+                                if has_previous and items else None)
+        page.last_cursor = (self.encode_cursor(PREVIOUS)
+                            if page.next_cursor else None)
+        return page
+
+
+def paginator(request, post_list, post_num=settings.POSTS_NUM,
+              paginator_class=CursorPaginator):
     # нужно очищать кэш при смене страницы - ??!!
-    my_paginator = Paginator(post_list, post_num)
+    my_paginator = paginator_class(post_list, post_num)
     page_number = request.GET.get('page')
-    page_obj = my_paginator.get_page(page_number)
-    return page_obj
+    if page_number is not None:
+        # Старые ссылки вида ?page=N продолжают работать через OFFSET.
+        return my_paginator.get_page(page_number)
+    return my_paginator.get_cursor_page(request.GET.get('cursor'))
+
+
+def comments_page(request, comments, comment_num=None):
+    """Страница комментариев от новых к старым по курсору ?cursor=."""
+    return CursorPaginator(
+        comments.select_related('author'),
+        comment_num or settings.COMMENTS_NUM,
+        ordering=('-created', '-id'),
+    ).get_cursor_page(request.GET.get('cursor'))
@@ -1,15 +1,28 @@
+from functools import partial
+
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.conf import settings
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 
-from .models import Follow, Group, Post, User
+from .cache import feed_cache
+from .middleware import page_depends_on
+from .models import Comment, Follow, Group, Post, User
 from .forms import CommentForm, PostForm
-from .utils import paginator
+from .search import SearchPaginator
+from .timeline import posts_for, TimelinePaginator
+from .utils import comments_page, paginator
 
 
 def index(request):
     posts = Post.objects.select_related('group', 'author').all()
     page_obj = paginator(request, posts)
-    return render(request, 'posts/index.html', {'page_obj': page_obj})
+    context = {
+        'page_obj': page_obj,
+        'feed_cache': feed_cache('index'),
+    }
+    return render(request, 'posts/index.html', context)
 
 
 def group_posts(request, slug):
@@ -19,12 +32,14 @@ def group_posts(request, slug):
     context = {
         'group': group,
         'page_obj': page_obj,
+        'feed_cache': feed_cache(f'group:{slug}'),
     }
     return render(request, 'posts/group_list.html', context)
 
 
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(User.objects.select_related('stats'),
+                               username=username)
     posts = author.posts.select_related('group').all()
     page_obj = paginator(request, posts)
     following = (request.user.is_authenticated and request.user != author
@@ -33,23 +48,52 @@ def profile(request, username):
         'author': author,
         'page_obj': page_obj,
         'following': following,
+        'feed_cache': feed_cache(f'author:{username}'),
     }
     return render(request, 'posts/profile.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        page_obj = SearchPaginator(query, settings.POSTS_NUM).get_cursor_page(
+            request.GET.get('cursor'))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 def post_detail(request, post_id):
-    post = get_object_or_404(Post.objects.select_related(
-        'author').prefetch_related('comments__author'), id=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id)
+    # Число постов автора меняется и без правки самого поста.
+    page_depends_on(request, f'author:{post.author.username}')
     form = CommentForm()
     context = {
         'post': post,
         'form': form,
-        'comments': post.comments.all(),
+        'comments': comments_page(request, post.comments.all()),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    # Фрагмент со следующей страницей комментариев для подгрузки.
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    comments = comments_page(request, Comment.objects.filter(post_id=post_id))
+    context = {
+        'post_id': post_id,
+        'comments': comments,
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if request.method == 'GET' or not form.is_valid():
@@ -61,6 +105,7 @@ def post_create(request):
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     if post.author != request.user:
@@ -77,6 +122,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     # Получите пост и сохраните его в переменную post.
     post = get_object_or_404(Post, pk=post_id)
@@ -93,13 +139,23 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(
-        author__following__user=request.user).select_related('group', 'author')
-    page_obj = paginator(request, posts)
-    return render(request, 'posts/follow.html', {'page_obj': page_obj})
+    page_obj = paginator(
+        request, posts_for(request.user),
+        paginator_class=partial(TimelinePaginator, user=request.user))
+    # Посты авторов в режиме pull не рассылаются по лентам, поэтому
+    # ключ зависит и от их поколений.
+    pull_scopes = (f'pull:{author_id}'
+                   for author_id in page_obj.paginator.pull_author_ids)
+    context = {
+        'page_obj': page_obj,
+        'feed_cache': feed_cache(f'follower:{request.user.id}',
+                                 *pull_scopes),
+    }
+    return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     # Подписаться на автора username
     author = get_object_or_404(User, username=username)
@@ -109,6 +165,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     # Дизлайк, отписка
     get_object_or_404(Follow, user=request.user,
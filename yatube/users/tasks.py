@@ -0,0 +1,12 @@
+from django.core.mail import EmailMultiAlternatives
+
+from core.tasks import task
+
+
+@task(max_attempts=5)
+def send_email(subject, body, from_email, to, html=None):
+    """Фоновая отправка письма: медленный бэкенд не задерживает ответ."""
+    message = EmailMultiAlternatives(subject, body, from_email, to)
+    if html is not None:
+        message.attach_alternative(html, 'text/html')
+    message.send()
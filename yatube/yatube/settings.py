@@ -1,4 +1,6 @@
+import hashlib
 import os
+import tempfile
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -29,16 +31,24 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'posts.middleware.AnonymousPageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.SamplingProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+if DEBUG:
+    # Бюджеты запросов (QUERY_BUDGETS) копят тексты всех SQL-запросов,
+    # поэтому в бою не нужны; тесты включают их сами (core.testing).
+    MIDDLEWARE.insert(0, 'core.middleware.QueryBudgetMiddleware')
+
 ROOT_URLCONF = 'yatube.urls'
 
 # Путь к директории с шаблонами
@@ -107,9 +117,49 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Очередь задач core.Task: процессы manage.py worker, размер выборки,
+# опрос, повторы с удвоением задержки и срок блокировки упавшего процесса
+TASK_WORKERS: int = 2
+TASK_BATCH_SIZE: int = 20
+TASK_POLL_INTERVAL: int = 1
+TASK_MAX_ATTEMPTS: int = 3
+TASK_RETRY_DELAY: int = 10
+TASK_LOCK_TIMEOUT: int = 60 * 10
+
 # MAI constants
 POSTS_NUM: int = 10
+COMMENTS_NUM: int = 20
 POST_FIRST_CHARS: int = 15
+# Сколько записей считать точно, кэш числа записей и ширина окна страниц
+PAGINATOR_COUNT_LIMIT: int = 10000
+PAGINATOR_COUNT_TIMEOUT: int = 60 * 60
+PAGINATOR_WINDOW: int = 3
+# Порог подписчиков, после которого посты автора не рассылаются по лентам
+TIMELINE_FANOUT_LIMIT: int = 1000
+TIMELINE_BATCH_SIZE: int = 1000
+# Фрагменты лент сбрасываются поколениями, поэтому хранятся долго
+FEED_CACHE_TIMEOUT: int = 60 * 60 * 24
+PAGE_CACHE_TIMEOUT: int = 60 * 10
+# HTML карточки поста; ключ меняется с ревизией поста
+POST_CACHE_TIMEOUT: int = 60 * 60 * 24
+# Размеры миниатюр картинок постов; создаются фоновой задачей
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+    'card_480': ('480x170', {'crop': 'center'}),
+    'card_1440': ('1440x509', {'crop': 'center'}),
+}
+# Ширины для srcset карточки поста
+POST_IMAGE_SRCSET = ('card_480', 'card', 'card_1440')
+# Загруженные картинки: предел пикселей по заголовку, наибольшая сторона
+# после уменьшения и форматы перекодирования в порядке предпочтения
+POST_IMAGE_MAX_PIXELS: int = 40_000_000
+POST_IMAGE_MAX_SIZE: int = 2048
+POST_IMAGE_FORMATS = ('WEBP', 'JPEG')
+POST_IMAGE_QUALITY: int = 85
+# Записи о миниатюрах читаются через LRU процесса (см. posts.kvstore)
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+THUMBNAIL_LRU_SIZE: int = 10000
+THUMBNAIL_LRU_TIMEOUT: int = 60
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -117,10 +167,105 @@ LOGIN_REDIRECT_URL = 'posts:index'
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
-CACHES = {
-    'default': {
+# Наибольшее число SQL-запросов представления, включая сессию и
+# пользователя (см. core.middleware.QueryBudgetMiddleware). В тестах
+# превышение - ошибка, при разработке - запись в лог.
+QUERY_BUDGETS = {
+    'posts:index': 4,
+    'posts:group_list': 5,
+    'posts:profile': 6,
+    'posts:post_detail': 6,
+    'posts:post_comments': 3,
+    'posts:follow_index': 6,
+    'posts:search': 5,
+    # Запись дороже: счетчики, раскладка по лентам, ссылки на картинки
+    # и очередь задач.
+    'posts:post_create': 23,
+    'posts:post_edit': 21,
+    'posts:add_comment': 10,
+    'posts:profile_follow': 19,
+    'posts:profile_unfollow': 15,
+}
+QUERY_BUDGET_RAISE = False
+
+# Заголовок Server-Timing и строка в логе core.timing на каждый запрос
+# (см. core.middleware.ServerTimingMiddleware). Дешево, можно держать
+# включенным в бою.
+SERVER_TIMING = True
+
+# Сэмплирующий профилировщик (core.middleware.SamplingProfilerMiddleware):
+# доля профилируемых запросов и запросы персонала. По умолчанию выключен.
+PROFILE_SAMPLE_RATE = 0
+PROFILE_STAFF = False
+# Интервал снятия стеков и сброса их на диск, секунды.
+PROFILE_INTERVAL = 0.005
+PROFILE_FLUSH_INTERVAL = 30
+# Сколько разных стеков представления хранить в памяти процесса: сверх
+# этого вытесняются давно не встречавшиеся.
+PROFILE_MAX_STACKS = 2000
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+
+# Сообщения core (бюджеты запросов, очередь задач) - в консоль: корневой
+# логгер занят панелью отладки и сам ничего не печатает.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+        # Строка с замерами пишется на уровне INFO: в бою уровень
+        # понижают до INFO и отправляют записи в сбор логов.
+        'core.timing': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+TEST_RUNNER = 'core.testing.QueryBudgetTestRunner'
+
+# Кэш в памяти, общий для всех процессов хоста (core.cache), а перед
+# ним - LRU процесса для горячих ключей: фрагментов ленты, групп и
+# поколений областей. Поколения (posts.cache.VERSION_KEY) при смене
+# выбрасываются из LRU всех процессов. Файл общего кэша - на tmpfs,
+# если она есть, и свой у каждой базы: сайты с разными базами на одном
+# хосте не отдают друг другу страницы. Тесты подменяют его кэшем
+# процесса (core.testing.local_caches); YATUBE_SHARED_CACHE=0 делает
+# это для любой команды.
+CACHE_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+SHARED_CACHE = {
+    'BACKEND': 'core.cache.SharedMemoryCache',
+    'LOCATION': os.path.join(CACHE_DIR, 'yatube-cache-' + hashlib.sha1(
+        DATABASES['default']['NAME'].encode()).hexdigest()[:12]),
+    'OPTIONS': {
+        'MAX_BYTES': 64 * 2 ** 20,
+        'MAX_ENTRIES': 100_000,
+    },
+}
+if os.environ.get('YATUBE_SHARED_CACHE') == '0':
+    SHARED_CACHE = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.TwoTierCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'MAX_ENTRIES': 2000,
+            'L1_MAX_BYTES': 16 * 2 ** 20,
+            'L1_TIMEOUT': 1,
+            'SYNC_INTERVAL': 0.1,
+            'VOLATILE_PREFIXES': ['version:'],
+        },
+    },
+    'shared': SHARED_CACHE,
 }
 
 # Добавьте IP адреса, при обращении с которых будет доступен DjDT
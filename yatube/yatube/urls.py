@@ -8,6 +8,7 @@ urlpatterns = [
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('profiles/', include('core.urls', namespace='core')),
     path('', include('posts.urls', namespace='posts')),
 ]
 